@@ -1,13 +1,35 @@
 # app.py
-import os, io, csv, json, uuid, time, base64, threading, datetime as dt, re, sys, subprocess
-from typing import List, Dict, Any, Optional
+import os, io, csv, json, uuid, time, base64, threading, datetime as dt, re, sys, subprocess, hashlib, queue, codecs
+from typing import List, Dict, Any, Iterator, Optional
 from flask import (
     Flask, request, redirect, url_for, flash, render_template_string, abort,
     Response, stream_with_context, send_file
 )
-import requests
 from PIL import Image
 
+from image_cache import cached_png_b64
+from forge_client import get_client
+from job_store import JobStore
+from output_manifest import OutputManifest, file_sha1, manifest_path, provenance_hash
+import face_preflight
+from face_preflight import default_index as face_preflight_index
+from face_normalize import normalized_face_b64, target_res
+import cn_detect
+from pose_library import default_library as pose_library
+import progress_hub
+from job_logger import JobLogger
+import preview_service
+from book_store import BookStore
+from forge_meta import meta_cache, EDITOR_PATHS
+from result_cache import default_cache as result_cache, payload_key
+from prompt_templates import _make_key_variants, build_var_index, compile_template
+import buffered_writer
+from buffered_writer import BufferedSaveMixin
+from forge_pool import (
+    BackendPool, CheckpointTracker, Stage, backends_from_env, checkpoint_key, checkpoint_window,
+    order_by_checkpoint
+)
+
 APP_TITLE = "Kitap Yönetimi"
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 BOOKS_DIR = os.path.join(DATA_DIR, "books")
@@ -21,6 +43,8 @@ DEFAULT_OUT_DIR = r"C:\out"
 os.makedirs(DEFAULT_OUT_DIR, exist_ok=True)
 
 SD_BASE = os.environ.get("SD_BASE", "http://127.0.0.1:7861")
+# Birden fazla Forge kutusu: SD_BACKENDS="http://gpu1:7861,http://gpu2:7861" (boşsa yalnız SD_BASE)
+SD_BACKENDS = backends_from_env(SD_BASE)
 
 # UI runner betiğinin yolu (gerekirse değiştir)
 RUNNER_PATH = os.path.join(os.path.dirname(__file__), "runner_ui_prompts.py")
@@ -63,17 +87,16 @@ app.jinja_loader = ChoiceLoader([DictLoader({"base.html": BASE_HTML}), app.jinja
 def now_iso(): return dt.datetime.now().isoformat(timespec="seconds")
 def book_file(book_id: str): return os.path.join(BOOKS_DIR, f"{book_id}.json")
 def write_book(book: dict):
-    with open(book_file(book["id"]), "w", encoding="utf-8") as f:
-        json.dump(book, f, ensure_ascii=False, indent=2)
+    # kitap başına kilit + geçici dosya/os.replace; önbellek de güncellenir
+    BOOK_STORE.save(book)
 
-def ensure_settings_defaults(book: dict, save=False):
+def ensure_settings_defaults(book: dict):
+    """Eksik ayarları bellekte doldurur (diske yazmaz; kalıcı yükseltme BOOK_STORE.migrate)."""
     if not book: return book
     s = book.setdefault("settings", {})
-    changed = False
     def setdef(k, v):
-        nonlocal changed
         if k not in s:
-            s[k] = v; changed = True
+            s[k] = v
     setdef("data_source", "excel")
     setdef("output_root", DEFAULT_OUT_DIR)
     setdef("excel_path", "")
@@ -84,35 +107,21 @@ def ensure_settings_defaults(book: dict, save=False):
     setdef("faces_dir", DEFAULT_FACES_DIR)
     setdef("poses_dir", DEFAULT_POSES_DIR)  # kitap seviyesinde Yedek/fallback
     setdef("col_out", "out")
-    if save and changed and book.get("id"):
-        write_book(book)
     return book
 
+# Kitap deposu: (mtime, boyut) ile geçersizlenen bellek önbelleği; okuma hiçbir zaman yazmaz
+BOOK_STORE = BookStore(BOOKS_DIR, normalize=ensure_settings_defaults)
+
 def read_book(book_id: str):
-    p = book_file(book_id)
-    if not os.path.exists(p): return None
-    with open(p, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return ensure_settings_defaults(data, save=True)
+    return BOOK_STORE.get(book_id)
 
 def list_books():
-    out = []
-    for n in os.listdir(BOOKS_DIR):
-        if n.endswith(".json"):
-            try:
-                with open(os.path.join(BOOKS_DIR, n), "r", encoding="utf-8") as f:
-                    out.append(ensure_settings_defaults(json.load(f), save=True))
-            except: pass
-    out.sort(key=lambda b: b.get("updated_at", b.get("created_at", "")), reverse=True)
-    return out
+    # liste sayfası için özetler (ad, page_count, kaynak, çıkış, tarih)
+    return BOOK_STORE.list_summaries()
 
 def api_get(url_path: str) -> Any:
-    try:
-        r = requests.get(SD_BASE + url_path, timeout=10)
-        r.raise_for_status()
-        return r.json()
-    except Exception:
-        return None
+    # meta listeler TTL'li önbellekten (forge_meta); Forge kapalıysa None
+    return meta_cache(SD_BASE).get(url_path)
 
 def api_models() -> List[str]:
     js = api_get("/sdapi/v1/sd-models") or []
@@ -135,6 +144,19 @@ def api_cn_module_list() -> List[str]:
     js = api_get("/controlnet/module_list") or {}
     return js.get("module_list", []) if isinstance(js, dict) else []
 
+def editor_metadata() -> Dict[str, List[str]]:
+    """Sayfa listesi/editörü için beş meta listeyi tek seferde (eksikler paralel çekilir) şablon argümanı olarak döner."""
+    meta_cache(SD_BASE).get_many(EDITOR_PATHS)
+    return dict(models=api_models(), samplers=api_samplers(),
+                cn_models=api_cn_model_list(), cn_modules=api_cn_module_list(),
+                styles_list=api_styles())
+
+def api_active_checkpoint(base: Optional[str] = None) -> Optional[str]:
+    return (get_client(base or SD_BASE).get_json("/sdapi/v1/options", timeout=10) or {}).get("sd_model_checkpoint")
+
+def api_set_checkpoint(base: Optional[str], checkpoint: str) -> None:
+    get_client(base or SD_BASE).post_json("/sdapi/v1/options", {"sd_model_checkpoint": checkpoint})
+
 def _ensure_data_uri(b64_plain_or_data_uri: str) -> str:
     s = (b64_plain_or_data_uri or "").strip()
     if s.startswith("data:image"):
@@ -146,43 +168,6 @@ def _pil_to_data_uri(img: Image.Image) -> str:
     img.save(buf, format="PNG")
     return "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode("utf-8")
 
-def reactor_available() -> bool:
-    try:
-        r = requests.get(SD_BASE + "/reactor/models", timeout=5)
-        return r.ok
-    except Exception:
-        return False
-
-def reactor_swap(face_b64_plain: str, target_pil: Image.Image, opts: Dict[str, Any]) -> Image.Image:
-    body = {
-        "source_image": _ensure_data_uri(face_b64_plain),
-        "target_image": _pil_to_data_uri(target_pil),
-        # Indeksler tek öğeli liste istiyor
-        "source_faces_index": [int(opts.get("source_face_index", 0))],
-        "face_index": [int(opts.get("face_index", 0))],
-        # Varsayılanlar (UI’ye en yakın sade ayarlar)
-        "upscaler": opts.get("upscaler", "None"),
-        "scale": int(opts.get("scale", 1)),
-        "upscale_visibility": float(opts.get("upscale_visibility", 1)),
-        "face_restorer": opts.get("face_restorer", "None"),
-        "restorer_visibility": float(opts.get("restorer_visibility", 1)),
-        "restore_first": int(opts.get("restore_first", 0)),
-        "model": opts.get("model", "inswapper_128.onnx"),
-        "gender_source": int(opts.get("gender_source", 0)),
-        "gender_target": int(opts.get("gender_target", 0)),
-        "save_to_file": 0,
-        "result_file_path": ""
-    }
-    r = requests.post(SD_BASE + "/reactor/image", json=body, timeout=120)
-    r.raise_for_status()
-    js = r.json() or {}
-    img_b64 = js.get("image") or ""
-    # Bazı sürümler data-uri değil, düz b64 döndürür
-    if img_b64.startswith("data:image"):
-        img_b64 = img_b64.split(",", 1)[-1]
-    return Image.open(io.BytesIO(base64.b64decode(img_b64))).copy()
-
-
 
 BOOK_LIST_HTML = r"""
 {% extends "base.html" %}{% block content %}
@@ -192,7 +177,7 @@ BOOK_LIST_HTML = r"""
       <tbody>{% for b in books %}
         <tr>
           <td><a href="{{ url_for('ui_book_pages', book_id=b.id) }}">{{ b.name }}</a></td>
-          <td>{{ (b.pages or [])|length }}</td>
+          <td>{{ b.page_count }}</td>
           <td class="muted">{{ b.settings.data_source }}{% if b.settings.data_source=='excel' %} · {{ b.settings.excel_path }}{% else %} · {{ b.settings.faces_dir }}{% endif %}</td>
           <td class="muted">{{ b.settings.output_root }}</td>
           <td class="muted">{{ b.updated_at or b.created_at }}</td>
@@ -258,9 +243,10 @@ PAGES_HTML = r"""
     <p class="muted">Kitap ayarlarında <span class="hl">veri kaynağı ve klasörler</span> var. Tüm SD ayarları sayfa bazında.</p>
 
     <div class="btnrow" style="margin-top:6px">
-      <form method="post" action="{{ url_for('ui_run_book', book_id=b.id) }}"><button class="btn ok" type="submit">▶️ API'den Çalıştır</button></form>
+      <a class="btn ok" href="{{ url_for('ui_book_preflight', book_id=b.id) }}">▶️ API'den Çalıştır (ön kontrol)</a>
       <form method="post" action="{{ url_for('ui_run_book_ui', book_id=b.id) }}"><button class="btn" type="submit">🖥️ Forge Arayüzünden Çalıştır</button></form>
       {% if last_job_id %}<a class="btn" href="{{ url_for('ui_job_status', job_id=last_job_id) }}">📝 Son İş: {{ last_job_id[:8] }} <span class="status">{{ last_job_status }}</span></a>{% endif %}
+      <form method="post" action="{{ url_for('ui_forge_meta_refresh') }}"><button class="btn" type="submit" title="Model/sampler/stil/ControlNet listelerini Forge'dan yeniden çek">🔄 Forge listelerini yenile</button></form>
     </div>
 
     <h3>Sayfa Ekle</h3>
@@ -426,6 +412,91 @@ PAGES_HTML = r"""
 """
 
 
+PREFLIGHT_HTML = r"""
+{% extends "base.html" %}{% block content %}
+  <div class="panel">
+    <div class="row">
+      <div class="col"><h2 style="margin:0">{{ b.name }} · Yüz ön kontrolü</h2></div>
+      <div class="col" style="text-align:right">
+        {% if pf.status != 'running' %}<a class="btn" href="{{ url_for('ui_book_preflight', book_id=b.id, refresh=1) }}">🔄 Yeniden kontrol et</a>{% endif %}
+        <a class="btn" href="{{ url_for('ui_book_pages', book_id=b.id) }}">↩︎ Geri</a>
+      </div>
+    </div>
+    {% if pf.status == 'running' %}
+    <p>Ön kontrol arka planda sürüyor: <b id="pf-phase">{{ pf.phase }}</b>
+       <span class="muted">(<span id="pf-elapsed">0</span> sn{% if pf.n_children %} · {{ pf.n_children }} çocuk{% endif %})</span></p>
+    <p class="muted">Sayfa bitince kendiliğinden yenilenir; kapatılsa da kontrol sürer.</p>
+    <script>
+      (function(){
+        const url = "{{ url_for('ui_book_preflight_status', book_id=b.id) }}";
+        const tick = () => fetch(url).then(r => r.json()).then(d => {
+          if (d.status !== 'running') { location.replace("{{ url_for('ui_book_preflight', book_id=b.id) }}"); return; }
+          document.getElementById('pf-phase').textContent = d.phase;
+          document.getElementById('pf-elapsed').textContent = d.elapsed;
+          setTimeout(tick, 1000);
+        }).catch(() => setTimeout(tick, 3000));
+        tick();
+      })();
+    </script>
+    {% elif pf.status == 'failed' %}
+    <p style="color:var(--err)">Ön kontrol başarısız: {{ pf.error }}</p>
+    {% else %}
+    <p>Çocuk: <b>{{ pf.n_children }}</b> · Yüz dosyası: <b>{{ sm.total }}</b> ·
+       <span style="color:var(--ok)">sağlam {{ sm.ok }}</span> ·
+       <span style="color:var(--err)">eksik {{ sm.missing }}</span> ·
+       <span style="color:var(--err)">bozuk {{ sm.corrupt }}</span> ·
+       <span style="color:var(--warn)">büyük {{ sm.large }}</span> ·
+       EXIF döndürülmüş {{ sm.rotated }}</p>
+    <p class="muted">{{ sm.cached }} dosya önbellekten ({{ sm.elapsed }} sn). Eksik/bozuk yüzlerin çocukları işte atlanır.
+       Kontrol {{ pf.age }} sn önce yapıldı.</p>
+    <div class="btnrow">
+      <form method="post" action="{{ url_for('ui_run_book', book_id=b.id) }}">
+        <button class="btn ok" type="submit">▶️ API'den Çalıştır</button>
+        <label class="muted" style="display:inline"><input type="checkbox" name="debug_cn"> CN girdilerini kaydet (debug)</label>
+      </form>
+    </div>
+    <h3>Üretim planı (dry-run)</h3>
+    <p>Üretilecek: <b>{{ plan.counts.regenerate }}</b> ·
+       <span style="color:var(--warn)">girdisi değişen {{ plan.counts.changed }}</span> ·
+       eksik {{ plan.counts.missing }} ·
+       <span style="color:var(--ok)">güncel {{ plan.counts.current }}</span>
+       {% if plan.counts.unstamped %}· özetsiz {{ plan.counts.unstamped }}{% endif %}
+       {% if plan.counts.unscanned %}· taranmamış {{ plan.counts.unscanned }}{% endif %}</p>
+    {% if not plan.bootstrapped %}<p class="muted">Çıktı manifesti henüz kurulmadı: mevcut çıktılar taranmadı,
+       ilk çalıştırma çocuk klasörlerini tarayıp var olan sayfaları atlayacak.</p>{% endif %}
+    <p class="muted">Sayfa ayarı, işlenmiş prompt, satır değişkenleri, yüz dosyası ya da checkpoint değişen çıktılar yeniden üretilir.
+       Özetsiz (eski) çıktılar güncel sayılır ve ilk çalıştırmada damgalanır.</p>
+    {% if plan.rows %}
+    <table><thead><tr><th>Çocuk</th><th>Sayfa</th><th>Neden</th><th>Çıktı</th></tr></thead>
+      <tbody>{% for r in plan.rows %}
+        <tr>
+          <td>{{ r.child }}</td><td>{{ r.page }}</td>
+          <td>{% if r.status == 'changed' %}<span class="status" style="color:var(--warn)">girdiler değişti</span>{% else %}<span class="status">çıktı yok</span>{% endif %}</td>
+          <td class="muted">{{ r.path }}</td>
+        </tr>{% endfor %}
+      </tbody>
+    </table>
+    {% if plan.rows|length < plan.counts.regenerate %}<p class="muted">İlk {{ plan.rows|length }} / {{ plan.counts.regenerate }} gösteriliyor.</p>{% endif %}
+    {% endif %}
+    {% if problems %}
+    <h3>Sorunlu dosyalar{% if problems|length < sm.n_problems %} (ilk {{ problems|length }} / {{ sm.n_problems }}){% endif %}</h3>
+    <table><thead><tr><th>Dosya</th><th>Durum</th><th>Boyut</th><th>Çözünürlük</th></tr></thead>
+      <tbody>{% for r in problems %}
+        <tr>
+          <td class="muted">{{ r.path }}</td>
+          <td>{% if r.ok %}<span class="status" style="color:var(--warn)">büyük</span>{% else %}<span class="status" style="color:var(--err)">{{ r.error }}</span>{% endif %}</td>
+          <td class="muted">{{ (r.size / 1048576)|round(1) }} MB</td>
+          <td class="muted">{% if r.width %}{{ r.width }}×{{ r.height }}{% else %}-{% endif %}</td>
+        </tr>{% endfor %}
+      </tbody>
+    </table>
+    {% endif %}
+    {% endif %}
+  </div>
+{% endblock %}
+"""
+
+
 PAGE_EDIT_HTML = r"""
 {% extends "base.html" %}{% block content %}
   <form method="post"><div class="panel">
@@ -691,24 +762,29 @@ def ui_edit_book(book_id):
 
 @app.route("/books/<book_id>/delete", methods=["POST"])
 def ui_delete_book(book_id):
-    p = book_file(book_id)
-    if os.path.exists(p): os.remove(p); flash("Kitap silindi.")
+    if BOOK_STORE.delete(book_id): flash("Kitap silindi.")
     return redirect(url_for("ui_list_books"))
 
 @app.route("/books/<book_id>/pages")
 def ui_book_pages(book_id):
     b = read_book(book_id)
     if not b: abort(404)
-    last = JOB_INDEX.get(book_id)
-    status = JOBS.get(last, {}).get("status") if last else None
+    last_job = JOB_STORE.latest_for_book(book_id)
+    last = last_job["id"] if last_job else None
+    status = last_job["status"] if last_job else None
     return render_template_string(
         PAGES_HTML, b=b, title=f"{APP_TITLE} · {b['name']}",
         last_job_id=last, last_job_status=status or "-",
-        models=api_models(), samplers=api_samplers(),
-        cn_models=api_cn_model_list(), cn_modules=api_cn_module_list(),
-        styles_list=api_styles()
+        **editor_metadata()
     )
 
+@app.route("/forge/meta/refresh", methods=["POST"])
+def ui_forge_meta_refresh():
+    res = meta_cache(SD_BASE).refresh(EDITOR_PATHS)
+    bad = sum(1 for v in res.values() if v is None)
+    flash("Forge listeleri yenilendi." if not bad else f"Forge listeleri yenilenemedi ({bad}/{len(res)}); eski liste kullanılıyor.")
+    return redirect(request.referrer or url_for("ui_list_books"))
+
 @app.route("/books/<book_id>/pages/add", methods=["POST"])
 def ui_add_page(book_id):
     b = read_book(book_id)
@@ -796,9 +872,7 @@ def ui_edit_page(book_id, page_id):
         return redirect(url_for("ui_book_pages", book_id=book_id))
     return render_template_string(PAGE_EDIT_HTML,
                                   b=b, p=page, title=f"{APP_TITLE} · Sayfa #{page['index']}",
-                                  models=api_models(), samplers=api_samplers(),
-                                  cn_models=api_cn_model_list(), cn_modules=api_cn_module_list(),
-                                  styles_list=api_styles()
+                                  **editor_metadata()
                                   )
 
 @app.route("/books/<book_id>/pages/<page_id>/delete", methods=["POST"])
@@ -810,153 +884,68 @@ def ui_delete_page(book_id, page_id):
     return redirect(url_for("ui_list_books"))
 
 # ---------------- Prompt değişkenleri ----------------
-def _make_key_variants(key: str) -> List[str]:
-    """
-    Bir sütun adı için çoklu anahtar varyantları üretir:
-    - Orijinal / lower
-    - Boşluklar '_' ve tamamen silinmiş (snake / nospace)
-    - Türkçe katlama: ı->i, İ->I (hem orijinal hem lower formları)
-    - Aksan/diakritik temizlenmiş ASCII formlar (ör. 'Adı' -> 'Adi')
-    Bu varyantların hepsi için snake/nospace türevleri de eklenir.
-    """
-    k = (key or "").strip()
-    if not k:
-        return []
+# (prompt_templates.py: derlenmiş şablonlar + çocuk başına değişken indeksi)
 
-    def _forms(s: str) -> List[str]:
-        snake   = re.sub(r"\s+", "_", s)
-        nospace = re.sub(r"\s+", "", s)
-        return [s, s.lower(), snake, snake.lower(), nospace, nospace.lower()]
 
-    variants = set(_forms(k))
 
-    # Türkçe 'ı/İ' katlaması
-    tr = k.replace("ı", "i").replace("İ", "I")
-    variants.update(_forms(tr))
-    variants.update(_forms(tr.lower()))
-
-    # Aksan/diakritik temizleme (örn. 'Adı' -> 'Adi')
-    try:
-        import unicodedata
-        def _deaccent(s: str) -> str:
-            return "".join(c for c in unicodedata.normalize("NFKD", s) if not unicodedata.combining(c))
-        de = _deaccent(k)
-        variants.update(_forms(de))
-        # Türkçe katlanmış + deaccent
-        de_tr = _deaccent(tr)
-        variants.update(_forms(de_tr))
-    except Exception:
-        pass
-
-    return [v for v in variants if v]
-
-
-def _lower_tr(s: str) -> str:
-    """Türkçe küçük harf dönüşümü (ı -> i, İ -> i)."""
-    return (s or "").lower().replace("ı", "i").replace("İ", "i")
-
-def _gender_en(raw: str) -> str:
-    """Türkçe veya İngilizce cinsiyet değerini 'girl'/'boy' olarak normalize eder."""
-    v = _lower_tr(raw).strip()
-    if v in {"kiz", "kız", "k", "female", "f", "kadin", "kadın", "girl"}:
-        return "girl"
-    if v in {"erkek", "e", "male", "m", "boy", "adam"}:
-        return "boy"
-    return raw or ""
+# ---------------- SD API yardımcıları ----------------
+def read_image_to_b64(path: str) -> str:
+    # (yol, boyut, mtime) anahtarlı disk + bellek önbelleği; isabette PIL açılmaz
+    return cached_png_b64(path)
 
+def b64_to_image(b64_str: str) -> Image.Image:
+    return Image.open(io.BytesIO(base64.b64decode(b64_str))).copy()
 
-# Boşluk, Türkçe latin, @ ve _,- içerir (sütun adı boşluklu olabilir)
-VAR_TOKEN_RE = re.compile(r"\{([A-Za-z0-9_ @\-\u00C0-\u024F\u1E00-\u1EFF]+)\}")
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
 
-def render_text_template(text: str, child: Dict[str,Any]) -> str:
+class EncodedImage:
     """
-    {KolonAdi} yer tutucularını, child['vars'] içindeki değerlerle doldurur.
-    - Kolon adları case-insensitive.
-    - 'Cinsiyet' özel kuralı: kız -> girl, erkek -> boy (tüm varyant anahtarlara uygulanır).
-    - Sütun adını farklı şekillerde yazabil (örn. {student name}, {Student_Name}, {studentname}).
+    Forge'un döndürdüğü kodlanmış görüntü (base64 + ham baytlar).
+    - png_bytes(): Forge zaten PNG verdiyse baytlar olduğu gibi (yeniden sıkıştırma yok)
+    - b64       : REActor'a doğrudan gider
+    - image()   : piksel gereken yerde bir kez PIL'e çözülür
     """
-    if not text:
-        return text
-
-    raw_vars: Dict[str, str] = {}
-
-    # Baz yerleşikler
-    raw_vars.update({
-        "name": child.get("name",""),
-        "class": child.get("class",""),
-        "photo": child.get("face",""),
-        "@photo": (child.get("vars", {}) or {}).get("@photo",""),
-    })
-
-    # Tüm satır değişkenlerini, birden fazla anahtar varyantıyla ekle
-    row_vars = (child.get("vars") or {})
-    for k, v in row_vars.items():
-        val = "" if v is None else str(v)
-        for key_variant in _make_key_variants(k):
-            raw_vars[key_variant] = val
-
-    # Cinsiyet özel haritalama (girl/boy). Olası başlık isimlerinin hepsini yakala.
-    gender_keys = set()
-    for cand in ["Cinsiyet", "cinsiyet", "Gender", "gender", "GENDER"]:
-        gender_keys.update(_make_key_variants(cand))
-    # ilk bulunan değeri al
-    gender_raw = None
-    for gk in gender_keys:
-        if gk in raw_vars and raw_vars[gk]:
-            gender_raw = raw_vars[gk]
-            break
-    if gender_raw is not None:
-        mapped = _gender_en(gender_raw)  # kız->girl, erkek->boy, diğer -> raw
-        for gk in gender_keys:
-            raw_vars[gk] = mapped
-
-    # Şablon doldurma
-    def repl(m):
-        key = (m.group(1) or "").strip()
-        # Anahtar için varyantları üret ve sırayla dene
-        for kv in _make_key_variants(key):
-            if kv in raw_vars:
-                return raw_vars[kv]
-        # Birebir yazılan ad çakışırsa
-        if key in raw_vars:
-            return raw_vars[key]
-        if key.lower() in raw_vars:
-            return raw_vars[key.lower()]
-        # bulunamazsa olduğu gibi bırak
-        return m.group(0)
-
-    return VAR_TOKEN_RE.sub(repl, text)
-
-
-
-# ---------------- SD API yardımcıları ----------------
-def read_image_to_b64(path: str) -> str:
-    with Image.open(path) as im:
+    __slots__ = ("b64", "data", "_img")
+
+    def __init__(self, b64_plain_or_data_uri: str):
+        self.b64 = b64_plain_or_data_uri.split(",", 1)[-1] if b64_plain_or_data_uri.startswith("data:") \
+            else b64_plain_or_data_uri
+        self.data = base64.b64decode(self.b64)
+        self._img: Optional[Image.Image] = None
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "EncodedImage":
+        obj = cls.__new__(cls)
+        obj.b64, obj.data, obj._img = base64.b64encode(data).decode("ascii"), data, None
+        return obj
+
+    def image(self) -> Image.Image:
+        if self._img is None:
+            self._img = Image.open(io.BytesIO(self.data)).copy()
+        return self._img
+
+    def png_bytes(self) -> bytes:
+        # samples_format png değilse (jpg/webp) .png dosyasına doğru biçimde yazmak için tek seferlik dönüşüm
+        if self.data[:8] == PNG_SIGNATURE:
+            return self.data
         buf = io.BytesIO()
-        im.save(buf, format="PNG")
-        return base64.b64encode(buf.getvalue()).decode("utf-8")
-
-def b64_to_image(b64_str: str) -> Image.Image:
-    return Image.open(io.BytesIO(base64.b64decode(b64_str))).copy()
+        self.image().save(buf, format="PNG")
+        return buf.getvalue()
 
-def call_txt2img(payload: Dict[str, Any]) -> List[Image.Image]:
-    r = requests.post(SD_BASE + "/sdapi/v1/txt2img", json=payload, timeout=120)
-    r.raise_for_status()
-    data = r.json()
-    out = []
-    for b64 in data.get("images", []):
-        img_bytes = base64.b64decode(b64.split(",", 1)[-1])
-        out.append(Image.open(io.BytesIO(img_bytes)).copy())
-    return out
+def call_txt2img(payload: Dict[str, Any], base: Optional[str] = None) -> List[EncodedImage]:
+    data = get_client(base or SD_BASE).post_json("/sdapi/v1/txt2img", payload)
+    return [EncodedImage(b64) for b64 in data.get("images", [])]
 
 def build_controlnet_args(face_b64: str, pose_b64: Optional[str],
                           use_cnet: bool,
                           cn0_module: str, cn0_model: str, cn0_resize: int,
                           cn1_module: str, cn1_model: str, cn1_resize: int,
                           cn0_weight: float = 0.5, cn1_weight: float = 0.5,
-                          cn0_control_mode: int = 0, cn1_control_mode: int = 0) -> Dict[str, Any]:
+                          cn0_control_mode: int = 0, cn1_control_mode: int = 0,
+                          cn1_processor_res: int = 512) -> Dict[str, Any]:
     """
     control_mode: 0=Balanced, 1=My prompt is more important, 2=ControlNet is more important
+    cn1_processor_res: birim 1 ön-işlemci çözünürlüğü (/controlnet/detect haritası da bu değerle alınır)
     """
     if not use_cnet:
         return {"args": []}
@@ -972,12 +961,16 @@ def build_controlnet_args(face_b64: str, pose_b64: Optional[str],
     unit1 = {
         "enabled": True, "module": cn1_module, "model": cn1_model,
         "weight": float(cn1_weight), "control_mode": int(cn1_control_mode),
-        "image": u1_img, "resize_mode": int(cn1_resize),
+        "image": u1_img, "resize_mode": int(cn1_resize), "processor_res": int(cn1_processor_res),
         "guidance_start": 0.0, "guidance_end": 1.0,
         "pixel_perfect": False
     }
     return {"args": [unit0, unit1]}
 
+def cn1_processor_res(page: dict) -> int:
+    """Birim 1 ön-işlemci çözünürlüğü: runner_api ile ortak sayfa alanı 'cn1_processor'; yoksa Forge varsayılanı 512."""
+    return int(page.get("cn1_processor") or 512)
+
 
 # ---------- REActor yardımcıları (POST-PROCESS) ----------
 def pil_to_b64(img: Image.Image) -> str:
@@ -988,15 +981,16 @@ def pil_to_b64(img: Image.Image) -> str:
 def _to_data_url(b64_plain: str) -> str:
     return b64_plain if b64_plain.startswith("data:image") else "data:image/png;base64," + b64_plain
 
-def reactor_available() -> bool:
+def reactor_available(base: Optional[str] = None) -> bool:
     try:
-        r = requests.get(SD_BASE + "/reactor/models", timeout=5)
-        return r.ok
+        return get_client(base or SD_BASE).get("/reactor/models", timeout=5, retries=0).ok
     except Exception:
         return False
 
-def reactor_swap(face_b64_plain: str, target_img: Image.Image, opts: Optional[dict] = None) -> Image.Image:
-    t_b64_plain = pil_to_b64(target_img)
+def reactor_swap(face_b64_plain: str, target_img, opts: Optional[dict] = None,
+                 base: Optional[str] = None) -> EncodedImage:
+    # EncodedImage ise Forge'un base64'ü olduğu gibi gider; PIL ise (eski çağrılar) bir kez kodlanır
+    t_b64_plain = target_img.b64 if isinstance(target_img, EncodedImage) else pil_to_b64(target_img)
 
     # Varsayılanları UI’a yakın yap
     opts = opts or {}
@@ -1024,26 +1018,24 @@ def reactor_swap(face_b64_plain: str, target_img: Image.Image, opts: Optional[di
         "result_file_path": "",
     }
 
-    r = requests.post(SD_BASE + "/reactor/image", json=payload, timeout=180)
-    r.raise_for_status()
-    js = r.json()
+    js = get_client(base or SD_BASE).post_json("/reactor/image", payload)
     out = js.get("image")
     if not out:
         raise RuntimeError("REActor boş döndü")
-    if out.startswith("data:image"):
-        out = out.split(",", 1)[-1]
-    return b64_to_image(out)
+    return EncodedImage(out)
 
 
 # ---------- Excel/CSV out yazıcı ----------
-class ExcelOutWriter:
+class ExcelOutWriter(BufferedSaveMixin):
     """
     - 'out' sütununa ; ile birleştirilmiş yolları yazar (eski davranış).
     - Ek olarak @sayfaN kolonlarını başlıkta GİZLİ TIRNAK ile üretir:  "'@sayfa1"
     - Yeni: @sayfaN başlıklarını mevcut başlıktaki **ilk boş sütundan** itibaren açar.
+    - save() tamponludur (EXCEL_FLUSH_ROWS / EXCEL_FLUSH_SEC); iş sonunda flush() çağrılmalı.
     """
     def __init__(self, path: str, col_out: Optional[str] = None, pages_prefix: str = "@sayfa"):
         self.path = path
+        self._init_buffer()
         self.col_out = (col_out or "").strip()   # boş ise kapalı
         self.pages_prefix = (pages_prefix or "@sayfa").strip()
         self.ext = os.path.splitext(path)[1].lower()
@@ -1151,6 +1143,7 @@ class ExcelOutWriter:
                 self.ws.cell(row=1, column=col, value=f"'@{self.pages_prefix.split('@',1)[-1]}{n}")
                 self.page_col_indices[n] = col
                 col += 1
+                self._touch()
         else:
             # CSV tarafında başlıkta ilk boş index
             start_idx = self._first_empty_header_col_csv()
@@ -1165,6 +1158,8 @@ class ExcelOutWriter:
                     needed.append((n, f"'@{self.pages_prefix.split('@',1)[-1]}{n}"))
             # araya yerleştir
             self.header[start_idx:start_idx] = [h for _, h in needed]
+            if needed:
+                self._touch()
             # index haritasını kur
             for k, h in needed:
                 pos = start_idx
@@ -1177,42 +1172,40 @@ class ExcelOutWriter:
                     self.rows[i] += [""] * (len(self.header) - len(self.rows[i]))
 
     # ----- public API -----
-    def set_for_row(self, row_index_2based: int, value: str):
-        if not row_index_2based or row_index_2based < 2: return
+    # Hücre yazımı: değer değişmediyse (ör. atlanan çocuğun aynı yolları) tampon kirlenmez
+    def _set_cell(self, row_index_2based: int, col: int, value: str):
         if self.mode == "xlsx":
-            self.ws.cell(row=row_index_2based, column=self.out_col_idx, value=value)
+            cell = self.ws.cell(row=row_index_2based, column=col)
+            if (cell.value or "") != (value or ""):
+                cell.value = value; self._touch()
         else:
             i = row_index_2based - 2
             while i >= len(self.rows):
                 self.rows.append([])
             if len(self.rows[i]) < len(self.header):
                 self.rows[i] += [""] * (len(self.header) - len(self.rows[i]))
-            self.rows[i][self.out_col_idx] = value
+            if self.rows[i][col] != value:
+                self.rows[i][col] = value; self._touch()
+
+    def set_for_row(self, row_index_2based: int, value: str):
+        if not row_index_2based or row_index_2based < 2: return
+        with self._buf_lock:
+            self._set_cell(row_index_2based, self.out_col_idx, value)
 
     def set_pages_for_row(self, row_index_2based: int, page_paths: List[str]):
         if not row_index_2based or row_index_2based < 2: return
-        self._ensure_page_cols(len(page_paths))
-        if self.mode == "xlsx":
-            for n, p in enumerate(page_paths, start=1):
-                col = self.page_col_indices.get(n)
-                if col is not None:
-                    self.ws.cell(row=row_index_2based, column=col, value=p)
-        else:
-            i = row_index_2based - 2
-            while i >= len(self.rows):
-                self.rows.append([])
-            if len(self.rows[i]) < len(self.header):
-                self.rows[i] += [""] * (len(self.header) - len(self.rows[i]))
+        with self._buf_lock:
+            self._ensure_page_cols(len(page_paths))
             for n, p in enumerate(page_paths, start=1):
                 col = self.page_col_indices.get(n)
                 if col is not None:
-                    self.rows[i][col] = p
+                    self._set_cell(row_index_2based, col, p)
 
-    def save(self):
+    def _write_to(self, path: str):
         if self.mode == "xlsx":
-            self.wb.save(self.path)
+            self.wb.save(path)
         else:
-            with open(self.path, "w", newline="", encoding="utf-8-sig") as f:
+            with open(path, "w", newline="", encoding="utf-8-sig") as f:
                 w = csv.writer(f)
                 w.writerow(self.header)
                 for r in self.rows:
@@ -1221,16 +1214,46 @@ class ExcelOutWriter:
                     w.writerow(r)
 
 # ---- Kaynak okuyucular ----
-def collect_children(settings: dict, log) -> List[Dict[str, str]]:
+ROSTER_ENCODINGS = ("utf-8-sig", "utf-8", "cp1254", "latin-1")
+
+def detect_text_encoding(path: str, sample_size: int = 256 * 1024) -> str:
+    """Dosyanın başından alınan tek bir bayt örneğiyle kodlama seçer (dosya bir kez okunur)."""
+    with open(path, "rb") as f:
+        sample = f.read(sample_size)
+    for enc in ROSTER_ENCODINGS:
+        try:
+            # final=False: örnek sonunda yarım kalmış çok baytlı karakter hata sayılmaz
+            codecs.getincrementaldecoder(enc)("strict").decode(sample, final=False)
+            return enc
+        except UnicodeDecodeError:
+            continue
+    return "latin-1"
+
+def build_column_map(header: List[str]) -> Dict[str, int]:
     """
-    Kaynak çocuk listesini (yüz yolu, ad, sınıf, satır sırası, satır değişkenleri) döndürür.
+    Paylaşılan sütun haritası: başlığın tüm anahtar varyantları -> sütun indeksi.
+    Satır başına varyant kopyası yerine listede bir kez kurulur (aynı varyantta sonraki sütun kazanır).
+    """
+    cmap: Dict[str, int] = {}
+    for j, h in enumerate(header):
+        for kv in _make_key_variants(h or ""):
+            cmap[kv] = j
+    return cmap
+
+def iter_children(settings: dict, log, check_faces: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Kaynak çocukları (yüz yolu, ad, sınıf, satır sırası, satır değişkenleri) satır sırasıyla akıtır.
     - settings:
         data_source: "excel" | "folders"
         faces_dir  : kök klasör (göreli @photo ile birleşir)
         excel_path : xlsx/xlsm/csv
         col_photo, col_first, col_last, col_class
+    - XLSX read-only modda satır satır okunur; CSV kodlaması tek örnekle saptanır, dosya bir kez okunur.
+    - Okuma sürerken liste buffered_writer.reading() ile işaretlidir (Windows'ta ara Excel kayıtları bekler).
+    - child['vars'] yalnız ham sütunları taşır ({başlık: değer}); varyant eşleştirme
+      build_var_index / build_column_map tarafında yapılır.
+    - check_faces=False: satır başına os.path.exists yapılmaz (yüzler face_preflight ile toplu kontrol edilir).
     """
-    children: List[Dict[str, str]] = []
     source = (settings.get("data_source") or "excel").strip().lower()
     faces_root = (settings.get("faces_dir") or "").strip()
 
@@ -1250,17 +1273,13 @@ def collect_children(settings: dict, log) -> List[Dict[str, str]]:
             return _normpath(rel_or_abs)
         return _normpath(os.path.join(faces_root, rel_or_abs))
 
-    def _set_defaults_rowvars(row_vars: Dict[str, str], name: str, cls: str, rel_photo: str):
-        row_vars.setdefault("name", name)
-        row_vars.setdefault("class", cls)
-        row_vars.setdefault("@photo", rel_photo)
-
     # ---- Klasör modu ----
     if source == "folders":
         exts = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
         if not faces_root or not os.path.isdir(faces_root):
             log(f"[WARN] faces_dir klasörü bulunamadı: {faces_root}")
-            return []
+            return
+        children: List[Dict[str, Any]] = []
         row_i = 2  # Excel düzeni ile tutarlılık için 2’den başlatıyoruz
         for root, _, files in os.walk(faces_root):
             for n in files:
@@ -1279,7 +1298,8 @@ def collect_children(settings: dict, log) -> List[Dict[str, str]]:
                     row_i += 1
         # Klasör modunda zorunlu bir sıra yok; alfabetik isimle hafif deterministik hale getirelim
         children.sort(key=lambda x: (x.get("class",""), x.get("name","")))
-        return children
+        yield from children
+        return
 
     # ---- Excel/CSV modu ----
     excel_path = (settings.get("excel_path") or "").strip()
@@ -1290,190 +1310,255 @@ def collect_children(settings: dict, log) -> List[Dict[str, str]]:
 
     if not excel_path or not os.path.exists(excel_path):
         log(f"[WARN] Excel yolu bulunamadı: {excel_path}")
-        return []
+        return
 
     ext = os.path.splitext(excel_path)[1].lower()
 
-    try:
-        # ---- CSV ----
-        if ext == ".csv":
-            # Güvenli kodlama açılışı: utf-8-sig -> utf-8 -> cp1254 -> latin-1
-            enc_trials = ("utf-8-sig", "utf-8", "cp1254", "latin-1")
-            last_err = None
-            for enc in enc_trials:
+    def _rows():
+        """
+        (başlık, satır demetleri) — tek geçiş; okuyucu liste bitene (ya da üreteç kapanana) dek açık kalır.
+        Windows'ta açık dosyanın üstüne os.replace yapılamadığı için ExcelOutWriter ara kayıtları bu süre
+        boyunca tamponda bekletir (buffered_writer.reading).
+        """
+        with buffered_writer.reading(excel_path):
+            if ext == ".csv":
+                enc = detect_text_encoding(excel_path)
+                with open(excel_path, newline="", encoding=enc, errors="replace") as f:
+                    reader = csv.reader(f)
+                    header = next(reader, [])
+                    yield [(h or "").strip() for h in header]
+                    yield from reader
+            else:
+                # ---- XLSX / XLSM / (XLS de openpyxl ile kısıtlı) ----
+                from openpyxl import load_workbook
+                wb = load_workbook(excel_path, read_only=True, data_only=True)
                 try:
-                    with open(excel_path, newline="", encoding=enc, errors="strict") as f:
-                        reader = csv.DictReader(f)
-                        # Başlıkları case-insensitive erişilebilsin diye her satırda hem orijinal hem lower tutacağız
-                        for i, row in enumerate(reader, start=2):
-                            # DictReader anahtarları dosyadaki başlıklarla gelir
-                            row_raw = (row or {})
-                            # Tüm varyant anahtarlarla satır sözlüğü
-                            row_dict: Dict[str, str] = {}
-                            for k, v in row_raw.items():
-                                kk = (k or "").strip()
-                                vv = "" if v is None else str(v).strip()
-                                for key_variant in _make_key_variants(kk):
-                                    row_dict[key_variant] = vv
-
-                            # İstenen kolonları case-insensitive al
-                            def get_ci(key: str, default: str = "") -> str:
-                                if not key: return default
-                                return row_dict.get(key, row_dict.get(key.lower(), default))
-
-                            photo_rel = get_ci(col_photo) or get_ci("@photo") or get_ci("photo")
-                            if not photo_rel:
-                                # Foto yoksa satırı atla
-                                continue
-
-                            rel = str(photo_rel).replace("/", os.sep).replace("\\", os.sep)
-                            face_abs = _join_face(rel)
-
-                            if not os.path.exists(face_abs):
-                                log(f"[WARN] Yüz dosyası yok: {face_abs}")
-                                continue
-
-                            first = get_ci(col_first, "")
-                            last  = get_ci(col_last, "")
-                            cls   = get_ci(col_class, "")
-                            name  = " ".join([x for x in [first, last] if x]).strip() or os.path.splitext(os.path.basename(face_abs))[0]
-
-                            _set_defaults_rowvars(row_dict, name, cls, rel)
-                            children.append({
-                                "name": name,
-                                "class": cls,
-                                "face": face_abs,
-                                "vars": row_dict,
-                                "row_index": i
-                            })
-                    # Başarılı açılış → döngü kır
-                    last_err = None
-                    break
-                except Exception as e:
-                    last_err = e
-                    continue
-            if last_err:
-                raise last_err
+                    ws = wb.active
+                    it = ws.iter_rows(values_only=True)
+                    header = next(it, ())
+                    yield [("" if c is None else str(c)).strip() for c in header]
+                    yield from it
+                finally:
+                    wb.close()
 
-        # ---- XLSX / XLSM / (XLS de openpyxl ile kısıtlı) ----
-        else:
-            from openpyxl import load_workbook
-            wb = load_workbook(excel_path, data_only=True)
-            ws = wb.active
-
-            # Başlık satırı
-            header = list(next(ws.iter_rows(min_row=1, max_row=1, values_only=True)))
-            header = [("" if c is None else str(c)) for c in header]
-
-            # Case-insensitive index haritası
-            idx_ci = {}
-            for i, h in enumerate(header):
-                h_str = (h or "").strip()
-                if h_str:
-                    idx_ci[h_str] = i
-                    idx_ci[h_str.lower()] = i
-
-            def get_cell(row_tuple, col_name: str, default: str = "") -> str:
-                if not col_name:
-                    return default
-                j = idx_ci.get(col_name, idx_ci.get(col_name.lower()))
-                if j is None or j >= len(row_tuple):
-                    return default
-                v = row_tuple[j]
-                return "" if v is None else str(v).strip()
-
-            for i, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-                # Satırı dict'e çevir (tüm varyant anahtarlarla)
-                row_dict: Dict[str, str] = {}
-                for h, j in ((h, idx_ci.get(h)) for h in header if h in idx_ci):
-                    if j is None or j >= len(row):
-                        continue
-                    val = row[j]
-                    vv = "" if val is None else str(val).strip()
-                    hh = (h or "").strip()
-                    for key_variant in _make_key_variants(hh):
-                        row_dict[key_variant] = vv
-
-                photo_rel = get_cell(row, col_photo) or get_cell(row, "@photo") or get_cell(row, "photo")
-                if not photo_rel:
-                    continue
-
-                rel = str(photo_rel).replace("/", os.sep).replace("\\", os.sep)
-                face_abs = _join_face(rel)
-
-                if not os.path.exists(face_abs):
-                    log(f"[WARN] Yüz dosyası yok: {face_abs}")
-                    continue
+    try:
+        rows = _rows()
+        header = next(rows)
+        cmap = build_column_map(header)
+        # Satır değişkenleri: yalnız başlığı dolu sütunlar (aynı başlık tekrarlanırsa sonraki kazanır)
+        var_cols = [(h, j) for j, h in enumerate(header) if h]
+        # 'name' / 'class' / '@photo' varsayılanları yalnız hiçbir sütun bu anahtarı karşılamıyorsa eklenir
+        defaults_missing = [k for k in ("name", "class", "@photo") if k not in cmap]
+
+        def get_ci(row, key: str, default: str = "") -> str:
+            if not key: return default
+            j = cmap.get(key, cmap.get(key.lower()))
+            if j is None or j >= len(row):
+                return default
+            v = row[j]
+            return "" if v is None else str(v).strip()
+
+        for i, row in enumerate(rows, start=2):
+            if not row:
+                continue
+            photo_rel = get_ci(row, col_photo) or get_ci(row, "@photo") or get_ci(row, "photo")
+            if not photo_rel:
+                # Foto yoksa satırı atla
+                continue
 
-                first = get_cell(row, col_first, "")
-                last  = get_cell(row, col_last, "")
-                cls   = get_cell(row, col_class, "")
-                name  = " ".join([x for x in [first, last] if x]).strip() or os.path.splitext(os.path.basename(face_abs))[0]
+            rel = str(photo_rel).replace("/", os.sep).replace("\\", os.sep)
+            face_abs = _join_face(rel)
 
-                _set_defaults_rowvars(row_dict, name, cls, rel)
-                children.append({
-                    "name": name,
-                    "class": cls,
-                    "face": face_abs,
-                    "vars": row_dict,
-                    "row_index": i
-                })
+            if check_faces and not os.path.exists(face_abs):
+                log(f"[WARN] Yüz dosyası yok: {face_abs}")
+                continue
 
+            first = get_ci(row, col_first, "")
+            last  = get_ci(row, col_last, "")
+            cls   = get_ci(row, col_class, "")
+            name  = " ".join([x for x in [first, last] if x]).strip() or os.path.splitext(os.path.basename(face_abs))[0]
+
+            row_vars = {h: ("" if j >= len(row) or row[j] is None else str(row[j]).strip()) for h, j in var_cols}
+            for k in defaults_missing:
+                row_vars[k] = {"name": name, "class": cls, "@photo": rel}[k]
+            yield {
+                "name": name,
+                "class": cls,
+                "face": face_abs,
+                "vars": row_vars,
+                "row_index": i
+            }
+    except StopIteration:
+        return
     except Exception as e:
         log(f"[ERR] Excel/CSV okuma hatası: {e}")
 
-    # ---- Dönüş öncesi: yol normalizasyonu + sıraya sok ----
-    for ch in children:
-        ch["face"] = _normpath(ch.get("face", ""))
-    # Excel sırası garanti: row_index küçükten büyüğe
-    children.sort(key=lambda x: x.get("row_index", 10**9))
-    return children
+def collect_children(settings: dict, log) -> List[Dict[str, Any]]:
+    """iter_children'ın liste hali (Excel satır sırasıyla)."""
+    return list(iter_children(settings, log))
 
 
 # ---- POSE bulucu ----
 def find_pose_image_path(poses_dir_or_file: str) -> Optional[str]:
-    if not poses_dir_or_file: return None
-    p = poses_dir_or_file.strip()
-    if os.path.isfile(p):
-        return p
-    if os.path.isdir(p):
-        exts = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
-        files = [os.path.join(p, n) for n in os.listdir(p) if n.lower().endswith(exts)]
-        files.sort()
-        if files: return files[0]
-    return None
+    # poz kütüphanesi indeksinden (klasör başına listdir + sort süreç boyunca bir kez, mtime ile tazelenir)
+    pose = pose_library().resolve(poses_dir_or_file)
+    return pose.path if pose else None
 
 # ---- Çalıştırma ----
-def run_book_via_api(book: dict, log_path: str, out_dir: str = DEFAULT_OUT_DIR, progress_cb=None):
+class DebugCNCapture:
+    """
+    Opt-in (iş başına) ControlNet girdi dökümü; üretimde varsayılan kapalı.
+    - Çocuk klasörü başına her farklı girdi bir kez: debug_cn{unit}_input_<hash>.png
+    - Yazım arka plandaki tek thread'de; kaydetme aşamasını bekletmez. close() kuyruğu boşaltır.
+    """
+    def __init__(self, log):
+        self.log = log
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._q: "queue.Queue" = queue.Queue()
+        self._t = threading.Thread(target=self._loop, daemon=True)
+        self._t.start()
+
+    def capture(self, child_dir: str, unit: int, b64: str):
+        h = hashlib.sha1(b64.encode("ascii")).hexdigest()[:12]
+        with self._lock:
+            if (child_dir, unit, h) in self._seen:
+                return
+            self._seen.add((child_dir, unit, h))
+        self._q.put((os.path.join(child_dir, f"debug_cn{unit}_input_{h}.png"), b64))
+
+    def _loop(self):
+        while True:
+            item = self._q.get()
+            if item is None:
+                return
+            path, b64 = item
+            try:
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(path, "wb") as f:
+                        f.write(base64.b64decode(b64))   # önbellekteki PNG baytları; yeniden encode yok
+            except Exception as e:
+                self.log(f"[WARN] Debug CN girdisi yazılamadı: {path} ({e})")
+
+    def close(self):
+        self._q.put(None)
+        self._t.join()
+
+def child_output_dir(out_root: str, child: dict) -> str:
+    """output_root/<Sınıf>/<Ad Soyad> (sınıf yoksa doğrudan output_root/<Ad Soyad>)."""
+    child_name  = (child.get("name")  or "").strip()
+    child_class = (child.get("class") or "").strip()
+    base_out = os.path.join(out_root, child_class) if child_class else out_root
+    return os.path.join(base_out, child_name)
+
+def page_output_path(child_out: str, page_index: int) -> str:
+    # Alt klasör yok; doğrudan sayfa{N}.png
+    return os.path.join(child_out, f"sayfa{int(page_index)}.png")
+
+def page_provenance(page: dict, child: dict, face_sha1: str, prompt: str, negative: str, settings: dict) -> str:
+    """API runner çıktısının girdi özeti: sayfa ayarı, işlenmiş prompt'lar, satır değişkenleri, yüz içeriği, checkpoint."""
+    return provenance_hash(
+        "api", page, child.get("vars") or {}, face_sha1, prompt, negative,
+        checkpoint=checkpoint_key(page.get("checkpoint")),
+        extra={"name": child.get("name", ""), "class": child.get("class", ""),
+               "poses_dir": "" if (page.get("pose_path") or "").strip() else (settings.get("poses_dir") or "")})
+
+def open_book_manifest(book: dict, out_root: str, children: List[dict], log) -> OutputManifest:
+    """Kitabın çıktı manifesti; ilk kurulum tamamlanana kadar çocuk klasörlerinden kurulur."""
+    m = OutputManifest.for_book(book["id"])
+    if not m.bootstrapped:
+        st = m.rescan(child_dirs=[child_output_dir(out_root, c) for c in children])
+        m.mark_bootstrapped()
+        log(f"[MANIFEST] İlk kurulum: {st['files']} mevcut çıktı kaydedildi ({st['dirs']} klasör).")
+    return m
+
+def plan_book_outputs(book: dict, children: List[dict], limit: int = 500,
+                      face_shas: Optional[Dict[str, Optional[str]]] = None) -> Dict[str, Any]:
+    """
+    Dry-run: kitap API'den çalıştırılsa hangi (çocuk, sayfa) çiftleri üretilirdi? Görsel üretilmez, hiçbir şey yazılmaz.
+    - Manifest salt okunur açılır; yoksa ya da ilk kurulumu bitmemişse diske bakılmaz: manifestte olmayan
+      çıktılar 'unscanned' sayılır (ilk çalıştırma klasörleri tarayacak), bootstrapped=False döner.
+    - face_shas: yüz yolu -> sha1 (ön kontrol sonuçlarından); eksikler face_preflight havuzunda hesaplanır.
+    - counts: current / missing / changed / unstamped (özetsiz eski çıktı: güncel sayılır) / unscanned / no_face,
+      regenerate (missing + changed)
+    - rows: üretilecekler (missing + changed), en çok limit tane
+    """
+    s = book.get("settings") or {}
+    out_root = s.get("output_root") or DEFAULT_OUT_DIR
+    pages = sorted(book.get("pages", []), key=lambda p: p.get("index", 0))
+    templates = [(compile_template(p.get("prompt", "") or ""), compile_template(p.get("negative_prompt", "") or ""))
+                 for p in pages]
+    counts = dict.fromkeys(("current", "missing", "changed", "unstamped", "unscanned", "no_face"), 0)
+    rows: List[Dict[str, Any]] = []
+
+    shas = dict(face_shas or {})
+    todo = [ch["face"] for ch in children if ch.get("face") and not shas.get(ch["face"])]
+    if todo:
+        shas.update(face_preflight.hash_files(todo))
+
+    m = OutputManifest.open_readonly(book["id"])
+    bootstrapped = bool(m and m.bootstrapped)
+    try:
+        for child in children:
+            face_sha = shas.get(child.get("face"))
+            if not face_sha:
+                counts["no_face"] += 1; continue
+            var_index = build_var_index(child)
+            child_out = child_output_dir(out_root, child)
+            paths = [page_output_path(child_out, int(p.get("index", 0) or 0)) for p in pages]
+            provs = [page_provenance(p, child, face_sha, tp.render(var_index), tn.render(var_index), s)
+                     for p, (tp, tn) in zip(pages, templates)]
+            states = m.plan(paths, provs) if m else ["missing"] * len(paths)
+            for p, path, st in zip(pages, paths, states):
+                if st == "missing" and not bootstrapped:
+                    st = "unscanned"
+                counts[st] += 1
+                if st in ("missing", "changed") and len(rows) < limit:
+                    rows.append({"child": f"{(child.get('class') or '').strip()}/{(child.get('name') or '').strip()}",
+                                 "page": int(p.get("index", 0) or 0), "path": path, "status": st})
+    finally:
+        if m:
+            m.close()
+    counts["regenerate"] = counts["missing"] + counts["changed"]
+    return {"counts": counts, "rows": rows, "bootstrapped": bootstrapped}
+
+def run_book_via_api(book: dict, log_path: str, out_dir: str = DEFAULT_OUT_DIR, progress_cb=None,
+                     backends: Optional[List[str]] = None, debug_cn: bool = False):
+    # Log arka planda toplu yazılır (<iş>.log + <iş>.events.jsonl); iş nasıl biterse bitsin sonda boşaltılır
+    log = JobLogger(log_path)
+    try:
+        return _run_book_via_api(book, log, out_dir, progress_cb, backends, debug_cn)
+    finally:
+        log.close()
+
+def _run_book_via_api(book: dict, log: JobLogger, out_dir: str, progress_cb, backends: Optional[List[str]],
+                      debug_cn: bool):
     name = book["name"]
     s = book["settings"]
     out_root = s.get("output_root") or out_dir
     pages = sorted(book.get("pages", []), key=lambda p: p.get("index", 0))
     os.makedirs(out_root, exist_ok=True)
-
-    def log(msg: str):
-        print(msg)
-        with open(log_path, "a", encoding="utf-8") as f: f.write(msg.rstrip() + "\n")
-
-    children = collect_children(s, log)
-
-    # POSE cache
-    pose_cache: Dict[str, Optional[str]] = {}
-    def resolve_pose_b64(pose_source: str) -> (Optional[str], Optional[str]):
-        if not pose_source: return (None, None)
-        if pose_source in pose_cache:
-            resolved = find_pose_image_path(pose_source)
-            return (resolved, pose_cache[pose_source])
-        resolved = find_pose_image_path(pose_source)
-        if resolved and os.path.exists(resolved):
-            try:
-                b64 = read_image_to_b64(resolved)
-                pose_cache[pose_source] = b64
-                return (resolved, b64)
-            except Exception as e:
-                log(f"[WARN] Poz okunamadı: {resolved} ({e})")
-        pose_cache[pose_source] = None
-        return (resolved, None)
+    backends = list(backends or SD_BACKENDS)
+
+    # Çocuklar akış halinde gelir: ilk satırın sayfaları liste sonuna kadar okunmadan üretilmeye başlar
+    children = iter_children(s, log, check_faces=False)
+    seen_children: List[dict] = []
+    face_index = face_preflight_index()
+
+    # Pozlar: kütüphane indeksi (kaynak → poz kaydı, base64 ve detect haritaları kayıtta)
+    poses = pose_library()
+    bad_poses = set()
+    def resolve_pose(pose_source: str):
+        pose = poses.resolve(pose_source) if pose_source else None
+        if pose is None or pose.id in bad_poses:
+            return (pose, None)
+        try:
+            return (pose, pose.b64())
+        except Exception as e:
+            bad_poses.add(pose.id)
+            log(f"[WARN] Poz okunamadı: {pose.path} ({e})")
+            return (pose, None)
 
     # EXCEL out yazıcı
     writer = None
@@ -1484,217 +1569,488 @@ def run_book_via_api(book: dict, log_path: str, out_dir: str = DEFAULT_OUT_DIR,
         except Exception as e:
             log(f"[WARN] Excel out yazıcı açılamadı: {e}")
 
-    log(f"[INFO] Başlıyor: {name} | children:{len(children)} pages:{len(pages)}")
-    if not children:
-        log("[WARN] Kaynakta çocuk bulunamadı.")
-        log("[DONE] Tamamlandı."); return
+    log(f"[INFO] Başlıyor: {name} | pages:{len(pages)} | backends:{len(backends)}")
+
+    # REActor hazır mı? (backend başına)
+    reactor_ok: Dict[str, bool] = {b: reactor_available(b) for b in backends}
+    for b, ok in reactor_ok.items():
+        if not ok:
+            log(f"[REACTOR] endpoint yok: {b} (Forge/A1111'da REActor eklentisi etkin mi?).")
+
+    # Çıktı manifesti: hangi sayfanın bittiği diske sorulmadan buradan okunur.
+    # İlk kurulum bitmediyse (yeni ya da önceki çalıştırmada yarıda kalmış) çocuk klasörleri geldikçe taranır;
+    # bitti işareti yalnız liste sonuna kadar okunduktan sonra yazılır.
+    manifest = OutputManifest.for_book(book["id"])
+    bootstrap = {"on": not manifest.bootstrapped, "files": 0, "complete": False}
+    debug_capture = DebugCNCapture(log) if debug_cn else None
+    if debug_capture:
+        log("[DEBUG] CN girdileri çocuk klasörlerine kaydedilecek.")
+    # Birim 1 haritası kaynak başına bir kez /controlnet/detect ile (CN_DETECT_KEYPOINTS=1)
+    control_maps = cn_detect.ControlMapCache(backends[0], log) if cn_detect.ENABLED and backends else None
+    # Sabit seed'li aynı payload ikinci kez üretilmez (RESULT_CACHE=0 ile kapalı)
+    results = result_cache()
+    results_stats = {"hits": 0, "stored": 0}
+    results_lock = threading.Lock()      # sayaçlar generate worker'larından (backend başına bir thread) artar
+
+    # --- Görev durumu olayları (iş deposu için): queued / running / failed; done = "save" olayı ---
+    def task_event(task: dict, status: str, error: Optional[str] = None):
+        if callable(progress_cb):
+            progress_cb({"event": "task", "status": status, "child_key": task["child_key"],
+                         "page_index": task["page_index"], "error": error})
+
+    # Sayfa şablonları iş başına bir kez derlenir
+    page_templates = [(compile_template(p.get("prompt", "") or ""), compile_template(p.get("negative_prompt", "") or ""))
+                      for p in pages]
+
+    # --- Görev üretici: Excel sırasıyla (çocuk, sayfa) görevleri + çocuk sonu işaretçileri ---
+    def iter_tasks():
+        for child in children:
+            child_name  = (child.get("name")  or "").strip()
+            child_class = (child.get("class") or "").strip()
+            face_path   = child["face"]
+
+            # Bu çocuğun baz çıkış klasörü (klasör ilk kayıtta oluşturulur); ilk kurulumda yüzü bozuk
+            # çocuğun eski çıktıları da kaydedilir (yüz sonra düzelirse üzerine yazılmasın)
+            child_out = child_output_dir(out_root, child)
+            if bootstrap["on"]:
+                bootstrap["files"] += manifest.rescan(child_dirs=[child_out])["files"]
+
+            # Yüz ön kontrolü ((yol, mtime, boyut) önbellekli; panelden önceden koşulduysa yalnız stat)
+            fc = face_index.check(face_path)
+            if not fc["ok"]:
+                log(f"[WARN] Yüz dosyası kullanılamaz ({fc['error']}): {face_path}"); continue
+            seen_children.append(child)
+
+            page_paths = [page_output_path(child_out, int(p.get("index", 0) or 0)) for p in pages]
+
+            # Girdi özeti (provenance): sayfa ayarı / satır / yüz değiştiyse sayfa yeniden üretilir
+            var_index = build_var_index(child)   # çocuk başına bir kez
+            rendered = [(tpl_pr.render(var_index), tpl_npr.render(var_index)) for tpl_pr, tpl_npr in page_templates]
+            try:
+                face_sha = file_sha1(face_path)
+            except OSError as e:
+                log(f"[WARN] Yüz okunamadı: {face_path} ({e})"); continue
+            provs = [page_provenance(p, child, face_sha, pr, npr, s) for p, (pr, npr) in zip(pages, rendered)]
+
+            # Hangi sayfalar bitmiş ve girdileri değişmemiş? (manifest)
+            done_paths = manifest.current(page_paths, provs)
+            done_set = set(done_paths)
+            if page_paths and len(done_paths) == len(page_paths):
+                yield {"kind": "child_skip", "child": child, "child_out": child_out, "out_paths": done_paths}
+                continue
+
+            # Normalleştirilmiş yüz (EXIF + kırpma + küçültme), sayfanın işlemci çözünürlüğü başına bir kez
+            face_by_res: Dict[int, str] = {}
+            def face_for(p: dict) -> str:
+                res = target_res(int(p.get("width", 1024)), int(p.get("height", 1024)))
+                if res not in face_by_res:
+                    face_by_res[res] = normalized_face_b64(face_path, res)
+                return face_by_res[res]
+            first_todo = next((p for p, pp in zip(pages, page_paths) if pp not in done_set), None)
+            try:
+                if first_todo is not None:
+                    face_for(first_todo)
+            except Exception as e:
+                log(f"[WARN] Yüz okunamadı: {face_path} ({e})"); continue
 
-    # REActor hazır mı?
-    reactor_ok = reactor_available()
-    if not reactor_ok:
-        log("[REACTOR] endpoint yok (Forge/A1111'da REActor eklentisi etkin mi?).")
+            log(f"[CHILD] {child_name} | class={child_class or '-'} | face={face_path}", child=f"{child_class}/{child_name}")
 
-    # Yardımcı: sayfa çıktı dosya yolu
-    def page_output_path(base_dir: str, page_index: int) -> str:
-        # Alt klasör yok; doğrudan sayfa{N}.png
-        os.makedirs(base_dir, exist_ok=True)
-        return os.path.join(base_dir, f"sayfa{int(page_index)}.png")
+            # Mevcut olanları listeye ekle (Excel için)
+            out_paths_for_child: List[str] = list(done_paths)
 
-    for child in children:
+            for p, out_p, (pr, npr), prov in zip(pages, page_paths, rendered, provs):
+                p_idx = int(p.get("index", 0) or 0)
+
+                if out_p in done_set:
+                    log(f"[SKIP] Page {p_idx} zaten var → {out_p}", child=f"{child_class}/{child_name}", page=p_idx)
+                    continue
+                if manifest.has(out_p):
+                    log(f"[PROV] Page {p_idx} girdileri değişti, yeniden üretilecek → {out_p}",
+                        child=f"{child_class}/{child_name}", page=p_idx, stage="provenance")
+
+                try:
+                    face_b64 = face_for(p)
+                except Exception as e:
+                    log(f"[WARN] Yüz okunamadı: {face_path} ({e})"); break
+                seed = int(p.get("seed", -1))
+
+                # Sayfa bazlı poz → boşsa kitap ayarı fallback
+                pose_source = (p.get("pose_path") or s.get("poses_dir") or "").strip()
+                pose, pose_b64 = resolve_pose(pose_source)
+                if pose and pose_b64:
+                    log(f"[POSE] Page {p_idx} → {pose.path}")
+                else:
+                    log(f"[POSE] Page {p_idx} → (yok)")
+
+                log(f"[PAGE] {p_idx} | seed={seed} | {p.get('width')}x{p.get('height')} | steps={p.get('sampling_steps')}",
+                    child=f"{child_class}/{child_name}", page=p_idx, stage="queue")
+
+                # Birim 1: önceden hesaplanmış harita varsa module "none" ile harita gider
+                cn1_module = p.get("cn1_module", "instant_id_face_keypoints")
+                u1_b64 = pose_b64 or face_b64
+                u1_map = None
+                cn1_res = cn1_processor_res(p)       # payload'daki processor_res ile aynı değer
+                if control_maps and p.get("use_controlnet", True):
+                    u1_map = poses.control_map(pose, cn1_module, cn1_res, control_maps) if pose_b64 \
+                        else control_maps.control_map(face_b64, cn1_module, cn1_res)
+                if u1_map:
+                    cn1_module, u1_b64 = "none", u1_map
+
+                # ControlNet
+                cn = build_controlnet_args(
+                    face_b64=face_b64,
+                    pose_b64=u1_b64,
+                    use_cnet=bool(p.get("use_controlnet", True)),
+                    cn0_module=p.get("cn0_module", "InsightFace (InstantID)"),
+                    cn0_model=p.get("cn0_model",  "ip-adapter_instant_id_sdxl [eb2d3ec0]"),
+                    cn0_resize=int(p.get("cn0_resize",1)),
+                    cn1_module=cn1_module,
+                    cn1_model=p.get("cn1_model",  "control_instant_id_sdxl [c5c25a50]"),
+                    cn1_resize=int(p.get("cn1_resize",2)),
+                    cn0_weight=float(p.get("cn0_weight", 0.5)),
+                    cn1_weight=float(p.get("cn1_weight", 0.5)),
+                    cn0_control_mode=int(p.get("cn0_mode", 0)),
+                    cn1_control_mode=int(p.get("cn1_mode", 0)),
+                    cn1_processor_res=cn1_res
+                )
+
+
+                log(f"[CN] u0_module='{p.get('cn0_module')}' u0_model='{p.get('cn0_model')}' resize={int(p.get('cn0_resize',1))}; "
+                    f"u1_module='{cn1_module}' u1_model='{p.get('cn1_model')}' resize={int(p.get('cn1_resize',2))} res={cn1_res}; "
+                    f"u1_image={('MAP:' if u1_map else '') + ('POSE' if pose_b64 else 'FACE')}")
+
+                payload = {
+                    "prompt": pr, "negative_prompt": npr,
+                    "width": int(p.get("width", 1024)), "height": int(p.get("height", 1024)),
+                    "sampler_name": p.get("sampling_method", "Euler a"),
+                    "steps": int(p.get("sampling_steps", 20)),
+                    "cfg_scale": float(p.get("cfg_scale", 7.0)),
+                    "seed": seed,
+                    "override_settings": {"sd_model_checkpoint": p.get("checkpoint", "")},
+                    "alwayson_scripts": {"ControlNet": cn},
+                    "styles": p.get("styles", []),
+                }
+
+                task = {"kind": "page", "child": child, "page": p, "page_index": p_idx, "out_p": out_p,
+                       "child_key": f"{child_class}/{child_name}", "checkpoint": p.get("checkpoint", ""),
+                       "payload": payload, "face_b64": face_b64, "u1_b64": u1_b64,
+                       "result_key": payload_key(payload) if results else None, "provenance": prov,
+                       "out_paths": out_paths_for_child}
+                task_event(task, "queued")
+                yield task
+
+            yield {"kind": "child_end", "child": child, "out_paths": out_paths_for_child, "page_paths": page_paths}
+        bootstrap["complete"] = True
+
+    # --- Aşama 1 (backend başına bir worker): txt2img ---
+    def stage_generate(task: dict, backend: str) -> Optional[dict]:
+        task_event(task, "running")
+        task["backend"], task["timings"] = backend, {}
+        t0 = time.monotonic()
+        cached = results.get(task["result_key"]) if task["result_key"] else None
+        if cached is not None:
+            task["image"] = EncodedImage.from_bytes(cached)
+            task["timings"]["generate"] = round(time.monotonic() - t0, 3)
+            with results_lock:
+                results_stats["hits"] += 1
+            log(f"[CACHE] Page {task['page_index']} → sonuç önbellekten (Forge çağrılmadı)", child=task["child_key"],
+                page=task["page_index"], stage="cache", backend=backend)
+            return task
+        try:
+            if ckpt_tracker.ensure(backend, task["checkpoint"]):
+                log(f"[CKPT] {backend} → {task['checkpoint']}", backend=backend, stage="checkpoint",
+                    duration=round(time.monotonic() - t0, 3))
+        except Exception as e:
+            ckpt_tracker.forget(backend)
+            log(f"[WARN] Checkpoint ayarlanamadı ({backend}): {e}", backend=backend, stage="checkpoint")
+        t1 = time.monotonic()
+        imgs = call_txt2img(task["payload"], base=backend)
+        task["timings"]["generate"] = round(time.monotonic() - t1, 3)
+        if not imgs:
+            return None
+        task["image"] = imgs[0]
+        if task["result_key"]:
+            try:
+                results.put(task["result_key"], imgs[0].data)
+                with results_lock:
+                    results_stats["stored"] += 1
+            except Exception as e:
+                log(f"[WARN] Sonuç önbelleğe yazılamadı: {e}", stage="cache")
+        return task
+
+    # --- Aşama 2: REActor (dış API ile post-process); GPU bir sonraki sayfayı üretirken çalışır ---
+    def stage_reactor(task: dict, _slot) -> dict:
+        p, backend = task["page"], task["backend"]
+        if not (p.get("use_reactor") and reactor_ok.get(backend)):
+            return task
+        reactor_opts = {}
+        rj_text = p.get("reactor_json", "").strip()
+        if rj_text:
+            try:
+                rj = json.loads(rj_text)
+                if isinstance(rj, dict):
+                    for key in ("model","face_index","source_face_index","upscaler","scale",
+                                "upscale_visibility","face_restorer","restorer_visibility",
+                                "restore_first","gender_source","gender_target"):
+                        if key in rj:
+                            reactor_opts[key] = rj[key]
+            except Exception as e:
+                log(f"[REACTOR] JSON yok sayıldı (parse): {e}")
+        t0 = time.monotonic()
+        try:
+            task["image"] = reactor_swap(task["face_b64"], task["image"], reactor_opts, base=backend)
+            task["timings"]["reactor"] = round(time.monotonic() - t0, 3)
+            log(f"[REACTOR] swap uygulandı. (page {task['page_index']})", child=task["child_key"],
+                page=task["page_index"], stage="reactor", duration=task["timings"]["reactor"], backend=backend)
+        except Exception as e:
+            log(f"[REACTOR] başarısız, orijinal kullanılacak: {e}", child=task["child_key"],
+                page=task["page_index"], stage="reactor", backend=backend)
+        return task
+
+    # --- Aşama 3: diske yazma ---
+    def stage_save(task: dict, _slot) -> str:
+        out_p = task["out_p"]
+        t0 = time.monotonic()
+        os.makedirs(os.path.dirname(out_p), exist_ok=True)
+
+        # DEBUG CN input (yalnız debug_cn ile açılan işlerde; çocuk başına farklı girdi bir kez)
+        if debug_capture:
+            debug_capture.capture(os.path.dirname(out_p), 0, task["face_b64"])
+            debug_capture.capture(os.path.dirname(out_p), 1, task["u1_b64"])
+
+        # Forge'un PNG baytları doğrudan diske (PIL decode/encode yok)
+        manifest.write_bytes(out_p, task.pop("image").png_bytes(), provenance=task["provenance"])
+        task["timings"]["save"] = round(time.monotonic() - t0, 3)
+        return out_p
+
+    # --- Commit: Excel sırasıyla, tek thread'de (Excel yazımı + progress_cb sırası korunur) ---
+    def commit(task: dict, result: Optional[str], error: Optional[BaseException]):
+        child = task["child"]
         child_name  = (child.get("name")  or "").strip()
         child_class = (child.get("class") or "").strip()
-        face_path   = child["face"]
-
-        # Bu çocuğun baz çıkış klasörü
-        base_out = os.path.join(out_root, child_class) if child_class else out_root
-        child_out = os.path.join(base_out, child_name)
-        os.makedirs(child_out, exist_ok=True)
-
-        # Hangi sayfalar bitmiş?
-        done_map = {}
-        for p in pages:
-            p_idx = int(p.get("index", 0) or 0)
-            out_p = page_output_path(child_out, p_idx)
-            done_map[p_idx] = os.path.exists(out_p)
-
-        all_done = all(done_map.values()) if done_map else False
-        if all_done:
-            log(f"[SKIP] {child_name} | tüm sayfalar mevcut, atlanıyor.")
+        kind = task["kind"]
+
+        if kind == "child_skip":
+            log(f"[SKIP] {child_name} | tüm sayfalar mevcut, atlanıyor.", child=f"{child_class}/{child_name}", stage="skip")
             # Excel 'out' sütununu mevcut dosyalarla da güncelleyelim (varsa)
             if writer and child.get("row_index"):
                 try:
-                    existing = [page_output_path(child_out, int(p.get('index',0) or 0)) for p in pages]
-                    existing = [p for p in existing if os.path.exists(p)]
+                    existing = task["out_paths"]
                     if existing:
                         #writer.set_for_row(child["row_index"], "; ".join(existing))
                         writer.set_pages_for_row(child["row_index"], existing)  # ← @sayfaN kolonları
-                        writer.save()
-                        log(f"[EXCEL] out (skip) güncellendi (satır {child['row_index']}): {existing[-1]}")
+                        if writer.save():
+                            log("[EXCEL] Liste diske yazıldı.")
                 except Exception as e:
                     log(f"[WARN] Excel out (skip) yazılamadı: {e}")
-            continue
-
-        try:
-            face_b64 = read_image_to_b64(face_path)
-        except Exception as e:
-            log(f"[WARN] Yüz okunamadı: {face_path} ({e})"); continue
 
-        log(f"[CHILD] {child_name} | class={child_class or '-'} | face={face_path}")
-
-        out_paths_for_child: List[str] = []
-        # Mevcut olanları listeye ekle (Excel için)
-        for p in pages:
-            p_idx = int(p.get("index", 0) or 0)
-            out_p = page_output_path(child_out, p_idx)
-            if os.path.exists(out_p):
-                out_paths_for_child.append(out_p)
-
-        for p in pages:
-            p_idx = int(p.get("index", 0) or 0)
-            out_p = page_output_path(child_out, p_idx)
-
-            if os.path.exists(out_p):
-                log(f"[SKIP] Page {p_idx} zaten var → {out_p}")
-                continue
-
-            seed = int(p.get("seed", -1))
-            pr = render_text_template(p.get("prompt", ""), child)
-            npr = render_text_template(p.get("negative_prompt", ""), child)
-
-            # Sayfa bazlı poz → boşsa kitap ayarı fallback
-            pose_source = (p.get("pose_path") or s.get("poses_dir") or "").strip()
-            pose_used_path, pose_b64 = resolve_pose_b64(pose_source) if pose_source else (None, None)
-            if pose_used_path and pose_b64:
-                log(f"[POSE] Page {p_idx} → {pose_used_path}")
+        elif kind == "page":
+            if error is not None:
+                log(f"[ERR] API hata: {error}", child=task["child_key"], page=task["page_index"],
+                    stage="generate", backend=task.get("backend"))
+                task_event(task, "failed", str(error))
+            elif not result:
+                log("[WARN] API bir görüntü döndürmedi.", child=task["child_key"], page=task["page_index"],
+                    stage="generate", backend=task.get("backend"))
+                task_event(task, "failed", "empty")
             else:
-                log(f"[POSE] Page {p_idx} → (yok)")
-
-            log(f"[PAGE] {p_idx} | seed={seed} | {p.get('width')}x{p.get('height')} | steps={p.get('sampling_steps')}")
-
-            # ControlNet
-            cn = build_controlnet_args(
-                face_b64=face_b64,
-                pose_b64=pose_b64,
-                use_cnet=bool(p.get("use_controlnet", True)),
-                cn0_module=p.get("cn0_module", "InsightFace (InstantID)"),
-                cn0_model=p.get("cn0_model",  "ip-adapter_instant_id_sdxl [eb2d3ec0]"),
-                cn0_resize=int(p.get("cn0_resize",1)),
-                cn1_module=p.get("cn1_module", "instant_id_face_keypoints"),
-                cn1_model=p.get("cn1_model",  "control_instant_id_sdxl [c5c25a50]"),
-                cn1_resize=int(p.get("cn1_resize",2)),
-                cn0_weight=float(p.get("cn0_weight", 0.5)),
-                cn1_weight=float(p.get("cn1_weight", 0.5)),
-                cn0_control_mode=int(p.get("cn0_mode", 0)),
-                cn1_control_mode=int(p.get("cn1_mode", 0))
-            )
-
-
-            log(f"[CN] u0_module='{p.get('cn0_module')}' u0_model='{p.get('cn0_model')}' resize={int(p.get('cn0_resize',1))}; "
-                f"u1_module='{p.get('cn1_module')}' u1_model='{p.get('cn1_model')}' resize={int(p.get('cn1_resize',2))}; "
-                f"u1_image={'POSE' if pose_b64 else 'FACE'}")
-
-            payload = {
-                "prompt": pr, "negative_prompt": npr,
-                "width": int(p.get("width", 1024)), "height": int(p.get("height", 1024)),
-                "sampler_name": p.get("sampling_method", "Euler a"),
-                "steps": int(p.get("sampling_steps", 20)),
-                "cfg_scale": float(p.get("cfg_scale", 7.0)),
-                "seed": seed,
-                "override_settings": {"sd_model_checkpoint": p.get("checkpoint", "")},
-                "alwayson_scripts": {"ControlNet": cn},
-                "styles": p.get("styles", []),
-            }
-
-            try:
-                imgs = call_txt2img(payload)
-                if not imgs:
-                    log("[WARN] API bir görüntü döndürmedi."); continue
-
-                gen_img = imgs[0]
-
-                # DEBUG CN input
-                try:
-                    b64_to_image(face_b64).save(os.path.join(os.path.dirname(out_p), "debug_cn0_input.png"))
-                    (b64_to_image(pose_b64) if pose_b64 else b64_to_image(face_b64)).save(os.path.join(os.path.dirname(out_p), "debug_cn1_input.png"))
-                except Exception:
-                    pass
-
-                # --- REActor (dış API ile post-process) ---
-                if p.get("use_reactor") and reactor_ok:
-                    reactor_opts = {}
-                    rj_text = p.get("reactor_json", "").strip()
-                    if rj_text:
-                        try:
-                            rj = json.loads(rj_text)
-                            if isinstance(rj, dict):
-                                for key in ("model","face_index","source_face_index","upscaler","scale",
-                                            "upscale_visibility","face_restorer","restorer_visibility",
-                                            "restore_first","gender_source","gender_target"):
-                                    if key in rj:
-                                        reactor_opts[key] = rj[key]
-                        except Exception as e:
-                            log(f"[REACTOR] JSON yok sayıldı (parse): {e}")
-                    try:
-                        gen_img = reactor_swap(face_b64, gen_img, reactor_opts)
-                        log("[REACTOR] swap uygulandı.")
-                    except Exception as e:
-                        log(f"[REACTOR] başarısız, orijinal kullanılacak: {e}")
-
-                gen_img.save(out_p)
-                out_paths_for_child.append(out_p)
-                log(f"[OK] Kaydedildi: {out_p}")
+                out_p = result
+                task["out_paths"].append(out_p)
+                tm = task.get("timings") or {}
+                log(f"[OK] Kaydedildi: {out_p}", child=task["child_key"], page=task["page_index"], stage="save",
+                    duration=round(sum(tm.values()), 3), timings=tm, backend=task.get("backend"), path=out_p)
                 if callable(progress_cb):
-                    progress_cb({"event":"save","image_path":out_p,"child":child_name,"class":child_class,"page_index":p_idx})
-            except Exception as e:
-                log(f"[ERR] API hata: {e}")
-
-        # Çocuk tamamlandı → Excel 'out' yaz
-        if writer and child.get("row_index"):
+                    progress_cb({"event":"save","image_path":out_p,"child":child_name,"class":child_class,"page_index":task["page_index"],
+                                 "child_key":task["child_key"]})
+
+        elif kind == "child_end":
+            # Çocuk tamamlandı → Excel 'out' yaz
+            # @sayfaN sütunları sayfa sırasıyla (görevler checkpoint'e göre yeniden sıralanmış olabilir);
+            # üretilemeyen sayfanın hücresi boş kalır
+            done = set(task["out_paths"])
+            out_paths_for_child = [pp if pp in done else "" for pp in task["page_paths"]]
+            if writer and child.get("row_index"):
+                try:
+                    #writer.set_for_row(child["row_index"], "; ".join(out_paths_for_child))
+                    writer.set_pages_for_row(child["row_index"], out_paths_for_child)  # ← @sayfaN kolonları
+                    if done:
+                        log(f"[EXCEL] out güncellendi (satır {child['row_index']}): {len(done)}/{len(out_paths_for_child)} sayfa")
+                    if writer.save():
+                        log("[EXCEL] Liste diske yazıldı.")
+                except Exception as e:
+                    log(f"[WARN] Excel out yazılamadı: {e}")
+
+    # Checkpoint gruplama: aynı modeli kullanan (çocuk, sayfa) görevleri art arda koşar.
+    # Pencere pencere (CKPT_GROUP_CHILDREN çocuk): liste akışı bozulmaz, ilk üretim tüm yüzleri beklemez.
+    ckpt_tracker = CheckpointTracker(api_active_checkpoint, api_set_checkpoint)
+    tasks = iter_tasks()
+    ckpt_info = None
+    if len({checkpoint_key(p.get("checkpoint")) for p in pages} - {""}) > 1:
+        tasks, ckpt_info = order_by_checkpoint(tasks, ckpt_of=lambda t: t.get("checkpoint"),
+                                               is_task=lambda t: t["kind"] == "page",
+                                               active=ckpt_tracker.active(backends[0]),
+                                               window=checkpoint_window(len(pages)))
+
+    # Excel tamponu: panelden anında yazdırılabilsin; iş nasıl biterse bitsin sonda boşaltılır
+    if writer:
+        buffered_writer.register(book["id"], writer)
+    pool = BackendPool(backends)
+    try:
+        pool.run_ordered(tasks, stage_generate, commit, needs_work=lambda t: t["kind"] == "page",
+                         later=[Stage("reactor", stage_reactor, workers=len(backends)),
+                                Stage("save", stage_save, workers=2)])
+    finally:
+        if debug_capture:
+            debug_capture.close()
+        # iş yarıda kesildiyse liste hâlâ açık olabilir: önce kapat (son Excel kaydı bekletilmesin)
+        children.close()
+        if writer:
+            buffered_writer.unregister(book["id"], writer)
             try:
-                #writer.set_for_row(child["row_index"], "; ".join(out_paths_for_child))
-                writer.set_pages_for_row(child["row_index"], out_paths_for_child)  # ← @sayfaN kolonları
-                writer.save()
-                if out_paths_for_child:
-                    log(f"[EXCEL] out yazıldı (satır {child['row_index']}): {out_paths_for_child[-1]}")
+                if writer.flush():
+                    log("[EXCEL] Liste diske yazıldı (iş sonu).")
             except Exception as e:
                 log(f"[WARN] Excel out yazılamadı: {e}")
-
-    if writer:
-        try: writer.save()
-        except: pass
-
+    if len(backends) > 1:
+        log("[INFO] Backend dağılımı: " + ", ".join(f"{b}={n}" for b, n in pool.stats.items()))
+    if ckpt_info:
+        log("[CKPT] Gruplar: " + ", ".join(f"{n or '-'}({c})" for n, c in ckpt_info["groups"])
+            + f" | pencere: {ckpt_info['windows']}")
+    avoided = ckpt_info["avoided"] if ckpt_info else 0
+    log(f"[CKPT] Model değişimi: {ckpt_tracker.stats['swaps']} | atlanan options çağrısı: {ckpt_tracker.stats['skipped']} "
+        f"| sıralamayla önlenen değişim: {avoided}")
+    if control_maps:
+        log(f"[CN] Birim 1 haritası: detect çağrısı {control_maps.stats['detect']} | önbellekten {control_maps.stats['hits']}"
+            + (f" | geçici hata {control_maps.stats['errors']}" if control_maps.stats["errors"] else "")
+            + (" | detect kullanılamadı, ön-işlemci Forge'da çalıştı" if control_maps.available is False else ""))
+
+    if results and (results_stats["hits"] or results_stats["stored"]):
+        log(f"[CACHE] Sonuç önbelleği: önbellekten {results_stats['hits']} | yeni kayıt {results_stats['stored']}")
+
+    if not seen_children:
+        log("[WARN] Kaynakta çocuk bulunamadı.")
+    else:
+        log(f"[INFO] Çocuk sayısı: {len(seen_children)}")
+    if bootstrap["on"] and bootstrap["complete"]:
+        manifest.mark_bootstrapped()
+        log(f"[MANIFEST] İlk kurulum: {bootstrap['files']} mevcut çıktı kaydedildi.")
+    done_total = manifest.count(page_output_path(child_output_dir(out_root, c), int(p.get("index", 0) or 0))
+                                for c in seen_children for p in pages)
+    log(f"[MANIFEST] Kitap çıktıları: {done_total} / {len(seen_children) * len(pages)}")
+    manifest.close()
     log("[DONE] Tamamlandı.")
 
 
 
 
 # ---- İş yönetimi + SSE ----
-JOBS: Dict[str, Dict[str, Any]] = {}
-JOB_INDEX: Dict[str, str] = {}
-
-def start_job(book_id):
-    job_id = uuid.uuid4().hex[:12]
-    log_path = os.path.join(LOGS_DIR, f"{job_id}.log")
-    JOBS[job_id] = {"status": "running", "log_path": log_path, "book_id": book_id, "started_at": now_iso(),
-                    "finished_at": None, "last_image": None, "last_child": None, "last_page": None, "kind": "api"}
-    JOB_INDEX[book_id] = job_id
+# İşler ve (çocuk, sayfa) görev durumları kalıcı SQLite deposunda (yeniden başlatmaya dayanıklı)
+JOB_STORE = JobStore(os.path.join(DATA_DIR, "jobs.sqlite3"))
+
+def start_job(book_id, job_id: Optional[str] = None, debug_cn: bool = False):
+    """job_id verilirse (devralınan iş) aynı log'a ekleyerek kaldığı yerden devam eder."""
+    if job_id is None:
+        job_id = uuid.uuid4().hex[:12]
+        log_path = os.path.join(LOGS_DIR, f"{job_id}.log")
+        JOB_STORE.create_job(job_id, book_id, "api", log_path, now_iso(), args={"debug_cn": bool(debug_cn)})
+    else:
+        j = JOB_STORE.get(job_id)
+        log_path = j["log_path"]
+        debug_cn = bool((j.get("args") or {}).get("debug_cn"))
+        JOB_STORE.reset_running_tasks(job_id)
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(f"[INFO] İş devralındı, kaldığı yerden devam ediliyor ({now_iso()}).\n")
     def worker():
         try:
             def progress_cb(info):
-                JOBS[job_id]["last_image"] = info.get("image_path")
-                JOBS[job_id]["last_child"] = info.get("child")
-                JOBS[job_id]["last_page"] = info.get("page_index")
-            run_book_via_api(read_book(book_id), log_path=log_path, out_dir=DEFAULT_OUT_DIR, progress_cb=progress_cb)
-            JOBS[job_id]["status"] = "finished"
+                ev = info.get("event")
+                if ev == "save":
+                    JOB_STORE.update(job_id, last_image=info.get("image_path"), last_child=info.get("child"),
+                                     last_page=info.get("page_index"))
+                    if info.get("child_key"):
+                        JOB_STORE.set_task(job_id, info["child_key"], info["page_index"], "done",
+                                           output=info.get("image_path"))
+                elif ev == "task":
+                    JOB_STORE.set_task(job_id, info["child_key"], info["page_index"], info["status"],
+                                       error=info.get("error"))
+            run_book_via_api(read_book(book_id), log_path=log_path, out_dir=DEFAULT_OUT_DIR, progress_cb=progress_cb,
+                             debug_cn=debug_cn)
+            JOB_STORE.update(job_id, status="finished")
         except Exception as e:
             with open(log_path, "a", encoding="utf-8") as f:
                 f.write(f"\n[ERR] {e}\n")
-            JOBS[job_id]["status"] = "failed"
+            JOB_STORE.update(job_id, status="failed")
         finally:
-            JOBS[job_id]["finished_at"] = now_iso()
+            JOB_STORE.update(job_id, finished_at=now_iso())
     threading.Thread(target=worker, daemon=True).start()
     return job_id
 
+def resume_unfinished_jobs(stale_sec: Optional[float] = None) -> List[str]:
+    """
+    Heartbeat'i bayatlamış ya da sahibi ölmüş 'running' işleri devralır:
+    - api: kaldığı yerden devam (bitmiş sayfalar zaten atlanır)
+    - ui : Selenium süreci yeniden bağlanamaz → 'interrupted' işaretlenir
+    """
+    resumed = []
+    for j in JOB_STORE.claim_orphans(stale_sec):
+        if j.get("kind") == "api" and read_book(j["book_id"]):
+            start_job(j["book_id"], job_id=j["id"])
+            resumed.append(j["id"])
+        else:
+            if j.get("log_path"):
+                with open(j["log_path"], "a", encoding="utf-8") as f:
+                    f.write("[WARN] Panel yeniden başladı; UI işi yarıda kaldı (interrupted).\n")
+            JOB_STORE.update(j["id"], status="interrupted", finished_at=now_iso())
+    return resumed
+
+def _orphan_sweep_loop(interval: float):
+    """Açılıştan sonra da her heartbeat aralığında sahipsiz iş arar: açılışta heartbeat'i henüz taze görünen
+    (ya da başka bir panel sürecinden kalan) işler bayatladıklarında devralınır."""
+    while not _SWEEP_STOP.wait(interval):
+        try:
+            resumed = resume_unfinished_jobs()
+            if resumed:
+                print(f"[INFO] Yarım kalan {len(resumed)} iş devralındı: {', '.join(resumed)}")
+        except Exception as e:
+            print(f"[WARN] Sahipsiz iş taraması başarısız: {e}")
+
+def start_orphan_sweep(interval: Optional[float] = None) -> threading.Thread:
+    t = threading.Thread(target=_orphan_sweep_loop, args=(interval or JOB_STORE.heartbeat_sec,), daemon=True)
+    t.start()
+    return t
+
+# Açılış işleri (kitap göçü + yarım kalan işleri devralma + periyodik tarama): sunan süreçte bir kez.
+# `python app.py`'de reloader çocuğu hemen çağırır; `flask run` / WSGI sunucularında ilk istekte koşar.
+# Reloader'ın ebeveyn süreci istek almadığı için orada hiç çalışmaz.
+_STARTUP_LOCK = threading.Lock()
+_STARTUP_DONE = False
+_SWEEP_STOP = threading.Event()
+
+def startup_once():
+    global _STARTUP_DONE
+    with _STARTUP_LOCK:
+        if _STARTUP_DONE:
+            return
+        _STARTUP_DONE = True
+        try:
+            n = BOOK_STORE.migrate()   # bir kerelik: eksik varsayılan ayarları kitap dosyalarına yaz
+            if n:
+                print(f"[INFO] {n} kitap dosyası varsayılan ayarlarla güncellendi.")
+        except Exception as e:
+            print(f"[WARN] Kitap göçü başarısız: {e}")
+        try:
+            resumed = resume_unfinished_jobs()
+            if resumed:
+                print(f"[INFO] Yarım kalan {len(resumed)} iş devralındı: {', '.join(resumed)}")
+        except Exception as e:
+            print(f"[WARN] Yarım kalan işler devralınamadı: {e}")
+        start_orphan_sweep()
+
+@app.before_request
+def _startup_hook():
+    if not _STARTUP_DONE:
+        startup_once()
+
 # === Forge UI Üzerinden Çalıştır ===
 IMG_PATH_RE = re.compile(r"""(?ix)
     (?:Kaydedildi:\s*|[() ]*çıktı:\s*)
@@ -1712,18 +2068,7 @@ def start_job_ui(book_id, forge_url: str):
 
     job_id = uuid.uuid4().hex[:12]
     log_path = os.path.join(LOGS_DIR, f"{job_id}.log")
-    JOBS[job_id] = {
-        "status": "running",
-        "log_path": log_path,
-        "book_id": book_id,
-        "started_at": now_iso(),
-        "finished_at": None,
-        "last_image": None,
-        "last_child": None,
-        "last_page": None,
-        "kind": "ui"
-    }
-    JOB_INDEX[book_id] = job_id
+    JOB_STORE.create_job(job_id, book_id, "ui", log_path, now_iso(), args={"forge_url": forge_url})
 
     # --- Excel sırası: manifest oluştur ---
     book = read_book(book_id)
@@ -1784,11 +2129,11 @@ def start_job_ui(book_id, forge_url: str):
                     if m:
                         path = m.group(1).strip()
                         if os.path.exists(path):
-                            JOBS[job_id]["last_image"] = path
+                            JOB_STORE.update(job_id, last_image=path)
                             try:
                                 pi = re.search(r"Sayfa\s*#(\d+)", s, re.I)
                                 if pi:
-                                    JOBS[job_id]["last_page"] = int(pi.group(1))
+                                    JOB_STORE.update(job_id, last_page=int(pi.group(1)))
                             except:
                                 pass
 
@@ -1807,26 +2152,19 @@ def start_job_ui(book_id, forge_url: str):
                     if settings2.get("data_source") == "excel" and settings2.get("excel_path") and os.path.exists(settings2["excel_path"]):
                         writer2 = ExcelOutWriter(settings2["excel_path"], col_out=settings2.get("col_out", "out"))
 
-                    def page_output_path2(base_dir: str, page_index: int) -> str:
-                        os.makedirs(base_dir, exist_ok=True)
-                        return os.path.join(base_dir, f"sayfa{int(page_index)}.png")
-
                     if writer2:
-                        # Çocukları Excel sırasıyla gez
+                        # Çocukları Excel sırasıyla gez; üretilmiş sayfalar runner'ın yazdığı manifestten
                         ordered_children2 = collect_children(settings2, log=lambda *_: None)
+                        def log2(msg: str):
+                            with open(log_path, "a", encoding="utf-8") as lf:
+                                lf.write(msg.rstrip() + "\n")
+                        manifest2 = open_book_manifest(book2, out_root2, ordered_children2, log2)
                         for ch in ordered_children2:
-                            child_name  = (ch.get("name")  or "").strip()
-                            child_class = (ch.get("class") or "").strip()
-                            base_out = os.path.join(out_root2, child_class) if child_class else out_root2
-                            child_out = os.path.join(base_out, child_name)
+                            child_out = child_output_dir(out_root2, ch)
 
                             # Bu çocuk için üretilmiş tüm sayfaları topla
-                            paths = []
-                            for p in pages2:
-                                p_idx = int(p.get("index", 0) or 0)
-                                out_p = page_output_path2(child_out, p_idx)
-                                if os.path.exists(out_p):
-                                    paths.append(out_p)
+                            paths = manifest2.existing(page_output_path(child_out, int(p.get("index", 0) or 0))
+                                                       for p in pages2)
 
                             if paths and ch.get("row_index"):
                                 # out: ; ile birleştirilmiş
@@ -1834,29 +2172,91 @@ def start_job_ui(book_id, forge_url: str):
                                 # '@sayfaN' kolonları
                                 writer2.set_pages_for_row(ch["row_index"], paths)
 
-                        writer2.save()
+                        writer2.flush()
+                        manifest2.close()
                         with open(log_path, "a", encoding="utf-8") as lf:
                             lf.write("[EXCEL] UI işlemi sonrası @sayfaN + out yazıldı.\n")
             except Exception as e:
                 with open(log_path, "a", encoding="utf-8") as lf:
                     lf.write(f"[WARN] UI sonrası Excel yazılamadı: {e}\n")
 
-            JOBS[job_id]["status"] = "finished" if proc.returncode == 0 else "failed"
+            JOB_STORE.update(job_id, status="finished" if proc.returncode == 0 else "failed")
         except Exception as e:
             with open(log_path, "a", encoding="utf-8") as f:
                 f.write(f"\n[ERR] {e}\n")
-            JOBS[job_id]["status"] = "failed"
+            JOB_STORE.update(job_id, status="failed")
         finally:
-            JOBS[job_id]["finished_at"] = now_iso()
+            JOB_STORE.update(job_id, finished_at=now_iso())
 
     threading.Thread(target=worker, daemon=True).start()
     return job_id
 
 
+# ---- Ön kontrol (arka planda) ----
+# Yüz kontrolü + üretim planı büyük listede dakikalar sürebilir: istek thread'i beklemez, sayfa durumu yoklar.
+# Sonuç kitap başına bellekte tutulur; kitap değişmediyse PREFLIGHT_TTL_SEC boyunca sayfa yeniden açıldığında
+# tekrar koşulmaz (?refresh=1 ile zorlanır).
+PREFLIGHT_TTL_SEC = float(os.environ.get("PREFLIGHT_TTL_SEC", "60"))
+_PREFLIGHTS: Dict[str, Dict[str, Any]] = {}
+_PREFLIGHTS_LOCK = threading.Lock()
+
+def _book_signature(b: dict) -> str:
+    return hashlib.sha1(json.dumps(b, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def start_preflight(book_id: str, refresh: bool = False) -> Optional[Dict[str, Any]]:
+    """Kitabın ön kontrol kaydı; koşan ya da taze bir sonuç yoksa arka planda başlatır. Kitap yoksa None."""
+    b = read_book(book_id)
+    if not b:
+        return None
+    sig = _book_signature(b)
+    with _PREFLIGHTS_LOCK:
+        pf = _PREFLIGHTS.get(book_id)
+        if pf and (pf["status"] == "running" or (
+                not refresh and pf["sig"] == sig and time.time() - pf["finished"] < PREFLIGHT_TTL_SEC)):
+            return pf
+        pf = {"status": "running", "phase": "liste okunuyor", "sig": sig, "started": time.time(), "finished": 0.0,
+              "n_children": 0, "sm": None, "plan": None, "error": None}
+        _PREFLIGHTS[book_id] = pf
+    threading.Thread(target=_run_preflight, args=(b, pf), daemon=True).start()
+    return pf
+
+def _run_preflight(b: dict, pf: Dict[str, Any]):
+    try:
+        children = list(iter_children(b.get("settings", {}) or {}, log=lambda *_: None, check_faces=False))
+        pf.update(n_children=len(children), phase="yüzler kontrol ediliyor")
+        sm = face_preflight_index().run(ch["face"] for ch in children)
+        pf["phase"] = "üretim planı"
+        plan = plan_book_outputs(b, children, face_shas={p: r.get("sha1") for p, r in sm.pop("results").items()})
+        sm["n_problems"], sm["problems"] = len(sm["problems"]), sm["problems"][:200]     # sayfada ilk 200
+        pf.update(sm=sm, plan=plan, status="done")
+    except Exception as e:
+        pf.update(status="failed", error=str(e))
+    finally:
+        pf["finished"] = time.time()
+
+@app.route("/books/<book_id>/preflight")
+def ui_book_preflight(book_id):
+    """Yüz ön kontrolü + üretim planı; arka planda koşar, sayfa bitene dek durumu yoklar."""
+    pf = start_preflight(book_id, refresh=bool(request.args.get("refresh")))
+    if pf is None: abort(404)
+    if request.args.get("refresh"):
+        return redirect(url_for("ui_book_preflight", book_id=book_id))
+    pf = dict(pf, age=int(time.time() - pf["finished"]) if pf["finished"] else 0)
+    return render_template_string(PREFLIGHT_HTML, b=read_book(book_id), title=f"{APP_TITLE} · Ön kontrol", pf=pf,
+                                  sm=pf["sm"] or {}, problems=(pf["sm"] or {}).get("problems", []),
+                                  plan=pf["plan"] or {})
+
+@app.route("/books/<book_id>/preflight/status")
+def ui_book_preflight_status(book_id):
+    pf = _PREFLIGHTS.get(book_id)
+    if not pf: abort(404)
+    return {"status": pf["status"], "phase": pf["phase"], "n_children": pf["n_children"],
+            "elapsed": int((pf["finished"] or time.time()) - pf["started"])}
+
 @app.route("/books/<book_id>/run", methods=["POST"])
 def ui_run_book(book_id):
     if not read_book(book_id): abort(404)
-    job_id = start_job(book_id); flash(f"İş (API) başlatıldı: {job_id[:8]}")
+    job_id = start_job(book_id, debug_cn=bool(request.form.get("debug_cn"))); flash(f"İş (API) başlatıldı: {job_id[:8]}")
     return redirect(url_for("ui_book_pages", book_id=book_id))
 
 @app.route("/books/<book_id>/run-ui", methods=["POST"])
@@ -1871,25 +2271,45 @@ def ui_run_book_ui(book_id):
         flash(f"Hata: {e}")
     return redirect(url_for("ui_book_pages", book_id=book_id))
 
+@app.route("/books/<book_id>/excel/flush", methods=["POST"])
+def ui_excel_flush(book_id):
+    """Çalışan işin Excel tamponunu beklemeden diske yazar."""
+    try:
+        r = buffered_writer.flush_registered(book_id)
+    except Exception as e:
+        flash(f"Excel yazılamadı: {e}"); r = False
+    else:
+        flash("Bu kitap için çalışan Excel yazıcısı yok." if r is None else
+              "Excel yazıldı." if r else "Excel zaten güncel.")
+    return redirect(request.referrer or url_for("ui_book_pages", book_id=book_id))
+
 @app.route("/jobs/<job_id>")
 def ui_job_status(job_id):
-    j = JOBS.get(job_id)
+    j = JOB_STORE.get(job_id)
     if not j: abort(404)
-    log = ""
-    if os.path.exists(j["log_path"]):
-        with open(j["log_path"], "r", encoding="utf-8") as f:
-            log = f.read()
+    tc = JOB_STORE.task_counts(job_id)
+    mp = OutputManifest.for_book(j["book_id"]) if os.path.exists(manifest_path(j["book_id"])) else None
+    out_count = mp.count() if mp else "-"
+    if mp: mp.close()
+    # Yalnız son parça sayfaya gömülür; daha eskisi "Daha eski" ile ofsetten yüklenir, canlı akış bu parçanın sonundan devam eder
+    chunk = progress_hub.log_chunk(j["log_path"])
     html = f"""
     {{% extends "base.html" %}}{{% block content %}}
       <div class="panel">
         <h2>İş: {job_id}</h2>
         <p>Durum: <span id="job-status" class="status">{j['status']}</span></p>
         <p>Tür: <code>{j.get('kind','api')}</code></p>
+        <p class="muted">Görevler: bitti {tc['done']} · hata {tc['failed']} · çalışıyor {tc['running']} · kuyrukta {tc['queued']}
+          · kitap çıktıları (manifest): {out_count}</p>
         <p>Kitap: <a href="{{{{ url_for('ui_book_pages', book_id='{j['book_id']}') }}}}">{j['book_id']}</a></p>
+        <form method="post" action="{{{{ url_for('ui_excel_flush', book_id='{j['book_id']}') }}}}" style="display:inline;">
+          <button class="btn" type="submit">💾 Excel'i şimdi yaz</button>
+        </form>
         <div class="row">
           <div class="col" style="min-width:320px;flex:2 1 520px">
             <label>Log</label>
-            <pre id="logbox" style="white-space: pre-wrap; background:#0b0e12; padding:12px; border-radius:10px; border:1px solid #1f2732; max-height:60vh; overflow:auto;">{log}</pre>
+            <button class="btn" type="button" id="log-older" style="{'' if chunk['start'] > 0 else 'display:none;'}">⬆ Daha eski</button>
+            <pre id="logbox" style="white-space: pre-wrap; background:#0b0e12; padding:12px; border-radius:10px; border:1px solid #1f2732; max-height:60vh; overflow:auto;">{{{{ log_text }}}}</pre>
           </div>
           <div class="col" style="min-width:260px;flex:1 1 260px">
             <label>Son Önizleme</label>
@@ -1915,15 +2335,31 @@ def ui_job_status(job_id):
           const img      = document.getElementById('preview');
           const pbar     = document.getElementById('pbar');
           const ppct     = document.getElementById('ppct');
-          const es = new EventSource("{{{{ url_for('job_stream', job_id='{job_id}') }}}}");
+          const es = new EventSource("{{{{ url_for('job_stream', job_id='{job_id}') }}}}?after={chunk['end']}");
           const previewUrl = "{{{{ url_for('job_preview', job_id='{job_id}') }}}}";
+          const olderBtn = document.getElementById('log-older');
+          let logStart = {chunk['start']};
+          olderBtn.addEventListener('click', () => {{
+            fetch("{{{{ url_for('job_log_chunk', job_id='{job_id}') }}}}?before=" + logStart)
+              .then(r => r.json()).then(c => {{
+                const h = logbox.scrollHeight;
+                logbox.textContent = c.text + logbox.textContent;
+                logbox.scrollTop += logbox.scrollHeight - h;
+                logStart = c.start;
+                if (logStart <= 0) olderBtn.style.display = 'none';
+              }});
+          }});
           es.addEventListener('log', e => {{
             logbox.textContent += (logbox.textContent.endsWith("\\n") ? "" : "\\n") + e.data;
             logbox.scrollTop = logbox.scrollHeight;
           }});
           es.addEventListener('image', e => {{
-            img.src = previewUrl + "?ts=" + e.data;
-            img.style.display = 'block';
+            // önce olaya gömülü küçük önizleme, ardından 512px WebP/JPEG (ETag'li; aynı görselde 304)
+            let d; try {{ d = JSON.parse(e.data); }} catch (_) {{ d = {{ts: e.data}}; }}
+            if (d.thumb) {{ img.src = d.thumb; img.style.display = 'block'; }}
+            const full = new Image();
+            full.onload = () => {{ img.src = full.src; img.style.display = 'block'; }};
+            full.src = previewUrl + "?size=512&h=" + (d.h || d.ts);
           }});
           es.addEventListener('progress', e => {{
             const v = Math.max(0, Math.min(100, parseInt(e.data || '0', 10)));
@@ -1942,64 +2378,67 @@ def ui_job_status(job_id):
       </script>
     {{% endblock %}}
     """
-    return render_template_string(html, title=f"İş · {job_id}")
+    return render_template_string(html, title=f"İş · {job_id}", log_text=chunk["text"])
 
 @app.route("/jobs/<job_id>/stream")
 def job_stream(job_id):
-    j = JOBS.get(job_id)
+    j = JOB_STORE.get(job_id)
     if not j: abort(404)
-    path = j["log_path"]
-    kind = j.get("kind","api")
+    # Tüm istemciler işin ortak yayıncısına abone olur (log izleme + Forge progress yoklaması iş/backend başına tek)
+    backends = SD_BACKENDS if j.get("kind", "api") == "api" else []
+    feed = progress_hub.job_feed(job_id, j["log_path"], lambda: JOB_STORE.get(job_id), backends,
+                                 image_data=preview_event_data)
+    # Yeniden bağlanan tarayıcı Last-Event-ID gönderir (log olaylarının id'si = log dosyası bayt ofseti)
+    after = request.headers.get("Last-Event-ID") or request.args.get("after")
+    after = int(after) if after and after.isdigit() else None
     def generate():
-        while not os.path.exists(path):
-            if JOBS.get(job_id, {}).get("status") != "running": break
-            time.sleep(0.2)
-        last_img_ts = 0
-        last_prog = -1
+        sub = feed.subscribe(after)
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                f.seek(0, os.SEEK_END)
-                while True:
-                    line = f.readline()
-                    if line:
-                        yield f"event: log\ndata: {line.rstrip()}\n\n"
-                    else:
-                        li = JOBS.get(job_id, {}).get("last_image")
-                        if li and os.path.exists(li):
-                            ts = int(os.path.getmtime(li))
-                            if ts != last_img_ts:
-                                last_img_ts = ts
-                                yield f"event: image\ndata: {ts}\n\n"
-                        if kind == "api":
-                            try:
-                                resp = requests.get(SD_BASE + "/sdapi/v1/progress?skip_current_image=true", timeout=2)
-                                if resp.ok:
-                                    pj = resp.json() or {}
-                                    pct = int(round(float(pj.get("progress") or 0.0) * 100))
-                                    if pct != last_prog:
-                                        last_prog = pct
-                                        yield f"event: progress\ndata: {pct}\n\n"
-                            except Exception:
-                                pass
-                        st = JOBS.get(job_id, {}).get("status")
-                        if st != "running":
-                            if last_prog < 100:
-                                yield "event: progress\ndata: 100\n\n"
-                            yield f"event: done\ndata: {st}\n\n"
-                            break
-                        time.sleep(0.5)
-        except GeneratorExit:
-            return
+            for ev in sub:
+                if ev[0] == "ping":
+                    yield ": ping\n\n"
+                elif len(ev) > 2:
+                    yield f"id: {ev[2]}\nevent: {ev[0]}\ndata: {ev[1]}\n\n"
+                else:
+                    yield f"event: {ev[0]}\ndata: {ev[1]}\n\n"
+        finally:
+            sub.close()
     return Response(stream_with_context(generate()), mimetype="text/event-stream")
 
+@app.route("/jobs/<job_id>/log")
+def job_log_chunk(job_id):
+    j = JOB_STORE.get(job_id)
+    if not j: abort(404)
+    before = request.args.get("before", type=int)
+    limit = min(request.args.get("limit", progress_hub.LOG_CHUNK, type=int), 1024 * 1024)
+    return progress_hub.log_chunk(j["log_path"], before, limit)
+
+def preview_event_data(path: str, ts: int) -> str:
+    """SSE 'image' olayı: mtime + içerik hash'i + gömülü küçük önizleme (ilk boyama ek istek beklemez)."""
+    svc = preview_service.default_service()
+    return json.dumps({"ts": ts, "h": svc.source_hash(path)[:20], "thumb": svc.inline(path)})
+
 @app.route("/jobs/<job_id>/preview")
 def job_preview(job_id):
-    j = JOBS.get(job_id)
+    j = JOB_STORE.get(job_id)
     if not j: abort(404)
     p = j.get("last_image")
     if not p or not os.path.exists(p): abort(404)
-    resp = send_file(p, mimetype="image/png"); resp.headers["Cache-Control"] = "no-store"
+    size = request.args.get("size", type=int)
+    if not size:
+        # tam çözünürlük (indirme/büyütme için)
+        resp = send_file(p, mimetype="image/png"); resp.headers["Cache-Control"] = "no-store"
+        return resp
+    # küçültülmüş WebP/JPEG: içerik hash'inden ETag; aynı görsel yeniden istenirse 304
+    fmt = preview_service.best_format(request.headers.get("Accept", ""))
+    thumb, etag = preview_service.default_service().get(p, size, fmt)
+    resp = send_file(thumb, mimetype=preview_service.MIMETYPES[fmt], etag=etag, conditional=True)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["Vary"] = "Accept"
     return resp
 
 if __name__ == "__main__":
+    # debug reloader'ın ebeveyn sürecinde değil, asıl sunan süreçte hemen (ilk isteği beklemeden)
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        startup_once()
     app.run(host="127.0.0.1", port=5055, debug=True)
@@ -0,0 +1,153 @@
+# bench_pipeline.py
+# Uçtan uca yük benchmark'ı: sahte Forge backend'leri (mock_forge) süreç içinde açılır, sentetik liste + yüzlerle
+# run_book_via_api (ya da runner_api) koşulur; süre, sayfa/sn, aşama süreleri (p50/p95), backend doluluğu,
+# enjekte edilen hatalar ve progress yoklama sayıları raporlanır. Canlı SD WebUI gerekmez.
+# Kullanım: python bench_pipeline.py [--children 50] [--pages 4] [--backends 2] [--latency uniform:0.2,0.4]
+#                                    [--error-rate 0.02] [--concurrency 1] [--reactor] [--progress-clients 5]
+#                                    [--runner app|runner_api] [--result-cache] [--keep]
+import argparse, contextlib, csv, json, os, shutil, statistics, sys, tempfile, time
+
+from mock_forge import MockForge
+
+
+def _pct(vals, q):
+    if not vals:
+        return 0.0
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(round(q * (len(vals) - 1))))]
+
+
+def make_roster(root: str, children: int, size: int = 256):
+    from PIL import Image
+    faces = os.path.join(root, "faces")
+    os.makedirs(faces, exist_ok=True)
+    rows = []
+    for i in range(children):
+        Image.new("RGB", (size, size), ((i * 37) % 256, (i * 91) % 256, (i * 53) % 256)).save(
+            os.path.join(faces, f"c{i}.jpg"), quality=85)
+        rows.append({"@photo": f"c{i}.jpg", "Ad": f"Çocuk{i}", "Soyad": "Test", "Sınıf": f"{i % 4 + 1}A",
+                     "Cinsiyet": "kız" if i % 2 else "erkek"})
+    path = os.path.join(root, "liste.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=list(rows[0]))
+        w.writeheader()
+        w.writerows(rows)
+    return faces, path
+
+
+def make_book(book_id: str, root: str, faces: str, roster: str, pages: int, size: int, reactor: bool, ckpts: int):
+    return {
+        "id": book_id, "name": "bench",
+        "settings": {"data_source": "excel", "excel_path": roster, "faces_dir": faces,
+                     "output_root": os.path.join(root, "out"), "col_photo": "@photo", "col_first": "Ad",
+                     "col_last": "Soyad", "col_class": "Sınıf", "poses_dir": ""},
+        "pages": [{"id": f"p{i}", "index": i, "prompt": "a {Cinsiyet} named {Ad}, page " + str(i),
+                   "negative_prompt": "blurry", "seed": 1000 + i, "width": size, "height": size,
+                   "sampling_steps": 20, "checkpoint": f"model{i % ckpts}" if ckpts > 1 else "",
+                   "use_controlnet": True, "use_reactor": reactor} for i in range(1, pages + 1)],
+    }
+
+
+def stage_stats(events_path: str):
+    """[OK] olaylarındaki timings alanlarından aşama başına (p50, p95) saniye."""
+    per = {}
+    try:
+        with open(events_path, "r", encoding="utf-8") as f:
+            for line in f:
+                ev = json.loads(line)
+                for k, v in (ev.get("timings") or {}).items():
+                    per.setdefault(k, []).append(float(v))
+    except FileNotFoundError:
+        pass
+    return {k: (statistics.median(v), _pct(v, 0.95), len(v)) for k, v in per.items()}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Sahte Forge ile uçtan uca yük benchmark'ı")
+    ap.add_argument("--children", type=int, default=50)
+    ap.add_argument("--pages", type=int, default=4)
+    ap.add_argument("--size", type=int, default=512, help="Sayfa genişlik/yükseklik")
+    ap.add_argument("--backends", type=int, default=2)
+    ap.add_argument("--concurrency", type=int, default=1, help="Backend başına eşzamanlı GPU isteği")
+    ap.add_argument("--latency", default="uniform:0.2,0.4", help="txt2img gecikme dağılımı")
+    ap.add_argument("--swap-latency", default="fixed:0.5", help="Model değişimi gecikmesi")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="txt2img hata oranı (503)")
+    ap.add_argument("--checkpoints", type=int, default=1, help="Sayfalara dağıtılan farklı checkpoint sayısı")
+    ap.add_argument("--reactor", action="store_true", help="Sayfalarda REActor açık")
+    ap.add_argument("--progress-clients", type=int, default=0, help="İş boyunca progress dinleyen istemci sayısı")
+    ap.add_argument("--runner", choices=("app", "runner_api"), default="app")
+    ap.add_argument("--result-cache", action="store_true", help="Sonuç önbelleği açık (varsayılan kapalı)")
+    ap.add_argument("--keep", action="store_true", help="Geçici klasörü silme")
+    args = ap.parse_args()
+
+    # Modüller env'i import anında okur
+    os.environ.setdefault("RESULT_CACHE", "1" if args.result_cache else "0")
+    os.environ.setdefault("FORGE_BACKOFF", "0.05")
+
+    root = tempfile.mkdtemp(prefix="bench_pipeline_")
+    book_id = f"bench-{os.getpid()}"
+    mocks = [MockForge(latency={"txt2img": args.latency, "options_set": args.swap_latency},
+                       errors={"txt2img": f"{args.error_rate}:503"} if args.error_rate else None,
+                       concurrency=args.concurrency, seed=i) for i in range(args.backends)]
+    urls = [m.start() for m in mocks]
+    listeners = []
+    try:
+        faces, roster = make_roster(root, args.children)
+        book = make_book(book_id, root, faces, roster, args.pages, args.size, args.reactor, args.checkpoints)
+        if args.progress_clients:
+            import progress_hub
+            for u in urls:
+                bp = progress_hub.backend_progress(u)
+                for _ in range(args.progress_clients):
+                    bp.acquire()
+                    listeners.append(bp)
+
+        log_path = os.path.join(root, "bench.log")
+        saved = []
+        t0 = time.perf_counter()
+        # iş çıktısı rapora karışmasın: app kendi log dosyasına yazar, runner_api'nin print'leri .stdout'a
+        with open(log_path + ".stdout", "w", encoding="utf-8") as lf, contextlib.redirect_stdout(lf):
+            if args.runner == "app":
+                import app
+                app.run_book_via_api(book, log_path=log_path, backends=urls,
+                                     progress_cb=lambda i: saved.append(i) if i.get("event") == "save" else None)
+            else:
+                import runner_api
+                res = runner_api.run_book_via_api(book, book["pages"], faces_dir=faces, out_dir=os.path.join(root, "out"),
+                                                  api_base=urls[0], debug_save_prepost=False)
+                saved = res.get("items") or []
+        elapsed = time.perf_counter() - t0
+
+        total = args.children * args.pages
+        print(f"runner={args.runner} çocuk={args.children} sayfa={args.pages} görev={total} "
+              f"backend={args.backends}×{args.concurrency} txt2img={args.latency} hata={args.error_rate}")
+        print(f"süre        : {elapsed:8.2f}s  | kaydedilen {len(saved)}/{total} | {len(saved) / elapsed:6.2f} sayfa/sn")
+        for name, (p50, p95, n) in sorted(stage_stats(os.path.splitext(log_path)[0] + ".events.jsonl").items()):
+            print(f"{name:<12}: p50 {p50 * 1000:7.1f} ms | p95 {p95 * 1000:7.1f} ms | n={n}")
+        for u, m in zip(urls, mocks):
+            st = m.stats
+            req = st["requests"]
+            print(f"{u}: görsel={st['images']} doluluk={st['busy_sec'] / elapsed / m.concurrency:5.1%} "
+                  f"en çok sıra={st['max_queued']} model değişimi={st['model_swaps']} "
+                  f"hata={sum(st['errors'].values())} progress={req.get('progress', 0)} options={req.get('options_get', 0)}"
+                  f"+{req.get('options_set', 0)}")
+    finally:
+        for bp in listeners:
+            bp.release()
+        for m in mocks:
+            m.stop()
+        # benchmark kitabının manifesti ve geçici klasör
+        mdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "manifests")
+        for ext in ("", "-wal", "-shm"):
+            try:
+                os.remove(os.path.join(mdir, f"{book_id}.sqlite3{ext}"))
+            except OSError:
+                pass
+        if args.keep:
+            print(f"[INFO] Geçici klasör: {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
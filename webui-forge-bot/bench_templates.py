@@ -0,0 +1,85 @@
+# bench_templates.py
+# Prompt şablonu mikro-benchmark'ı: eski (her çağrıda değişken sözlüğü + varyant normalizasyonu)
+# ile derlenmiş şablon + çocuk başına indeks karşılaştırması, sentetik 10k satırlık liste üzerinde.
+# Kullanım: python bench_templates.py [--rows 10000] [--cols 40] [--pages 2]
+import argparse, random, time
+from typing import Any, Dict
+
+from prompt_templates import (GENDER_KEYS, VAR_TOKEN_RE, _gender_en, _make_key_variants,
+                              build_var_index, compile_template)
+
+_variants_uncached = _make_key_variants.__wrapped__
+
+
+def legacy_render(text: str, child: Dict[str, Any]) -> str:
+    """Önceki render_text_template'in birebir karşılığı (önbelleksiz varyantlar)."""
+    if not text:
+        return text
+    raw_vars: Dict[str, str] = {
+        "name": child.get("name", ""), "class": child.get("class", ""),
+        "photo": child.get("face", ""), "@photo": (child.get("vars", {}) or {}).get("@photo", ""),
+    }
+    for k, v in (child.get("vars") or {}).items():
+        val = "" if v is None else str(v)
+        for key_variant in _variants_uncached(k):
+            raw_vars[key_variant] = val
+    gender_keys = set()
+    for cand in ["Cinsiyet", "cinsiyet", "Gender", "gender", "GENDER"]:
+        gender_keys.update(_variants_uncached(cand))
+    gender_raw = next((raw_vars[gk] for gk in GENDER_KEYS if gk in raw_vars and raw_vars[gk]), None)
+    if gender_raw is not None:
+        mapped = _gender_en(gender_raw)
+        for gk in gender_keys:
+            raw_vars[gk] = mapped
+
+    def repl(m):
+        key = (m.group(1) or "").strip()
+        for kv in _variants_uncached(key):
+            if kv in raw_vars:
+                return raw_vars[kv]
+        return raw_vars.get(key, raw_vars.get(key.lower(), m.group(0)))
+    return VAR_TOKEN_RE.sub(repl, text)
+
+
+def synthetic_roster(rows: int, cols: int, seed: int = 7):
+    rnd = random.Random(seed)
+    headers = ["Öğrenci Adı", "Soyadı", "Sınıfı", "Cinsiyet", "@photo"] + [f"Sütun Başlığı {i}" for i in range(cols - 5)]
+    for r in range(rows):
+        vals = {h: f"{h[:3]}{rnd.randint(0, 9999)}" for h in headers}
+        vals["Cinsiyet"] = rnd.choice(["kız", "erkek"])
+        yield {"name": f"Çocuk {r}", "class": f"{r % 12}A", "face": f"/faces/{r}.png", "vars": vals, "row_index": r + 2}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Prompt şablonu mikro-benchmark")
+    ap.add_argument("--rows", type=int, default=10000)
+    ap.add_argument("--cols", type=int, default=40)
+    ap.add_argument("--pages", type=int, default=2)
+    args = ap.parse_args()
+
+    pages = [(f"a {{Cinsiyet}} named {{öğrenci adı}} {{soyadi}}, class {{Sınıfı}}, page {i}, {{sutun_basligi_{i}}}",
+              "ugly, blurry, {Unknown Var}") for i in range(args.pages)]
+    children = list(synthetic_roster(args.rows, args.cols))
+    renders = len(children) * len(pages) * 2
+
+    t0 = time.perf_counter()
+    old = [legacy_render(pr, ch) + "|" + legacy_render(npr, ch) for ch in children for pr, npr in pages]
+    t_old = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    compiled = [(compile_template(pr), compile_template(npr)) for pr, npr in pages]
+    new = []
+    for ch in children:
+        idx = build_var_index(ch)
+        new.extend(cp.render(idx) + "|" + cn.render(idx) for cp, cn in compiled)
+    t_new = time.perf_counter() - t0
+
+    assert old == new, "derlenmiş şablon çıktısı eski yol ile aynı değil"
+    print(f"satır={args.rows} sütun={args.cols} sayfa={args.pages} render={renders}")
+    print(f"eski      : {t_old:8.3f}s  ({t_old / renders * 1e6:7.1f} µs/render)")
+    print(f"derlenmiş : {t_new:8.3f}s  ({t_new / renders * 1e6:7.1f} µs/render)")
+    print(f"hızlanma  : {t_old / t_new:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
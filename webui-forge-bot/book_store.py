@@ -0,0 +1,150 @@
+# book_store.py
+# Kitap deposu (data/books/<id>.json) için önbellekli okuma/yazma katmanı.
+# - get(id): dosyanın (mtime, boyut) imzası değişmediyse bellekteki kopya; okuma asla diske yazmaz.
+#   Eksik varsayılan ayarlar yalnız bellekte doldurulur (normalize); kalıcı hale getirme migrate() ile bir kez.
+# - list_summaries(): liste sayfası için hafif özet (ad, sayfa sayısı, kaynak, çıkış, tarih);
+#   klasör taramasında yalnız stat, yalnız değişen dosyalar yeniden ayrıştırılır.
+# - save(book): kitap başına kilit altında geçici dosya + os.replace (yarım yazılmış JSON kalmaz).
+from __future__ import annotations
+import copy, json, os, threading, time, uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+Sig = Tuple[int, int]
+
+
+def _sig(path: str) -> Optional[Sig]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def summarize_book(book: Dict[str, Any]) -> Dict[str, Any]:
+    s = book.get("settings") or {}
+    return {
+        "id": book.get("id"),
+        "name": book.get("name", ""),
+        "page_count": len(book.get("pages") or []),
+        "settings": {k: s.get(k, "") for k in ("data_source", "excel_path", "faces_dir", "output_root")},
+        "created_at": book.get("created_at", ""),
+        "updated_at": book.get("updated_at", ""),
+    }
+
+
+class BookStore:
+    """
+    - get(book_id) -> Optional[dict]      (derin kopya: çağıran değiştirse de önbellek bozulmaz)
+    - list_summaries() -> List[dict]      (updated_at/created_at'e göre yeniden eskiye)
+    - save(book), delete(book_id)
+    - migrate() -> int                    (varsayılanları eksik kitapları diske yazar; yazılan kitap sayısı)
+    normalize(book) -> book: okunan kitaba bellekte uygulanan varsayılan doldurma.
+    """
+    def __init__(self, books_dir: str, normalize: Optional[Callable[[dict], dict]] = None):
+        self.books_dir = books_dir
+        self.normalize = normalize or (lambda b: b)
+        os.makedirs(books_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._book_locks: Dict[str, threading.Lock] = {}
+        self._cache: Dict[str, Tuple[Sig, dict, dict]] = {}     # id -> (imza, kitap, özet)
+        self.stats = {"hits": 0, "loads": 0, "writes": 0}
+
+    def path(self, book_id: str) -> str:
+        return os.path.join(self.books_dir, f"{book_id}.json")
+
+    def _book_lock(self, book_id: str) -> threading.Lock:
+        with self._lock:
+            return self._book_locks.setdefault(book_id, threading.Lock())
+
+    def _load(self, book_id: str) -> Optional[Tuple[Sig, dict, dict]]:
+        p = self.path(book_id)
+        sig = _sig(p)
+        if sig is None:
+            with self._lock:
+                self._cache.pop(book_id, None)
+            return None
+        with self._lock:
+            hit = self._cache.get(book_id)
+        if hit and hit[0] == sig:
+            self.stats["hits"] += 1
+            return hit
+        with open(p, "r", encoding="utf-8") as f:
+            book = self.normalize(json.load(f))
+        book.setdefault("id", book_id)
+        entry = (sig, book, summarize_book(book))
+        self.stats["loads"] += 1
+        with self._lock:
+            self._cache[book_id] = entry
+        return entry
+
+    def get(self, book_id: str) -> Optional[dict]:
+        entry = self._load(book_id)
+        return copy.deepcopy(entry[1]) if entry else None
+
+    def list_summaries(self) -> List[dict]:
+        out = []
+        for e in os.scandir(self.books_dir):
+            if not (e.name.endswith(".json") and e.is_file()):
+                continue
+            try:
+                entry = self._load(e.name[:-5])
+            except Exception:
+                continue
+            if entry:
+                out.append(dict(entry[2]))
+        out.sort(key=lambda b: b.get("updated_at") or b.get("created_at") or "", reverse=True)
+        return out
+
+    def save(self, book: dict):
+        book_id = book["id"]
+        p = self.path(book_id)
+        data = json.dumps(book, ensure_ascii=False, indent=2)
+        with self._book_lock(book_id):
+            tmp = f"{p}.{uuid.uuid4().hex[:8]}.tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(data)
+                for attempt in range(5):
+                    try:
+                        os.replace(tmp, p)
+                        break
+                    except PermissionError:
+                        # Windows: dosya o an başka süreçte açıksa kısa bekleyip yeniden dene
+                        if attempt == 4:
+                            raise
+                        time.sleep(0.05 * (attempt + 1))
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            sig = _sig(p)
+            stored = self.normalize(json.loads(data))
+            with self._lock:
+                self._cache[book_id] = (sig, stored, summarize_book(stored))
+        self.stats["writes"] += 1
+
+    def delete(self, book_id: str) -> bool:
+        with self._book_lock(book_id):
+            with self._lock:
+                self._cache.pop(book_id, None)
+            try:
+                os.remove(self.path(book_id))
+                return True
+            except FileNotFoundError:
+                return False
+
+    def migrate(self) -> int:
+        """Bir kerelik yükseltme: normalize'ın eklediği varsayılanları kalıcı yapar (değişmeyen dosyaya dokunmaz)."""
+        written = 0
+        for e in os.scandir(self.books_dir):
+            if not (e.name.endswith(".json") and e.is_file()):
+                continue
+            try:
+                with open(e.path, "r", encoding="utf-8") as f:
+                    raw = json.load(f)
+            except Exception:
+                continue
+            norm = self.normalize(copy.deepcopy(raw))
+            if norm != raw and norm.get("id"):
+                self.save(norm)
+                written += 1
+        return written
@@ -0,0 +1,125 @@
+# buffered_writer.py
+# Excel/CSV çıktı yazıcıları için tamponlu, debounce'lu kaydetme.
+# - Satır güncellemeleri bellekte birikir; dosya ancak FLUSH_ROWS satır ya da FLUSH_SEC saniye dolunca
+#   (ve iş sonunda flush() ile) yazılır. 2.000 satırlık bir listede her çocukta tüm workbook'u yeniden yazmak yerine.
+# - Yazım geçici dosyaya yapılır, os.replace ile yerine konur: yarıda kesilen kayıt listeyi bozmaz.
+# - Panel için: register(key, writer) / flush_registered(key) ile çalışan işin tamponu anında yazdırılabilir.
+# - Windows'ta okunmak üzere açık dosyanın üstüne os.replace yapılamaz: akış halinde okunan dosya
+#   reading(path) ile işaretlenir, o yola yazan yazıcılar okuma bitene dek kaydı tamponda bekletir.
+from __future__ import annotations
+import abc, contextlib, os, threading, time, uuid
+from typing import Callable, Dict, Optional
+
+FLUSH_SEC = float(os.environ.get("EXCEL_FLUSH_SEC", "30"))
+FLUSH_ROWS = int(os.environ.get("EXCEL_FLUSH_ROWS", "50"))
+# Okuma sürerken kaydı beklet (yalnız Windows'ta gerekir; POSIX'te okuyucu eski dosyayı okumayı sürdürür)
+DEFER_WHILE_READING = os.name == "nt"
+
+
+def atomic_replace(path: str, write_fn: Callable[[str], None]):
+    """write_fn(tmp_path) ile aynı klasörde geçici dosyaya yazar, sonra os.replace ile yerine koyar."""
+    d, base = os.path.split(os.path.abspath(path))
+    tmp = os.path.join(d, f".{base}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        write_fn(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+# ----- akış halinde okunan dosyalar -----
+_READING: Dict[str, int] = {}
+_READING_LOCK = threading.Lock()
+
+
+def _path_key(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+
+@contextlib.contextmanager
+def reading(path: str):
+    """Blok süresince path okunuyor sayılır (iç içe / birden çok okuyucu sayılır)."""
+    key = _path_key(path)
+    with _READING_LOCK:
+        _READING[key] = _READING.get(key, 0) + 1
+    try:
+        yield
+    finally:
+        with _READING_LOCK:
+            n = _READING.pop(key, 1) - 1
+            if n > 0:
+                _READING[key] = n
+
+
+def is_reading(path: str) -> bool:
+    with _READING_LOCK:
+        return _path_key(path) in _READING
+
+
+class BufferedSaveMixin(abc.ABC):
+    """
+    Alt sınıf:
+      - _write_to(path) : tüm içeriği verilen yola yazar (soyut: eksikse sınıf örneklenemez)
+      - içerik değişince _touch() çağırır (değer aynıysa çağırmaz)
+    Dışarıya: save() (politikaya göre; yazdıysa True), flush() (bekleyen varsa hemen yazar), pending
+    DEFER_WHILE_READING açıkken dosya reading() altındaysa save()/flush() yazmaz (False); tampon sonraki
+    save()/flush()'a kalır.
+    """
+    path: str
+
+    def _init_buffer(self, flush_sec: Optional[float] = None, flush_rows: Optional[int] = None):
+        self.flush_sec = FLUSH_SEC if flush_sec is None else float(flush_sec)
+        self.flush_rows = FLUSH_ROWS if flush_rows is None else int(flush_rows)
+        self.pending = 0
+        self._last_flush = time.monotonic()
+        self._buf_lock = threading.RLock()
+
+    def _touch(self, n: int = 1):
+        with self._buf_lock:
+            self.pending += n
+
+    @abc.abstractmethod
+    def _write_to(self, path: str):
+        """Tüm içeriği path'e yazar (atomic_replace geçici yolu verir)."""
+
+    def save(self, force: bool = False) -> bool:
+        with self._buf_lock:
+            if not self.pending:
+                return False
+            due = (self.pending >= self.flush_rows
+                   or time.monotonic() - self._last_flush >= self.flush_sec)
+            if not (force or due):
+                return False
+            if DEFER_WHILE_READING and is_reading(self.path):
+                return False
+            atomic_replace(self.path, self._write_to)
+            self.pending = 0
+            self._last_flush = time.monotonic()
+            return True
+
+    def flush(self) -> bool:
+        return self.save(force=True)
+
+
+# ----- çalışan yazıcılar (panelden anında flush için) -----
+_REGISTRY: Dict[str, BufferedSaveMixin] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def register(key: str, writer: BufferedSaveMixin):
+    with _REGISTRY_LOCK:
+        _REGISTRY[key] = writer
+
+
+def unregister(key: str, writer: Optional[BufferedSaveMixin] = None):
+    with _REGISTRY_LOCK:
+        if writer is None or _REGISTRY.get(key) is writer:
+            _REGISTRY.pop(key, None)
+
+
+def flush_registered(key: str) -> Optional[bool]:
+    """None: o anahtarla çalışan yazıcı yok; True/False: yazıldı mı."""
+    with _REGISTRY_LOCK:
+        w = _REGISTRY.get(key)
+    return None if w is None else w.flush()
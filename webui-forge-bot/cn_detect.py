@@ -0,0 +1,98 @@
+# cn_detect.py
+# ControlNet ön-işlemcisini (ör. instant_id_face_keypoints) sayfa başına Forge'a yaptırmak yerine
+# /controlnet/detect ile kaynak görüntü başına bir kez çalıştırır; harita birim 1'e module "none" ile gider.
+# - Harita image_cache'in disk + bellek katmanına yazılır (data/cache/images, yüz önbelleğinin yanında);
+#   anahtar: modül + çözünürlük + kaynak base64'ün sha1'i → yeniden çalıştırmalar da Forge'a gitmez.
+# - Harita alınamazsa çağıran eski davranışa döner (ham görüntü + birimin kendi modülü):
+#   uç nokta yoksa (404/405) backend iş boyunca "kullanılamaz" işaretlenir; geçici hatalar
+#   (zaman aşımı, 5xx, bağlantı) yalnız o kaynağı etkiler, sonraki kaynak yine detect dener.
+# Açmak için: CN_DETECT_KEYPOINTS=1
+from __future__ import annotations
+import hashlib, os, threading
+from typing import Callable, Dict, Optional
+
+import requests
+
+from forge_client import get_client
+from image_cache import ImageB64Cache, default_cache
+
+ENABLED = os.environ.get("CN_DETECT_KEYPOINTS", "0") == "1"
+SKIP_MODULES = {"", "none"}
+MISSING_STATUS = (404, 405)      # uç nokta yok: tekrar denemenin anlamı yok
+
+
+def map_key(module: str, res: int, src_b64: str) -> str:
+    h = hashlib.sha1(src_b64.encode("ascii", "ignore")).hexdigest()
+    return hashlib.sha1(f"cn-detect|{module}|{int(res)}|{h}".encode("utf-8")).hexdigest()
+
+
+class ControlMapCache:
+    """
+    - control_map(src_b64, module, res) -> Optional[str]
+      Önbellekte varsa harita; yoksa backend'de detect + kayıt. Kullanılamıyorsa None.
+    - available: None (denenmedi) / True / False (uç nokta yok; iş boyunca denenmez)
+    stats: detect, hits, errors (geçici hata: o kaynak ham görüntüyle gider) — worker'lardan; _lock altında
+    """
+    def __init__(self, base: str, log: Callable[[str], None] = print, cache: Optional[ImageB64Cache] = None):
+        self.base = base
+        self.log = log
+        self.cache = cache or default_cache()
+        self.available: Optional[bool] = None
+        self.stats = {"detect": 0, "hits": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, threading.Lock] = {}
+
+    def _detect(self, src_b64: str, module: str, res: int) -> Optional[str]:
+        payload = {
+            "controlnet_module": module,
+            "controlnet_input_images": [src_b64],
+            "controlnet_processor_res": int(res),
+            "controlnet_threshold_a": 64,
+            "controlnet_threshold_b": 64,
+        }
+        js = get_client(self.base).post_json("/controlnet/detect", payload, retries=1)
+        images = (js or {}).get("images") or []
+        img = images[0] if images else None
+        if not isinstance(img, str) or not img:
+            raise RuntimeError(f"detect boş döndü ({(js or {}).get('info', '')})")
+        return img.split(",", 1)[-1]
+
+    def control_map(self, src_b64: Optional[str], module: str, res: int) -> Optional[str]:
+        if not src_b64 or (module or "").strip().lower() in SKIP_MODULES or self.available is False:
+            return None
+        key = map_key(module, res, src_b64)
+        with self._lock:
+            gate = self._inflight.setdefault(key, threading.Lock())
+        with gate:   # aynı kaynak için eşzamanlı iki detect olmasın
+            hit = self.cache.get_by_key(key)
+            if hit is not None:
+                with self._lock:
+                    self.stats["hits"] += 1
+                return hit
+            if self.available is False:
+                return None
+            try:
+                m = self._detect(src_b64, module, res)
+            except requests.HTTPError as e:
+                status = getattr(e.response, "status_code", None)
+                if status in MISSING_STATUS:
+                    self.available = False
+                    self.log(f"[WARN] /controlnet/detect yok ({self.base}, HTTP {status}) → "
+                             f"birim 1 ön-işlemcisi bu iş boyunca Forge'da çalışacak.")
+                else:
+                    self._transient(e)
+                return None
+            except Exception as e:
+                self._transient(e)
+                return None
+            self.available = True
+            with self._lock:
+                self.stats["detect"] += 1
+            self.cache.put_by_key(key, m)
+            return m
+
+    def _transient(self, e: BaseException):
+        with self._lock:
+            self.stats["errors"] += 1
+        self.log(f"[WARN] /controlnet/detect geçici hata ({self.base}): {e} → bu kaynak için ön-işlemci Forge'da "
+                 f"çalışacak, sonraki kaynaklar yine denenecek.")
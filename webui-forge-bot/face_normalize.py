@@ -0,0 +1,104 @@
+# face_normalize.py
+# Yüz fotoğrafını ControlNet'e gitmeden önce normalleştirir (çocuk × hedef çözünürlük başına bir kez):
+# - EXIF yönü uygulanır (telefon fotoğrafları yan gelmesin)
+# - Yüz bölgesi etrafından kırpılır (OpenCV varsa Haar cascade, küçültülmüş gri kopya üzerinde; yoksa kırpma yok)
+# - Kısa kenar sayfanın işlemci çözünürlüğüne (target_res) indirilir, sonra PNG/base64'e kodlanır
+# Sonuç image_cache'e (yol, boyut, mtime, "face-norm-…" varyantı) yazılır: tüm sayfalar ve yeniden çalıştırmalar kullanır.
+# 12 MP fotoğraf her sayfada iki CN birimine tam boy PNG olarak gitmez (40+ MB JSON yerine ~1-2 MB).
+from __future__ import annotations
+import base64, io, os
+from typing import Optional, Tuple
+
+from image_cache import cached_png_b64, default_cache
+
+ENABLED = os.environ.get("FACE_NORMALIZE", "1") != "0"
+CROP = os.environ.get("FACE_CROP", "1") != "0"
+CROP_MARGIN = float(os.environ.get("FACE_CROP_MARGIN", "1.0"))   # yüz kutusunun her yanına, kutu boyu × margin
+DETECT_MAX_SIDE = 640
+VARIANT_VERSION = 1
+
+try:
+    import cv2  # opsiyonel: yalnız yüz kırpma için
+except Exception:
+    cv2 = None
+_CASCADE = None
+
+
+def _clamp_dim(v: int) -> int:
+    v = max(64, min(2048, int(v)))
+    return v - (v % 8)
+
+
+def target_res(w: int, h: int) -> int:
+    """Sayfa boyutundan işlemci çözünürlüğü (runner_api._compute_processor_res ile aynı kural)."""
+    short = min(_clamp_dim(w), _clamp_dim(h))
+    return max(384, min(1024, short))
+
+
+def _face_box(im) -> Optional[Tuple[int, int, int, int]]:
+    """En büyük yüzün (x, y, w, h) kutusu, tam boy koordinatlarında; OpenCV yoksa/bulunamazsa None."""
+    global _CASCADE
+    if cv2 is None:
+        return None
+    import numpy as np
+    if _CASCADE is None:
+        _CASCADE = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml"))
+    scale = min(1.0, DETECT_MAX_SIDE / max(im.size))
+    small = im.convert("L")
+    if scale < 1.0:
+        small = small.resize((max(1, int(im.size[0] * scale)), max(1, int(im.size[1] * scale))))
+    faces = _CASCADE.detectMultiScale(np.asarray(small), scaleFactor=1.1, minNeighbors=5, minSize=(32, 32))
+    if len(faces) == 0:
+        return None
+    x, y, w, h = max(faces, key=lambda f: int(f[2]) * int(f[3]))
+    return tuple(int(round(v / scale)) for v in (x, y, w, h))
+
+
+def _crop_box(size: Tuple[int, int], box: Tuple[int, int, int, int], target: int) -> Tuple[int, int, int, int]:
+    """Yüz kutusunu margin kadar genişletir; kare, en az target kenarlı (mümkünse), görüntü içine kaydırılmış."""
+    W, H = size
+    x, y, w, h = box
+    side = int(max(w, h) * (1 + 2 * CROP_MARGIN))
+    side = min(max(side, target), W, H)
+    cx, cy = x + w // 2, y + h // 2
+    left = min(max(0, cx - side // 2), W - side)
+    top = min(max(0, cy - side // 2), H - side)
+    return (left, top, left + side, top + side)
+
+
+def normalize_face(path: str, target: int, crop: bool = CROP):
+    """EXIF yönü + (varsa) yüz kırpma + kısa kenar target'a küçültme; RGB PIL görüntü döndürür."""
+    from PIL import Image, ImageOps
+    with Image.open(path) as src:
+        if not (crop and cv2 is not None) and src.format == "JPEG":
+            # kırpma yoksa tam çözmeye gerek yok: kısa kenar >= target kalacak en küçük ölçek
+            src.draft("RGB", (target, target))
+        im = ImageOps.exif_transpose(src).convert("RGB")
+    if crop:
+        box = _face_box(im)
+        if box:
+            im = im.crop(_crop_box(im.size, box, target))
+    short = min(im.size)
+    if short > target:
+        k = target / short
+        im = im.resize((max(1, round(im.size[0] * k)), max(1, round(im.size[1] * k))), Image.LANCZOS)
+    return im
+
+
+def encode_normalized_face(path: str, target: int, crop: bool = CROP) -> str:
+    buf = io.BytesIO()
+    normalize_face(path, target, crop).save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue()).decode("utf-8")
+
+
+def normalized_face_b64(path: str, target: int, crop: bool = CROP) -> str:
+    """
+    Önbellekli normalleştirilmiş yüz (base64 PNG). FACE_NORMALIZE=0 ise eski davranış (tam boy PNG).
+    Varyant anahtarı hedef çözünürlüğü ve kırpma durumunu içerir.
+    """
+    if not ENABLED:
+        return cached_png_b64(str(path), convert_rgb=True)
+    target = int(target)
+    crop = bool(crop and cv2 is not None)
+    variant = f"face-norm-v{VARIANT_VERSION}-{target}{'-crop' if crop else ''}"
+    return default_cache().get(str(path), variant, lambda p: encode_normalized_face(p, target, crop))
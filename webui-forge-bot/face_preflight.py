@@ -0,0 +1,161 @@
+# face_preflight.py
+# İş başlamadan önce yüz dosyalarının toplu ön kontrolü (thread havuzunda):
+# var mı, açılıp çözülebiliyor mu, boyutları, EXIF yönü, dosya boyutu, içerik sha1'i (çıktı özeti için).
+# - Sonuçlar (yol, mtime, boyut) anahtarıyla data/cache/faces.sqlite3'te tutulur;
+#   aynı kitap yeniden çalıştırıldığında yalnız değişen dosyalar yeniden kontrol edilir.
+# - Bozuk/eksik dosya iş ortasında read_image_to_b64 hatası yerine burada yakalanır.
+from __future__ import annotations
+import hashlib, io, json, os, sqlite3, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache", "faces.sqlite3")
+WORKERS = int(os.environ.get("FACE_PREFLIGHT_WORKERS", "8"))
+LARGE_BYTES = int(float(os.environ.get("FACE_LARGE_MB", "8")) * 1024 * 1024)
+LARGE_PIXELS = int(float(os.environ.get("FACE_LARGE_MP", "16")) * 1_000_000)
+EXIF_ORIENTATION = 0x0112
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS faces (
+    path       TEXT PRIMARY KEY,
+    mtime_ns   INTEGER NOT NULL,
+    size       INTEGER NOT NULL,
+    result     TEXT NOT NULL,
+    checked_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def check_face(path: str) -> Dict[str, Any]:
+    """
+    Tek dosya kontrolü. Dönen sözlük:
+      path, ok, error, size, width, height, format, orientation, large, sha1
+    Dosya bir kez okunur (sha1 + çözme aynı baytlardan). JPEG'ler draft modda (1/8 ölçek) çözülür:
+    kesik/bozuk dosya yakalanır, 12 MP fotoğraf tam açılmaz.
+    """
+    from PIL import Image
+    r: Dict[str, Any] = {"path": path, "ok": False, "error": None, "size": 0, "width": 0, "height": 0,
+                         "format": None, "orientation": 1, "large": False, "sha1": None}
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        r["error"] = "missing"; return r
+    except OSError as e:
+        r["error"] = f"read: {e}"; return r
+    r["size"] = len(data)
+    r["sha1"] = hashlib.sha1(data).hexdigest()
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            r["format"] = im.format
+            r["width"], r["height"] = im.size
+            try:
+                r["orientation"] = int(im.getexif().get(EXIF_ORIENTATION, 1) or 1)
+            except Exception:
+                pass
+            if im.format == "JPEG":
+                im.draft("RGB", (max(1, im.size[0] // 8), max(1, im.size[1] // 8)))
+            im.load()
+    except Exception as e:
+        r["error"] = f"corrupt: {e}"; return r
+    r["large"] = r["size"] > LARGE_BYTES or r["width"] * r["height"] > LARGE_PIXELS
+    r["ok"] = True
+    return r
+
+
+class FacePreflightIndex:
+    """
+    - check(path): önbellekte (mtime, boyut) eşleşirse kayıtlı sonuç, yoksa check_face + kayıt
+    - run(paths, workers): hepsini havuzda kontrol eder, özet döndürür (summarize; results[yol]["sha1"])
+    """
+    def __init__(self, db_path: str = DEFAULT_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._db:
+            self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _cached(self, key: str, mtime_ns: int, size: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT mtime_ns, size, result FROM faces WHERE path = ?", (key,)).fetchone()
+        if row and row[0] == mtime_ns and row[1] == size:
+            return json.loads(row[2])
+        return None
+
+    def check(self, path: str) -> Dict[str, Any]:
+        key = os.path.abspath(path)
+        try:
+            st = os.stat(key)
+        except OSError:
+            return check_face(path)          # eksik dosya: önbelleğe yazılmaz
+        hit = self._cached(key, st.st_mtime_ns, st.st_size)
+        if hit is not None and "sha1" in hit:          # sha1'siz eski kayıt bir kez yeniden kontrol edilir
+            hit["path"], hit["cached"] = path, True
+            return hit
+        r = check_face(path)
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO faces (path, mtime_ns, size, result, checked_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, st.st_mtime_ns, st.st_size, json.dumps(r), time.time()))
+        r["cached"] = False
+        return r
+
+    def run(self, paths: Iterable[str], workers: int = WORKERS) -> Dict[str, Any]:
+        uniq = list(dict.fromkeys(p for p in paths if p))
+        t0 = time.time()
+        with ThreadPoolExecutor(max_workers=max(1, int(workers))) as ex:
+            results = list(ex.map(self.check, uniq))
+        summary = summarize(results)
+        summary["elapsed"] = round(time.time() - t0, 2)
+        return summary
+
+
+def hash_files(paths: Iterable[str], workers: int = WORKERS) -> Dict[str, Optional[str]]:
+    """{yol: içerik sha1'i | None (okunamadı)} — ön kontrolle aynı havuz boyutunda."""
+    from output_manifest import file_sha1
+
+    def _one(path: str) -> Optional[str]:
+        try:
+            return file_sha1(path)
+        except OSError:
+            return None
+    uniq = list(dict.fromkeys(p for p in paths if p))
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as ex:
+        return dict(zip(uniq, ex.map(_one, uniq)))
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"total": len(results), "ok": 0, "missing": 0, "corrupt": 0, "large": 0,
+                           "rotated": 0, "cached": 0, "problems": [], "results": {}}
+    for r in results:
+        out["results"][r["path"]] = r
+        out["cached"] += 1 if r.get("cached") else 0
+        if r["ok"]:
+            out["ok"] += 1
+            out["large"] += 1 if r["large"] else 0
+            out["rotated"] += 1 if r["orientation"] not in (0, 1) else 0
+            if r["large"]:
+                out["problems"].append(r)
+        else:
+            out["missing" if r["error"] == "missing" else "corrupt"] += 1
+            out["problems"].append(r)
+    return out
+
+
+_DEFAULT: Optional[FacePreflightIndex] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_index() -> FacePreflightIndex:
+    global _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = FacePreflightIndex()
+        return _DEFAULT
@@ -0,0 +1,129 @@
+# forge_client.py
+# Forge/A1111 API için ortak HTTP istemcisi.
+# - Backend başına tek requests.Session (keep-alive + bağlantı havuzu)
+# - Uç nokta bazlı timeout tablosu
+# - Bağlantı hataları ve 5xx yanıtlarında jitter'lı üstel geri çekilme ile tekrar deneme
+#   (POST'ta bağlantı hatası yalnız istek gönderilmeden düştüyse: render iki kez yapılmasın)
+#   (model yüklenirken dönen tek bir 502 sayfayı kalıcı olarak düşürmesin)
+from __future__ import annotations
+import os, random, threading, time
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+# Yol öneki -> saniye. En uzun eşleşen önek kazanır.
+DEFAULT_TIMEOUTS: Dict[str, float] = {
+    "/sdapi/v1/txt2img": 600,
+    "/sdapi/v1/img2img": 600,
+    "/sdapi/v1/options": 600,      # POST model yüklemesini bekler
+    "/sdapi/v1/progress": 2,
+    "/reactor/image": 180,
+    "/reactor/": 5,
+    "/controlnet/detect": 120,
+    "/controlnet/": 10,
+}
+DEFAULT_TIMEOUT = 30.0
+
+RETRIES = int(os.environ.get("FORGE_RETRIES", "3"))
+BACKOFF_BASE = float(os.environ.get("FORGE_BACKOFF", "0.5"))
+BACKOFF_MAX = float(os.environ.get("FORGE_BACKOFF_MAX", "8"))
+POOL_SIZE = int(os.environ.get("FORGE_POOL_SIZE", "8"))
+
+
+def _never_sent(e: BaseException) -> bool:
+    """Hata bağlantı kurulurken mi oldu (istek gövdesi sunucuya ulaşmadı)?"""
+    if isinstance(e, requests.ConnectTimeout):
+        return True
+    if isinstance(e, requests.ConnectionError) and not isinstance(e, requests.ReadTimeout):
+        reason = getattr(e.args[0], "reason", None) if e.args else None
+        return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+    return False
+
+
+class ForgeClient:
+    """
+    Tek bir backend için istemci.
+    - request(method, path, json=None, timeout=None, retries=None) -> requests.Response
+      5xx'te son denemeye kadar tekrar dener; son yanıt olduğu gibi döner (raise_for_status çağırana kalır).
+    - GET'te bağlantı hataları ve zaman aşımları tekrarlanır. POST'ta yalnız istek sunucuya hiç ulaşmadıysa
+      (bağlantı reddi / bağlantı zaman aşımı): gönderildikten sonra kopan ya da zaman aşımına uğrayan bir
+      txt2img Forge'da zaten çalışıyor olabilir, tekrar göndermek aynı sayfayı ikinci kez render eder.
+    - 5xx yanıtları her metotta tekrarlanır.
+    """
+    def __init__(self, base: str, timeouts: Optional[Dict[str, float]] = None,
+                 retries: int = RETRIES, backoff: float = BACKOFF_BASE, backoff_max: float = BACKOFF_MAX,
+                 pool_size: int = POOL_SIZE):
+        self.base = (base or "").rstrip("/")
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+        self.retries = max(0, int(retries))
+        self.backoff = float(backoff)
+        self.backoff_max = float(backoff_max)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, int(pool_size)), max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.stats = {"requests": 0, "retries": 0}
+
+    def timeout_for(self, path: str) -> float:
+        p = path.split("?", 1)[0]
+        best, best_len = DEFAULT_TIMEOUT, -1
+        for prefix, t in self.timeouts.items():
+            if p.startswith(prefix) and len(prefix) > best_len:
+                best, best_len = t, len(prefix)
+        return best
+
+    def _sleep_backoff(self, attempt: int):
+        # "full jitter": [0, min(max, base * 2^attempt)]
+        time.sleep(random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt))))
+
+    def request(self, method: str, path: str, json: Any = None,
+                timeout: Optional[float] = None, retries: Optional[int] = None) -> requests.Response:
+        url = self.base + path
+        timeout = self.timeout_for(path) if timeout is None else timeout
+        retries = self.retries if retries is None else max(0, int(retries))
+        method = method.upper()
+        attempt = 0
+        while True:
+            self.stats["requests"] += 1
+            try:
+                r = self.session.request(method, url, json=json, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= retries or (method != "GET" and not _never_sent(e)):
+                    raise
+            else:
+                if r.status_code < 500 or attempt >= retries:
+                    return r
+                r.close()
+            self.stats["retries"] += 1
+            self._sleep_backoff(attempt)
+            attempt += 1
+
+    def get(self, path: str, **kw) -> requests.Response:
+        return self.request("GET", path, **kw)
+
+    def post(self, path: str, payload: Any = None, **kw) -> requests.Response:
+        return self.request("POST", path, json=payload, **kw)
+
+    def get_json(self, path: str, **kw) -> Any:
+        r = self.get(path, **kw); r.raise_for_status(); return r.json()
+
+    def post_json(self, path: str, payload: Any = None, **kw) -> Any:
+        r = self.post(path, payload, **kw); r.raise_for_status(); return r.json()
+
+
+_CLIENTS: Dict[str, ForgeClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(base: str) -> ForgeClient:
+    """Backend başına paylaşılan istemci (bağlantı havuzu süreç boyunca yeniden kullanılır)."""
+    key = (base or "").rstrip("/")
+    with _CLIENTS_LOCK:
+        c = _CLIENTS.get(key)
+        if c is None:
+            c = _CLIENTS[key] = ForgeClient(key)
+        return c
@@ -0,0 +1,123 @@
+# forge_meta.py
+# Forge meta listeleri (modeller, sampler'lar, stiller, CN model/modül listeleri) için backend başına önbellek.
+# - TTL içinde bellekten; TTL geçmişse bayat değer hemen döner, arka planda yenilenir (stale-while-revalidate).
+# - Hiç değer yoksa eksik listeler paralel çekilir (sayfa editörü 5 × 10 sn sırayla beklemez).
+# - Başarısız çekim: varsa eski değer korunur; yoksa kısa süreli "boş" kaydı (Forge meşgulken her açılışta beklenmez).
+# - refresh(): panelden zorla yenileme.
+from __future__ import annotations
+import os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from forge_client import get_client
+
+TTL_SEC = float(os.environ.get("FORGE_META_TTL", "300"))
+FAIL_TTL_SEC = float(os.environ.get("FORGE_META_FAIL_TTL", "30"))
+FETCH_TIMEOUT = 10
+EDITOR_PATHS = (
+    "/sdapi/v1/sd-models",
+    "/sdapi/v1/samplers",
+    "/sdapi/v1/prompt-styles",
+    "/controlnet/model_list",
+    "/controlnet/module_list",
+)
+
+_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="forge-meta")
+
+
+class MetaCache:
+    """
+    - get(path) -> json ya da None          (taze → bellek; bayat → bellek + arka planda yenile; yok → çek)
+    - get_many(paths) -> {path: json}       (eksikler paralel)
+    - refresh(paths=None) -> {path: json}   (hepsi paralel, zorla)
+    """
+    def __init__(self, base: str, ttl: float = TTL_SEC, fail_ttl: float = FAIL_TTL_SEC):
+        self.base = base
+        self.ttl = float(ttl)
+        self.fail_ttl = float(fail_ttl)
+        self._lock = threading.Lock()
+        # yol -> (değer, geçerlilik bitişi, başarılı mı)
+        self._data: Dict[str, Tuple[Any, float, bool]] = {}
+        self._inflight: Dict[str, Any] = {}
+        self.stats = {"hits": 0, "stale": 0, "fetches": 0, "errors": 0}
+
+    def _fetch(self, path: str) -> Any:
+        self.stats["fetches"] += 1
+        try:
+            val = get_client(self.base).get_json(path, timeout=FETCH_TIMEOUT, retries=1)
+        except Exception:
+            self.stats["errors"] += 1
+            with self._lock:
+                old = self._data.get(path)
+                if old and old[2]:
+                    # eski başarılı değeri koru; bir sonraki deneme fail_ttl sonra
+                    self._data[path] = (old[0], time.monotonic() + self.fail_ttl, True)
+                    return old[0]
+                self._data[path] = (None, time.monotonic() + self.fail_ttl, False)
+            return None
+        with self._lock:
+            self._data[path] = (val, time.monotonic() + self.ttl, True)
+        return val
+
+    def _submit(self, path: str):
+        """Aynı yol için tek çekim (future paylaşılır)."""
+        with self._lock:
+            fut = self._inflight.get(path)
+            if fut is None:
+                fut = self._inflight[path] = _POOL.submit(self._fetch, path)
+                fut.add_done_callback(lambda _f, p=path: self._done(p))
+            return fut
+
+    def _done(self, path: str):
+        with self._lock:
+            self._inflight.pop(path, None)
+
+    def get_many(self, paths: Iterable[str]) -> Dict[str, Any]:
+        now = time.monotonic()
+        out: Dict[str, Any] = {}
+        wait: List[Tuple[str, Any]] = []
+        for path in paths:
+            with self._lock:
+                hit = self._data.get(path)
+            if hit is None:
+                wait.append((path, self._submit(path)))
+                continue
+            out[path] = hit[0]
+            if hit[1] > now:
+                self.stats["hits"] += 1
+            else:
+                self.stats["stale"] += 1
+                self._submit(path)            # bayat değer döner, yenileme arkada
+        for path, fut in wait:
+            try:
+                out[path] = fut.result(timeout=FETCH_TIMEOUT * 3)
+            except Exception:
+                out[path] = None
+        return out
+
+    def get(self, path: str) -> Any:
+        return self.get_many([path])[path]
+
+    def refresh(self, paths: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        paths = list(paths or EDITOR_PATHS)
+        futs = [(p, self._submit(p)) for p in paths]
+        out = {}
+        for p, fut in futs:
+            try:
+                out[p] = fut.result(timeout=FETCH_TIMEOUT * 3)
+            except Exception:
+                out[p] = None
+        return out
+
+
+_CACHES: Dict[str, MetaCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def meta_cache(base: str) -> MetaCache:
+    key = (base or "").rstrip("/")
+    with _CACHES_LOCK:
+        c = _CACHES.get(key)
+        if c is None:
+            c = _CACHES[key] = MetaCache(key)
+        return c
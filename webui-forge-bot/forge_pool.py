@@ -0,0 +1,360 @@
+# forge_pool.py
+# Birden fazla Forge backend'i üzerinde (çocuk, sayfa) görevlerini paylaştıran iş havuzu.
+# Her backend için bir worker thread ortak kuyruktan görev çeker; sonuçlar ise
+# çağıranın thread'inde, görevlerin VERİLİŞ SIRASIYLA commit edilir (Excel/progress sırası korunur).
+#
+# StagePipeline: görevler art arda aşamalardan geçer (ör. txt2img -> REActor -> kaydet).
+# Aşamalar arası kuyruklar sınırlıdır; böylece N+1. sayfanın txt2img'i GPU'da koşarken
+# N. sayfa REActor/yazma aşamasında olabilir ve bellekte en fazla birkaç görüntü bekler.
+from __future__ import annotations
+import os, queue, threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+
+def parse_backends(raw: Optional[str], default: str) -> List[str]:
+    """'http://a:7861, http://b:7861' -> ['http://a:7861', 'http://b:7861']; boşsa [default]."""
+    out: List[str] = []
+    for part in (raw or "").replace(";", ",").split(","):
+        u = part.strip().rstrip("/")
+        if u and u not in out:
+            out.append(u)
+    return out or [default.rstrip("/")]
+
+
+# Checkpoint gruplamasında aynı anda sıralanan çocuk sayısı (0 = tüm kitap tek pencere)
+CKPT_GROUP_CHILDREN = int(os.environ.get("CKPT_GROUP_CHILDREN", "16"))
+
+
+def checkpoint_window(pages: int) -> Optional[int]:
+    """order_by_checkpoint için görev cinsinden pencere (CKPT_GROUP_CHILDREN çocuk × sayfa sayısı)."""
+    return CKPT_GROUP_CHILDREN * max(1, int(pages)) if CKPT_GROUP_CHILDREN > 0 else None
+
+
+def backends_from_env(default: str) -> List[str]:
+    return parse_backends(os.environ.get("SD_BACKENDS"), default)
+
+
+class Stage:
+    """
+    Boru hattı aşaması.
+    - fn(value, slot) -> value: ilk aşama görevi alır, sonrakiler bir önceki aşamanın dönüşünü.
+      None dönerse kalan aşamalar atlanır (commit'e result=None gider).
+    - slots: her worker'a verilen bağlam (ör. backend URL'leri → backend başına bir worker).
+      Verilmezse `workers` adet worker slot=None ile çalışır.
+    """
+    def __init__(self, name: str, fn: Callable[[Any, Any], Any],
+                 slots: Optional[Sequence[Any]] = None, workers: int = 1):
+        self.name = name
+        self.fn = fn
+        self.slots = list(slots) if slots else [None] * max(1, int(workers))
+
+
+class StagePipeline:
+    """
+    - run_ordered(items, commit, needs_work):
+        * needs_work(item) True ise item aşamalardan sırayla geçer.
+        * False ise (ör. "çocuk bitti" işaretçisi) doğrudan commit sırasına girer.
+        * commit(item, result, error) her item için, verilme sırasıyla, çağıranın thread'inde çağrılır.
+    - queue_size: aşamalar arası kuyruk kapasitesi.
+    - max_inflight: aynı anda boru hattında olabilecek görev sayısı (bellek sınırı).
+    """
+    def __init__(self, stages: List[Stage], queue_size: int = 2, max_inflight: Optional[int] = None):
+        if not stages:
+            raise ValueError("StagePipeline: en az bir aşama gerekli")
+        self.stages = list(stages)
+        self.queue_size = max(1, int(queue_size))
+        default_inflight = len(self.stages[0].slots) + sum(self.queue_size + len(st.slots) for st in self.stages[1:])
+        self.max_inflight = max(1, int(max_inflight or default_inflight))
+        self.stats: Dict[str, Dict[Any, int]] = {st.name: {} for st in self.stages}
+        self._stats_lock = threading.Lock()
+
+    def run_ordered(self,
+                    items: Iterable[Any],
+                    commit: Callable[[Any, Any, Optional[BaseException]], None],
+                    needs_work: Callable[[Any], bool] = lambda _it: True) -> None:
+        # giriş kuyruğu sınırsız (max_inflight ile korunur); ara kuyruklar sınırlı; çıkış sınırsız
+        queues: List["queue.Queue"] = [queue.Queue()]
+        queues += [queue.Queue(maxsize=self.queue_size) for _ in self.stages[1:]]
+        results: "queue.Queue" = queue.Queue()
+
+        def worker(si: int, slot: Any):
+            stage = self.stages[si]
+            q_in = queues[si]
+            q_out = queues[si + 1] if si + 1 < len(queues) else results
+            while True:
+                env = q_in.get()
+                if env is None:
+                    return
+                seq, item, value, err, alive = env
+                if alive and err is None:
+                    try:
+                        value = stage.fn(value, slot)
+                        alive = value is not None
+                    except BaseException as e:  # commit tarafında raporlanır
+                        err, value, alive = e, None, False
+                    with self._stats_lock:
+                        st = self.stats[stage.name]
+                        st[slot] = st.get(slot, 0) + 1
+                q_out.put((seq, item, value, err, alive))
+
+        threads: List[tuple] = []
+        for si, stage in enumerate(self.stages):
+            for slot in stage.slots:
+                t = threading.Thread(target=worker, args=(si, slot), daemon=True)
+                t.start()
+                threads.append((si, t))
+
+        buffer: Dict[int, Any] = {}
+        state = {"next": 0, "inflight": 0}
+
+        def flush():
+            while state["next"] in buffer:
+                item, res, err = buffer.pop(state["next"])
+                state["next"] += 1
+                commit(item, res, err)
+
+        def collect(block: bool) -> bool:
+            try:
+                seq, item, value, err, _alive = results.get(block=block)
+            except queue.Empty:
+                return False
+            state["inflight"] -= 1
+            buffer[seq] = (item, value, err)
+            return True
+
+        seq = 0
+        try:
+            for item in items:
+                if needs_work(item):
+                    while state["inflight"] >= self.max_inflight:
+                        collect(block=True); flush()
+                    queues[0].put((seq, item, item, None, True))
+                    state["inflight"] += 1
+                else:
+                    buffer[seq] = (item, None, None)
+                seq += 1
+                while collect(block=False):
+                    pass
+                flush()
+            while state["next"] < seq:
+                collect(block=True); flush()
+        finally:
+            # aşama aşama kapat: önce üst aşama worker'ları biter, sonra alttakilere sentinel gider
+            for si in range(len(self.stages)):
+                stage_threads = [t for i, t in threads if i == si]
+                for _ in stage_threads:
+                    try: queues[si].put(None, timeout=1)
+                    except queue.Full: pass
+                for t in stage_threads:
+                    t.join(timeout=1)
+
+
+class BackendPool:
+    """
+    - backends: Forge taban URL listesi; her biri için tek worker (bir GPU = bir eşzamanlı üretim).
+    - run_ordered(items, work, commit, needs_work): work(item, backend) boşta olan ilk backend'de çalışır;
+      commit sırası StagePipeline ile aynıdır.
+    - max_inflight: aynı anda kuyrukta/işlemde olabilecek görev sayısı (bellek sınırı).
+    """
+    def __init__(self, backends: List[str], max_inflight: Optional[int] = None):
+        if not backends:
+            raise ValueError("BackendPool: en az bir backend gerekli")
+        self.backends = list(backends)
+        self.max_inflight = max(1, int(max_inflight or len(self.backends) * 2))
+        self.stats: Dict[str, int] = {b: 0 for b in self.backends}
+
+    def pipeline(self, generate: Callable[[Any, str], Any], *later: Stage, queue_size: int = 2) -> StagePipeline:
+        """İlk aşaması backend başına bir worker olan boru hattı kurar (generate(item, backend))."""
+        stages = [Stage("generate", generate, slots=self.backends)] + list(later)
+        return StagePipeline(stages, queue_size=queue_size,
+                             max_inflight=self.max_inflight + sum(queue_size + len(st.slots) for st in later))
+
+    def run_ordered(self,
+                    items: Iterable[Any],
+                    work: Callable[[Any, str], Any],
+                    commit: Callable[[Any, Any, Optional[BaseException]], None],
+                    needs_work: Callable[[Any], bool] = lambda _it: True,
+                    later: Sequence[Stage] = ()) -> None:
+        pipe = self.pipeline(work, *later)
+        pipe.run_ordered(items, commit, needs_work)
+        for b, n in pipe.stats["generate"].items():
+            self.stats[b] = self.stats.get(b, 0) + n
+
+
+# ----------------- Checkpoint farkındalıklı sıralama -----------------
+def checkpoint_key(name: Optional[str]) -> str:
+    """'dir/juggernautXL_v9.safetensors [abc123]' ile 'juggernautXL_v9' aynı anahtara iner."""
+    s = (name or "").strip()
+    if not s:
+        return ""
+    if s.endswith("]") and " [" in s:
+        s = s[:s.rindex(" [")]
+    s = s.replace("\\", "/").rsplit("/", 1)[-1]
+    for ext in (".safetensors", ".ckpt", ".pt", ".bin"):
+        if s.lower().endswith(ext):
+            s = s[:-len(ext)]
+            break
+    return s.lower()
+
+
+def count_checkpoint_swaps(ckpts: Iterable[Optional[str]], active: Optional[str] = None) -> int:
+    """Verilen sırada çalışılırsa kaç kez model değişir (boş checkpoint = mevcut model kalır)."""
+    cur, n = checkpoint_key(active), 0
+    for c in ckpts:
+        k = checkpoint_key(c)
+        if k and k != cur:
+            n += 1; cur = k
+    return n
+
+
+def _order_window(items: List[Any], ckpt_of: Callable[[Any], Optional[str]], is_task: Callable[[Any], bool],
+                  active_k: str) -> tuple:
+    """Tek pencere: (yeni sıra, görevlerin yeni sıradaki anahtarları, eski sıradaki anahtarlar, {anahtar: ad})."""
+    tasks = [it for it in items if is_task(it)]
+    keys = [checkpoint_key(ckpt_of(t)) for t in tasks]
+    names: Dict[str, str] = {}
+    for t, k in zip(tasks, keys):
+        names.setdefault(k, ckpt_of(t) or "")
+
+    rank: Dict[str, int] = {}
+    if active_k and active_k in keys:
+        rank[active_k] = 0
+    for k in keys:
+        if k not in rank:
+            rank[k] = len(rank)
+
+    ordered_idx = sorted(range(len(tasks)), key=lambda i: rank[keys[i]])
+    pos = {id(tasks[i]): n for n, i in enumerate(ordered_idx)}
+
+    # işaretçi çapaları: segmentindeki son görevin yeni konumu, öncekinden geri gitmeden
+    anchors: Dict[int, List[Any]] = {}
+    last_anchor, seg_max = -1, -1
+    for it in items:
+        if is_task(it):
+            seg_max = max(seg_max, pos[id(it)])
+        else:
+            last_anchor = max(last_anchor, seg_max)
+            anchors.setdefault(last_anchor, []).append(it)
+            seg_max = -1
+
+    out: List[Any] = list(anchors.get(-1, []))
+    for n, i in enumerate(ordered_idx):
+        out.append(tasks[i])
+        out.extend(anchors.get(n, []))
+    return out, [keys[i] for i in ordered_idx], keys, names
+
+
+def order_by_checkpoint(items: Iterable[Any],
+                        ckpt_of: Callable[[Any], Optional[str]],
+                        is_task: Callable[[Any], bool] = lambda _it: True,
+                        active: Optional[str] = None,
+                        window: Optional[int] = None):
+    """
+    (çocuk, sayfa) görevlerini checkpoint gruplarına göre kararlı şekilde yeniden sıralar.
+    - Grup sırası: aktif model (varsa) önce, sonra ilk görülme sırası.
+    - Görev olmayan işaretçiler (ör. child_end) kendi segmentlerindeki son görevin hemen
+      arkasına yerleşir; işaretçilerin kendi aralarındaki sıra korunur (Excel yazım sırası).
+    - window: akış pencere pencere sıralanır; tampon en az `window` görev biriktirince ilk segment
+      sonunda (işaretçisiz akışta hemen) boşaltılır. Bir sonraki pencere bir öncekinin son modeliyle başlar.
+      Böylece akış (iter_children) korunur, bellekte en çok bir pencere görev bekler ve ilk üretim
+      tüm listenin yüz hazırlığını beklemez. None: tüm akış tek pencere (belleğe alınır).
+    Dönüş: (yeni_sıra_iterable, info) — info: groups, swaps_before, swaps_after, avoided, windows.
+    info tüketim ilerledikçe dolar; kesin değerler akış bittikten sonra okunmalı.
+    """
+    info: Dict[str, Any] = {"groups": [], "swaps_before": 0, "swaps_after": 0, "avoided": 0, "windows": 0}
+    counts: Dict[str, int] = {}
+    names: Dict[str, str] = {}
+    state = {"before": checkpoint_key(active), "after": checkpoint_key(active)}
+
+    def swaps(keys: List[str], which: str) -> int:
+        n = 0
+        for k in keys:
+            if k and k != state[which]:
+                n += 1; state[which] = k
+        return n
+
+    def emit(buf: List[Any]) -> List[Any]:
+        out, keys_after, keys_before, nm = _order_window(buf, ckpt_of, is_task, state["after"])
+        for k in keys_after:
+            counts[k] = counts.get(k, 0) + 1
+        for k, n in nm.items():
+            names.setdefault(k, n)
+        info["swaps_before"] += swaps(keys_before, "before")
+        info["swaps_after"] += swaps(keys_after, "after")
+        info["avoided"] = max(0, info["swaps_before"] - info["swaps_after"])
+        info["groups"] = [(names[k], counts[k]) for k in counts]
+        info["windows"] += 1
+        return out
+
+    if window is None:
+        return emit(list(items)), info
+
+    limit = max(1, int(window))
+
+    def gen():
+        buf: List[Any] = []
+        n_tasks, saw_marker = 0, False
+        for it in items:
+            buf.append(it)
+            task = is_task(it)
+            if task:
+                n_tasks += 1
+            else:
+                saw_marker = True
+            if n_tasks >= limit and (not task or not saw_marker):
+                yield from emit(buf)
+                buf, n_tasks = [], 0
+        if buf:
+            yield from emit(buf)
+
+    return gen(), info
+
+
+class CheckpointTracker:
+    """
+    Backend başına aktif checkpoint'i hatırlar; /sdapi/v1/options POST'u yalnızca gerçekten
+    farklı bir model gerektiğinde yapılır.
+    - get_active(backend) -> Optional[str]: ilk kullanımda aktif modeli sorar.
+    - set_active(backend, name): modeli yükletir.
+    """
+    def __init__(self, get_active: Callable[[str], Optional[str]], set_active: Callable[[str, str], None]):
+        self._get_active = get_active
+        self._set_active = set_active
+        self._active: Dict[str, str] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.stats = {"swaps": 0, "skipped": 0}
+
+    def _backend_lock(self, backend: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(backend, threading.Lock())
+
+    def active(self, backend: str) -> Optional[str]:
+        with self._backend_lock(backend):
+            if backend not in self._active:
+                try:
+                    self._active[backend] = self._get_active(backend) or ""
+                except Exception:
+                    self._active[backend] = ""
+            return self._active[backend] or None
+
+    def forget(self, backend: str) -> None:
+        """Model dışarıdan (ör. Forge arayüzünden) değiştiyse bir sonraki ensure tekrar sorar."""
+        with self._backend_lock(backend):
+            self._active.pop(backend, None)
+
+    def ensure(self, backend: str, checkpoint: Optional[str]) -> bool:
+        """Gerekirse modeli değiştirir; değiştirdiyse True. set_active hatası yukarı iletilir."""
+        if not checkpoint_key(checkpoint):
+            return False
+        self.active(backend)
+        with self._backend_lock(backend):
+            if checkpoint_key(self._active.get(backend)) == checkpoint_key(checkpoint):
+                with self._lock:
+                    self.stats["skipped"] += 1
+                return False
+            self._set_active(backend, checkpoint)
+            self._active[backend] = checkpoint
+            with self._lock:
+                self.stats["swaps"] += 1
+            return True
@@ -0,0 +1,145 @@
+# image_cache.py
+# Yüz/poz görsellerinin gönderime hazır base64 (PNG) yükleri için kalıcı önbellek.
+# Anahtar: mutlak yol + boyut + mtime (+ varyant, ör. "png" / "rgb-png").
+# Disk katmanı: data/cache/images/<sha1>.b64 ; üstünde bayt bütçeli bellek içi LRU.
+# Önbellekte varsa PIL hiç açılmaz; yeniden çalıştırmalar ve kaldığı yerden devamlar ucuzdur.
+from __future__ import annotations
+import base64, hashlib, io, os, tempfile, threading
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache", "images")
+DEFAULT_MEM_BUDGET = int(os.environ.get("IMAGE_CACHE_MEM_MB", "256")) * 1024 * 1024
+
+
+def file_signature(path: str) -> Tuple[str, int, int]:
+    st = os.stat(path)
+    return (os.path.abspath(path), int(st.st_size), int(st.st_mtime_ns))
+
+
+def encode_png_b64(path: str, convert_rgb: bool = False) -> str:
+    from PIL import Image
+    with Image.open(path) as im:
+        if convert_rgb:
+            im = im.convert("RGB")
+        buf = io.BytesIO()
+        im.save(buf, format="PNG")
+        return base64.b64encode(buf.getvalue()).decode("utf-8")
+
+
+class ImageB64Cache:
+    """
+    - get(path, variant, encoder): (yol, boyut, mtime, varyant) anahtarıyla base64 döndürür.
+      Bellek → disk → encoder(path) sırasıyla bakar; encoder sonucu iki katmana da yazılır.
+    - mem_budget: bellek katmanındaki toplam base64 bayt sınırı (LRU ile tahliye).
+    stats: mem_hits, disk_hits, misses   (pipeline worker'larından eşzamanlı güncellenir; _lock altında)
+    """
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, mem_budget: int = DEFAULT_MEM_BUDGET):
+        self.cache_dir = cache_dir
+        self.mem_budget = max(0, int(mem_budget))
+        self._mem: "OrderedDict[str, str]" = OrderedDict()
+        self._mem_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"mem_hits": 0, "disk_hits": 0, "misses": 0}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # ----- anahtar / yol -----
+    @staticmethod
+    def make_key(path: str, variant: str = "png") -> str:
+        ap, size, mtime = file_signature(path)
+        raw = f"{ap}|{size}|{mtime}|{variant}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".b64")
+
+    # ----- bellek katmanı -----
+    def _mem_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            v = self._mem.get(key)
+            if v is not None:
+                self._mem.move_to_end(key)
+            return v
+
+    def _mem_put(self, key: str, value: str):
+        size = len(value)
+        if size > self.mem_budget:
+            return
+        with self._lock:
+            old = self._mem.pop(key, None)
+            if old is not None:
+                self._mem_bytes -= len(old)
+            self._mem[key] = value
+            self._mem_bytes += size
+            while self._mem_bytes > self.mem_budget and self._mem:
+                _, ev = self._mem.popitem(last=False)
+                self._mem_bytes -= len(ev)
+
+    # ----- disk katmanı -----
+    def _disk_get(self, key: str) -> Optional[str]:
+        p = self._disk_path(key)
+        try:
+            with open(p, "r", encoding="ascii") as f:
+                return f.read() or None
+        except (FileNotFoundError, OSError, UnicodeDecodeError):
+            return None
+
+    def _disk_put(self, key: str, value: str):
+        p = self._disk_path(key)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(p), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="ascii") as f:
+                f.write(value)
+            os.replace(tmp, p)
+        except Exception:
+            try: os.remove(tmp)
+            except OSError: pass
+
+    # ----- public API -----
+    def get_by_key(self, key: str) -> Optional[str]:
+        v = self._mem_get(key)
+        if v is not None:
+            with self._lock:
+                self.stats["mem_hits"] += 1
+            return v
+        v = self._disk_get(key)
+        if v is not None:
+            with self._lock:
+                self.stats["disk_hits"] += 1
+            self._mem_put(key, v)
+        return v
+
+    def put_by_key(self, key: str, value: str):
+        self._disk_put(key, value)
+        self._mem_put(key, value)
+
+    def get(self, path: str, variant: str = "png",
+            encoder: Optional[Callable[[str], str]] = None) -> str:
+        key = self.make_key(path, variant)
+        v = self.get_by_key(key)
+        if v is not None:
+            return v
+        with self._lock:
+            self.stats["misses"] += 1
+        v = (encoder or encode_png_b64)(path)
+        self.put_by_key(key, v)
+        return v
+
+
+_DEFAULT: Optional[ImageB64Cache] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_cache() -> ImageB64Cache:
+    global _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = ImageB64Cache()
+        return _DEFAULT
+
+
+def cached_png_b64(path: str, convert_rgb: bool = False) -> str:
+    """read_image_to_b64 / _b64_image_from_path için önbellekli karşılık."""
+    variant = "rgb-png" if convert_rgb else "png"
+    return default_cache().get(str(path), variant, lambda p: encode_png_b64(p, convert_rgb=convert_rgb))
@@ -0,0 +1,110 @@
+# job_logger.py
+# İş logu için asenkron, toplu yazan logger (run_book_via_api).
+# - log(msg, **alanlar) yalnız kuyruğa atar; dosya açık tutulur, arka plandaki tek thread kuyrukta biriken
+#   satırları toplu yazar ve flush eder (SSE akışı satırları hemen görür); fsync FSYNC_SEC'te bir.
+#   Mesaj başına open/append/close yok (Windows paylaşımlarında pahalı ve üretimle sıralanıyordu).
+# - Her mesaj iki biçimde: insan okunur satır (<iş>.log, durum sayfası ve SSE bunu okur) ve JSONL olay
+#   (<iş>.events.jsonl: ts, level, tag, msg + child, page, stage, duration ...) — panel metni regex'le ayrıştırmaz.
+from __future__ import annotations
+import json, os, queue, re, sys, threading, time
+from typing import Any, Dict, Optional
+
+FSYNC_SEC = float(os.environ.get("JOB_LOG_FSYNC_SEC", "5"))
+BATCH = 512
+TAG_RE = re.compile(r"^\s*\[([A-Z]+)\]")
+LEVELS = {"ERR": "error", "WARN": "warn", "DEBUG": "debug"}
+
+
+def events_path_for(log_path: str) -> str:
+    base, ext = os.path.splitext(log_path)
+    return (base if ext == ".log" else log_path) + ".events.jsonl"
+
+
+class JobLogger:
+    """
+    - __call__(msg, level=None, **fields): satır + olay kuyruğa; level verilmezse etiketten ([ERR] → error ...)
+    - flush(): o ana kadarki her şey diske yazılana kadar bekler
+    - close(): kuyruğu boşaltır, fsync, kapatır (idempotent)
+    Alanlar serbesttir; panelin beklediği olanlar: child, page, stage, duration, backend.
+    """
+    def __init__(self, log_path: str, events_path: Optional[str] = None, echo: bool = True,
+                 fsync_sec: float = FSYNC_SEC):
+        self.log_path = log_path
+        self.events_path = events_path or events_path_for(log_path)
+        self.echo = echo
+        self.fsync_sec = float(fsync_sec)
+        self.stats = {"lines": 0, "batches": 0, "fsyncs": 0}
+        self._q: "queue.Queue[Any]" = queue.Queue()
+        self._closed = False
+        self._t = threading.Thread(target=self._loop, daemon=True, name="job-logger")
+        self._t.start()
+
+    def __call__(self, msg: str, level: Optional[str] = None, **fields):
+        if self._closed:
+            return
+        m = TAG_RE.match(msg)
+        tag = m.group(1) if m else None
+        ev: Dict[str, Any] = {"ts": round(time.time(), 3), "level": level or LEVELS.get(tag or "", "info"),
+                              "tag": tag, "msg": msg.rstrip()}
+        ev.update({k: v for k, v in fields.items() if v is not None})
+        self._q.put(ev)
+
+    def flush(self, timeout: float = 30.0):
+        if not self._t.is_alive():
+            return
+        done = threading.Event()
+        self._q.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._q.put(None)
+        self._t.join()
+
+    def _loop(self):
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+        lf = open(self.log_path, "a", encoding="utf-8")
+        ef = open(self.events_path, "a", encoding="utf-8")
+        last_sync, dirty = time.monotonic(), False
+        try:
+            while True:
+                try:
+                    first = self._q.get(timeout=self.fsync_sec)
+                except queue.Empty:
+                    first = ()
+                batch = [first] if first != () else []
+                while len(batch) < BATCH:
+                    try:
+                        batch.append(self._q.get_nowait())
+                    except queue.Empty:
+                        break
+                stop, waiters, lines, events = False, [], [], []
+                for item in batch:
+                    if item is None:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        waiters.append(item)
+                    else:
+                        lines.append(item["msg"] + "\n")
+                        events.append(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+                if lines:
+                    lf.write("".join(lines)); lf.flush()
+                    ef.write("".join(events)); ef.flush()
+                    if self.echo:
+                        sys.stdout.write("".join(lines)); sys.stdout.flush()
+                    self.stats["lines"] += len(lines)
+                    self.stats["batches"] += 1
+                    dirty = True
+                if dirty and (stop or time.monotonic() - last_sync >= self.fsync_sec):
+                    os.fsync(lf.fileno()); os.fsync(ef.fileno())
+                    self.stats["fsyncs"] += 1
+                    last_sync, dirty = time.monotonic(), False
+                for w in waiters:
+                    w.set()
+                if stop:
+                    return
+        finally:
+            lf.close()
+            ef.close()
@@ -0,0 +1,220 @@
+# job_store.py
+# İşlerin ve (çocuk, sayfa) görev durumlarının kalıcı SQLite deposu.
+# - Flask yeniden başlasa da iş durumları kaybolmaz; birden fazla panel süreci aynı dosyayı paylaşabilir (WAL).
+# - Her iş bir "owner" (süreç kimliği) ve periyodik heartbeat taşır; heartbeat'i bayatlayan ya da sahibi
+#   aynı makinede artık yaşamayan 'running' işler başka bir süreç tarafından sahiplenilip kaldığı yerden
+#   devam ettirilir (yeniden başlatma heartbeat bayatlamadan biterse de sahipsiz iş hemen bulunur).
+# - Aramalar birincil anahtar / indeks üzerinden: binlerce eski işte de O(1).
+from __future__ import annotations
+import ctypes, json, os, socket, sqlite3, threading, time, uuid
+from typing import Any, Dict, List, Optional
+
+TASK_STATES = ("queued", "running", "done", "failed")
+# Heartbeat bu kadar aralık boyunca yenilenmediyse sahibi ölü sayılır
+ORPHAN_STALE_BEATS = float(os.getenv("JOB_ORPHAN_STALE_BEATS", "3"))
+JOB_FIELDS = ("book_id", "kind", "status", "log_path", "started_at", "finished_at",
+              "last_image", "last_child", "last_page", "owner", "heartbeat_at", "args")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           TEXT PRIMARY KEY,
+    book_id      TEXT NOT NULL,
+    kind         TEXT NOT NULL DEFAULT 'api',
+    status       TEXT NOT NULL,
+    log_path     TEXT,
+    started_at   TEXT,
+    finished_at  TEXT,
+    last_image   TEXT,
+    last_child   TEXT,
+    last_page    INTEGER,
+    owner        TEXT,
+    heartbeat_at REAL,
+    args         TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_book_started ON jobs(book_id, started_at);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status);
+CREATE TABLE IF NOT EXISTS tasks (
+    job_id     TEXT NOT NULL,
+    child_key  TEXT NOT NULL,
+    page_index INTEGER NOT NULL,
+    status     TEXT NOT NULL,
+    output     TEXT,
+    error      TEXT,
+    updated_at REAL,
+    PRIMARY KEY (job_id, child_key, page_index)
+) WITHOUT ROWID;
+"""
+
+
+class JobStore:
+    """
+    - create_job(job_id, book_id, kind, log_path, started_at, args=None)
+    - get(job_id) -> dict | None, update(job_id, **fields), latest_for_book(book_id) -> dict | None
+    - set_task(job_id, child_key, page_index, status, output=None, error=None), task_counts(job_id)
+    - claim_orphans(stale_sec=None) -> heartbeat'i bayatlamış ya da sahibi ölmüş 'running' işleri bu sürece devralır
+      (varsayılan bayatlık: heartbeat_sec × ORPHAN_STALE_BEATS)
+    """
+    def __init__(self, db_path: str, heartbeat_sec: float = 15.0):
+        self.db_path = db_path
+        self.heartbeat_sec = float(heartbeat_sec)
+        self.stale_sec = self.heartbeat_sec * ORPHAN_STALE_BEATS
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._local = threading.local()
+        self._hb_thread: Optional[threading.Thread] = None
+        self._hb_lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._conn() as c:
+            c.executescript(_SCHEMA)
+
+    # ----- bağlantı (thread başına) -----
+    def _conn(self) -> sqlite3.Connection:
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = sqlite3.connect(self.db_path, timeout=30)
+            c.row_factory = sqlite3.Row
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = c
+        return c
+
+    @staticmethod
+    def _row(r: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if r is None:
+            return None
+        d = dict(r)
+        try:
+            d["args"] = json.loads(d["args"]) if d.get("args") else {}
+        except ValueError:
+            d["args"] = {}
+        return d
+
+    # ----- işler -----
+    def create_job(self, job_id: str, book_id: str, kind: str, log_path: str, started_at: str,
+                   args: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        with self._conn() as c:
+            c.execute(
+                "INSERT INTO jobs (id, book_id, kind, status, log_path, started_at, owner, heartbeat_at, args) "
+                "VALUES (?, ?, ?, 'running', ?, ?, ?, ?, ?)",
+                (job_id, book_id, kind, log_path, started_at, self.owner, time.time(), json.dumps(args or {})))
+        self._ensure_heartbeat()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._row(self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def update(self, job_id: str, **fields):
+        cols = [k for k in fields if k in JOB_FIELDS]
+        if not cols:
+            return
+        vals = [json.dumps(fields[k]) if k == "args" else fields[k] for k in cols]
+        with self._conn() as c:
+            c.execute(f"UPDATE jobs SET {', '.join(k + ' = ?' for k in cols)} WHERE id = ?", (*vals, job_id))
+
+    def latest_for_book(self, book_id: str) -> Optional[Dict[str, Any]]:
+        return self._row(self._conn().execute(
+            "SELECT * FROM jobs WHERE book_id = ? ORDER BY started_at DESC, rowid DESC LIMIT 1", (book_id,)).fetchone())
+
+    # ----- görevler -----
+    def set_task(self, job_id: str, child_key: str, page_index: int, status: str,
+                 output: Optional[str] = None, error: Optional[str] = None):
+        if status not in TASK_STATES:
+            raise ValueError(f"Geçersiz görev durumu: {status}")
+        with self._conn() as c:
+            c.execute(
+                "INSERT INTO tasks (job_id, child_key, page_index, status, output, error, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(job_id, child_key, page_index) DO UPDATE SET "
+                "status = excluded.status, output = COALESCE(excluded.output, tasks.output), "
+                "error = excluded.error, updated_at = excluded.updated_at",
+                (job_id, child_key, int(page_index), status, output, error, time.time()))
+
+    def task_counts(self, job_id: str) -> Dict[str, int]:
+        out = {k: 0 for k in TASK_STATES}
+        for r in self._conn().execute(
+                "SELECT status, COUNT(*) AS n FROM tasks WHERE job_id = ? GROUP BY status", (job_id,)):
+            out[r["status"]] = r["n"]
+        return out
+
+    def reset_running_tasks(self, job_id: str):
+        """Devralınan işte yarıda kalmış 'running' görevler yeniden kuyruğa döner."""
+        with self._conn() as c:
+            c.execute("UPDATE tasks SET status = 'queued', updated_at = ? WHERE job_id = ? AND status = 'running'",
+                      (time.time(), job_id))
+
+    # ----- sahiplik / heartbeat -----
+    def claim_orphans(self, stale_sec: Optional[float] = None) -> List[Dict[str, Any]]:
+        cutoff = time.time() - float(self.stale_sec if stale_sec is None else stale_sec)
+        claimed: List[Dict[str, Any]] = []
+        rows = self._conn().execute(
+            "SELECT id, owner, heartbeat_at FROM jobs WHERE status = 'running' AND owner IS NOT ?",
+            (self.owner,)).fetchall()
+        for r in rows:
+            hb = r["heartbeat_at"]
+            if hb is not None and hb >= cutoff and not _owner_dead(r["owner"]):
+                continue
+            # okunan sahip/heartbeat hâlâ aynıysa devral: aynı anda tarayan iki süreçten yalnız biri kazanır
+            with self._conn() as c:
+                cur = c.execute(
+                    "UPDATE jobs SET owner = ?, heartbeat_at = ? WHERE id = ? AND status = 'running' "
+                    "AND owner IS ? AND heartbeat_at IS ?",
+                    (self.owner, time.time(), r["id"], r["owner"], hb))
+            if cur.rowcount == 1:
+                claimed.append(self.get(r["id"]))
+        if claimed:
+            self._ensure_heartbeat()
+        return claimed
+
+    def _ensure_heartbeat(self):
+        with self._hb_lock:
+            if self._hb_thread and self._hb_thread.is_alive():
+                return
+            self._hb_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+            self._hb_thread.start()
+
+    def _heartbeat_loop(self):
+        while True:
+            try:
+                with self._conn() as c:
+                    c.execute("UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status = 'running'",
+                              (time.time(), self.owner))
+            except sqlite3.Error:
+                pass
+            time.sleep(self.heartbeat_sec)
+
+
+# ----- sahip süreç yaşıyor mu? -----
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        # os.kill(pid, 0) Windows'ta süreci sonlandırır; OpenProcess + çıkış kodu ile bakılır
+        k32 = ctypes.windll.kernel32
+        h = k32.OpenProcess(0x1000, False, pid)          # PROCESS_QUERY_LIMITED_INFORMATION
+        if not h:
+            return k32.GetLastError() == 5               # ERROR_ACCESS_DENIED: var ama başka kullanıcının
+        try:
+            code = ctypes.c_ulong()
+            return not k32.GetExitCodeProcess(h, ctypes.byref(code)) or code.value == 259   # STILL_ACTIVE
+        finally:
+            k32.CloseHandle(h)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _owner_dead(owner: Optional[str]) -> bool:
+    """owner = "host:pid:etiket". Yalnız bu makinedeki, artık yaşamayan süreçler için True; başka makinede
+    ya da biçimi tanınmıyorsa karar heartbeat'e kalır."""
+    try:
+        host, pid, _tag = (owner or "").rsplit(":", 2)
+        pid = int(pid)
+    except ValueError:
+        return False
+    if host != socket.gethostname() or pid == os.getpid() or pid <= 0:
+        return False
+    try:
+        return not _pid_alive(pid)
+    except (OSError, AttributeError):
+        return False
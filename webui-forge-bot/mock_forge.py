@@ -0,0 +1,419 @@
+# mock_forge.py
+# Çevrimdışı Forge/A1111 yerine geçen sahte API sunucusu (test ve yük benchmark'ı için).
+# - Uç noktalar: /sdapi/v1/{txt2img,options,progress,sd-models,samplers,prompt-styles,script-info},
+#   /controlnet/{version,model_list,module_list,detect}, /reactor/{models,image};
+#   yönetim: GET /mock/stats, POST /mock/config, POST /mock/reset.
+# - Gecikme uç nokta başına bir dağılımla: "0.5" | "fixed:0.5" | "uniform:0.2,1.5" | "normal:1.0,0.2" | "lognormal:0,0.4".
+#   txt2img'de "step" verilirse (saniye/adım) payload'daki steps ile çarpılıp eklenir.
+# - Hata enjeksiyonu uç nokta başına: oran + tür ("500", "502", "503" ya da "drop" = yanıtsız bağlantı kapatma).
+# - Eşzamanlılık sınırı: GPU uç noktaları (txt2img, reactor/image, controlnet/detect) aynı anda en çok
+#   `concurrency` istek işler, fazlası Forge'daki gibi sırada bekler; max_queue aşılırsa 503.
+# - Sentetik PNG: boyut payload'dan, renk seed + prompt'tan (aynı payload → aynı bayt).
+# Süreç içi:   with MockForge(latency={"txt2img": "uniform:0.2,0.4"}) as mf: ... mf.url ...
+# Port üzerinde: python mock_forge.py --port 7861 --latency txt2img=uniform:2,4 --error txt2img=0.05:503
+from __future__ import annotations
+import argparse, base64, hashlib, io, json, random, threading, time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+ROUTES = {
+    ("POST", "/sdapi/v1/txt2img"): "txt2img",
+    ("GET", "/sdapi/v1/options"): "options_get",
+    ("POST", "/sdapi/v1/options"): "options_set",
+    ("GET", "/sdapi/v1/progress"): "progress",
+    ("GET", "/sdapi/v1/sd-models"): "sd_models",
+    ("GET", "/sdapi/v1/samplers"): "samplers",
+    ("GET", "/sdapi/v1/prompt-styles"): "prompt_styles",
+    ("GET", "/sdapi/v1/script-info"): "script_info",
+    ("GET", "/controlnet/version"): "cn_version",
+    ("GET", "/controlnet/model_list"): "cn_model_list",
+    ("GET", "/controlnet/module_list"): "cn_module_list",
+    ("POST", "/controlnet/detect"): "cn_detect",
+    ("GET", "/reactor/models"): "reactor_models",
+    ("POST", "/reactor/image"): "reactor_image",
+    ("GET", "/mock/stats"): "mock_stats",
+    ("POST", "/mock/config"): "mock_config",
+    ("POST", "/mock/reset"): "mock_reset",
+}
+# Uç nokta adı → varsayılan gecikme (sn); options_set yalnız model gerçekten değişince uygulanır
+DEFAULT_LATENCY = {
+    "txt2img": "uniform:0.2,0.4",
+    "options_set": "fixed:0.5",
+    "reactor_image": "uniform:0.05,0.1",
+    "cn_detect": "fixed:0.03",
+}
+MODELS = ["juggernautXL_v9.safetensors [c9e3e68f89]", "dreamshaperXL_v21.safetensors [4496b36d48]"]
+SAMPLERS = ["Euler a", "Euler", "DPM++ 2M", "DPM++ 2M SDE", "DPM++ 2M Karras", "UniPC"]
+CN_MODELS = ["ip-adapter_instant_id_sdxl [eb2d3ec0]", "control_instant_id_sdxl [c5c25a50]"]
+CN_MODULES = ["none", "InsightFace (InstantID)", "instant_id_face_embedding", "instant_id_face_keypoints"]
+
+
+def parse_latency(spec: Any) -> Callable[[random.Random], float]:
+    """'0.5' | 'fixed:0.5' | 'uniform:a,b' | 'normal:mu,sigma' | 'lognormal:mu,sigma' -> rnd -> saniye (>= 0)."""
+    if callable(spec):
+        return spec
+    s = str(spec if spec is not None else 0).strip().lower()
+    kind, _, args = s.partition(":") if ":" in s else ("fixed", "", s)
+    vals = [float(x) for x in args.split(",") if x.strip()] or [0.0]
+    if kind == "fixed":
+        return lambda rnd: max(0.0, vals[0])
+    if kind == "uniform":
+        lo, hi = vals[0], vals[1] if len(vals) > 1 else vals[0]
+        return lambda rnd: max(0.0, rnd.uniform(lo, hi))
+    if kind == "normal":
+        mu, sigma = vals[0], vals[1] if len(vals) > 1 else 0.0
+        return lambda rnd: max(0.0, rnd.gauss(mu, sigma))
+    if kind == "lognormal":
+        mu, sigma = vals[0], vals[1] if len(vals) > 1 else 0.0
+        return lambda rnd: rnd.lognormvariate(mu, sigma)
+    raise ValueError(f"Bilinmeyen gecikme dağılımı: {spec}")
+
+
+def parse_error(spec: Any) -> Tuple[float, str]:
+    """'0.05' -> (0.05, '500') ; '0.05:503' ; '0.1:drop'."""
+    if isinstance(spec, (int, float)):
+        return float(spec), "500"
+    rate, _, kind = str(spec).partition(":")
+    return float(rate or 0), (kind or "500").strip().lower()
+
+
+@lru_cache(maxsize=128)
+def synthetic_png(width: int, height: int, rgb: Tuple[int, int, int]) -> bytes:
+    """Düz renk + köşegen şerit; hızlı sıkıştırma (büyük boyutlarda da ms mertebesi)."""
+    from PIL import Image, ImageDraw
+    im = Image.new("RGB", (max(8, width), max(8, height)), rgb)
+    ImageDraw.Draw(im).line([(0, 0), (im.width, im.height)], fill=tuple(255 - c for c in rgb),
+                            width=max(2, im.width // 32))
+    buf = io.BytesIO()
+    im.save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
+
+
+def _color(*parts: Any) -> Tuple[int, int, int]:
+    h = hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).digest()
+    return h[0], h[1], h[2]
+
+
+def _b64_size(b64: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Gönderilen görselin boyutu (yalnız başlık okunur)."""
+    if not b64:
+        return None
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(base64.b64decode(b64.split(",", 1)[-1]))) as im:
+            return im.size
+    except Exception:
+        return None
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MockForge:
+    """
+    - start() -> url, stop(); bağlam yöneticisi olarak da kullanılır
+    - configure(latency=..., errors=..., concurrency=..., max_queue=..., step=...)  (çalışırken de)
+    - stats: istek sayıları, enjekte edilen hatalar, en yüksek eşzamanlılık/sıra, GPU meşgul süresi
+    latency / errors: {uç nokta adı: spec}; "*" anahtarı tüm uç noktalara uygulanır.
+    """
+    def __init__(self, latency: Optional[Dict[str, Any]] = None, errors: Optional[Dict[str, Any]] = None,
+                 concurrency: int = 1, max_queue: Optional[int] = None, step: float = 0.0,
+                 checkpoint: str = MODELS[0], host: str = "127.0.0.1", port: int = 0, seed: Optional[int] = None):
+        self.host, self.port = host, int(port)
+        self.checkpoint = checkpoint
+        self._rnd = random.Random(seed)
+        self._rnd_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._server: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+        self._active: Dict[int, Tuple[float, float, int]] = {}   # iş no -> (başlangıç, süre, adım)
+        self._job_seq = 0
+        self._queued = 0
+        self.latency: Dict[str, Callable[[random.Random], float]] = {}
+        self.errors: Dict[str, Tuple[float, str]] = {}
+        self.configure(latency={**DEFAULT_LATENCY, **(latency or {})}, errors=errors or {},
+                       concurrency=concurrency, max_queue=max_queue, step=step)
+        self.reset_stats()
+
+    # ----- yapılandırma -----
+    def configure(self, latency: Optional[Dict[str, Any]] = None, errors: Optional[Dict[str, Any]] = None,
+                  concurrency: Optional[int] = None, max_queue: Optional[int] = None, step: Optional[float] = None,
+                  **_ignored):
+        with self._lock:
+            if latency:
+                self.latency.update({k: parse_latency(v) for k, v in latency.items()})
+            if errors is not None:
+                self.errors.update({k: parse_error(v) for k, v in errors.items()})
+            if concurrency is not None:
+                self.concurrency = max(1, int(concurrency))
+                self._gpu = threading.BoundedSemaphore(self.concurrency)
+            if max_queue is not None:
+                self.max_queue = int(max_queue) if int(max_queue) >= 0 else None
+            elif not hasattr(self, "max_queue"):
+                self.max_queue = None
+            if step is not None:
+                self.step = float(step)
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats: Dict[str, Any] = {"requests": {}, "errors": {}, "images": 0, "model_swaps": 0,
+                                          "max_active": 0, "max_queued": 0, "busy_sec": 0.0,
+                                          "rejected": 0, "started_at": time.time()}
+
+    # ----- yaşam döngüsü -----
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> str:
+        handler = type("MockForgeHandler", (_Handler,), {"mock": self})
+        self._server = _Server((self.host, self.port), handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name=f"mock-forge:{self.port}")
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "MockForge":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ----- yardımcılar -----
+    def _delay(self, name: str, extra: float = 0.0) -> float:
+        fn = self.latency.get(name) or self.latency.get("*")
+        with self._rnd_lock:
+            d = fn(self._rnd) if fn else 0.0
+        return d + extra
+
+    def _inject(self, name: str) -> Optional[str]:
+        rate, kind = self.errors.get(name) or self.errors.get("*") or (0.0, "500")
+        with self._rnd_lock:
+            hit = rate > 0 and self._rnd.random() < rate
+        if hit:
+            with self._lock:
+                self.stats["errors"][name] = self.stats["errors"].get(name, 0) + 1
+            return kind
+        return None
+
+    def _gpu_run(self, duration: float, steps: int = 0):
+        """GPU sırası: sınır doluysa bekler (max_queue aşılırsa OverflowError)."""
+        with self._lock:
+            if self.max_queue is not None and len(self._active) >= self.concurrency and self._queued >= self.max_queue:
+                self.stats["rejected"] += 1
+                raise OverflowError("kuyruk dolu")
+            self._queued += 1
+            self.stats["max_queued"] = max(self.stats["max_queued"], self._queued)
+            gpu = self._gpu
+        gpu.acquire()
+        try:
+            with self._lock:
+                self._queued -= 1
+                self._job_seq += 1
+                job = self._job_seq
+                self._active[job] = (time.monotonic(), duration, steps)
+                self.stats["max_active"] = max(self.stats["max_active"], len(self._active))
+            time.sleep(duration)
+        finally:
+            with self._lock:
+                self._active.pop(job, None)
+                self.stats["busy_sec"] += duration
+            gpu.release()
+
+    def _switch_model(self, name: Optional[str]) -> bool:
+        if not name or name == self.checkpoint:
+            return False
+        time.sleep(self._delay("options_set"))
+        with self._lock:
+            self.checkpoint = name
+            self.stats["model_swaps"] += 1
+        return True
+
+    def progress(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            jobs = sorted(self._active.values())
+            queued = self._queued
+        if not jobs:
+            return {"progress": 0.0, "eta_relative": 0.0, "current_image": None, "textinfo": None,
+                    "state": {"job_count": queued, "sampling_step": 0, "sampling_steps": 0, "interrupted": False}}
+        t0, dur, steps = jobs[0]
+        frac = min(0.99, (now - t0) / dur) if dur > 0 else 0.99
+        return {"progress": round(frac, 3), "eta_relative": round(max(0.0, dur - (now - t0)), 3),
+                "current_image": None, "textinfo": None,
+                "state": {"job_count": len(jobs) + queued, "sampling_step": int(frac * steps),
+                          "sampling_steps": steps, "interrupted": False}}
+
+    # ----- uç noktalar -----
+    def handle(self, name: str, body: Any) -> Tuple[int, Any]:
+        if name == "txt2img":
+            steps = int(body.get("steps", 20) or 20)
+            ckpt = ((body.get("override_settings") or {}).get("sd_model_checkpoint") or "").strip()
+            if ckpt:
+                self._switch_model(ckpt)
+            self._gpu_run(self._delay("txt2img", self.step * steps), steps)
+            w, h = int(body.get("width", 512)), int(body.get("height", 512))
+            n = max(1, int(body.get("batch_size", 1) or 1)) * max(1, int(body.get("n_iter", 1) or 1))
+            seed = int(body.get("seed", -1))
+            if seed < 0:
+                with self._rnd_lock:
+                    seed = self._rnd.randint(0, 2 ** 31)
+            imgs = [base64.b64encode(synthetic_png(w, h, _color(seed + i, body.get("prompt", ""), self.checkpoint)))
+                    .decode("ascii") for i in range(n)]
+            with self._lock:
+                self.stats["images"] += n
+            return 200, {"images": imgs, "parameters": {}, "info": json.dumps({"seed": seed})}
+        if name == "options_get":
+            return 200, {"sd_model_checkpoint": self.checkpoint, "samples_format": "png"}
+        if name == "options_set":
+            self._switch_model((body or {}).get("sd_model_checkpoint"))
+            return 200, {}
+        if name == "progress":
+            return 200, self.progress()
+        if name == "sd_models":
+            return 200, [{"title": m, "model_name": m.split(".")[0], "hash": m[-9:-1],
+                          "filename": f"/models/{m.split(' ')[0]}"} for m in MODELS]
+        if name == "samplers":
+            return 200, [{"name": s, "aliases": [], "options": {}} for s in SAMPLERS]
+        if name == "prompt_styles":
+            return 200, [{"name": "Cinematic", "prompt": "{prompt}, cinematic", "negative_prompt": ""},
+                         {"name": "Watercolor", "prompt": "{prompt}, watercolor", "negative_prompt": ""}]
+        if name == "script_info":
+            return 200, [{"name": "reactor", "is_alwayson": True, "is_img2img": False,
+                          "args": [{"label": "Enable", "value": False}, {"label": "Source image", "value": None},
+                                   {"label": "Swap in loop", "value": False}]},
+                         {"name": "controlnet", "is_alwayson": True, "is_img2img": False, "args": []}]
+        if name == "cn_version":
+            return 200, {"version": 2}
+        if name == "cn_model_list":
+            return 200, {"model_list": CN_MODELS}
+        if name == "cn_module_list":
+            return 200, {"module_list": CN_MODULES}
+        if name == "cn_detect":
+            imgs = body.get("controlnet_input_images") or []
+            res = int(body.get("controlnet_processor_res", 512) or 512)
+            self._gpu_run(self._delay("cn_detect"))
+            maps = [synthetic_png(res, res, _color("map", body.get("controlnet_module"), i)) for i in range(len(imgs))]
+            return 200, {"images": [base64.b64encode(m).decode("ascii") for m in maps], "info": "Success"}
+        if name == "reactor_models":
+            return 200, {"models": ["inswapper_128.onnx"]}
+        if name == "reactor_image":
+            target = body.get("target_image") or ""
+            w, h = _b64_size(target) or (512, 512)
+            self._gpu_run(self._delay("reactor_image"))
+            png = synthetic_png(w, h, _color("reactor", hashlib.sha1(target.encode("ascii", "ignore")).hexdigest()))
+            return 200, {"image": base64.b64encode(png).decode("ascii")}
+        if name == "mock_stats":
+            with self._lock:
+                st = json.loads(json.dumps(self.stats))
+            st["uptime_sec"] = round(time.time() - st.pop("started_at"), 3)
+            st["checkpoint"] = self.checkpoint
+            return 200, st
+        if name == "mock_config":
+            self.configure(**(body or {}))
+            return 200, {"ok": True}
+        if name == "mock_reset":
+            self.reset_stats()
+            return 200, {"ok": True}
+        return 404, {"detail": "Not Found"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    mock: MockForge
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code: int, obj: Any):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method: str):
+        path = urlsplit(self.path).path.rstrip("/") or "/"
+        n = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(n) if n else b""
+        name = ROUTES.get((method, path))
+        mf = self.mock
+        with mf._lock:
+            key = name or path
+            mf.stats["requests"][key] = mf.stats["requests"].get(key, 0) + 1
+        if name is None:
+            return self._send(404, {"detail": "Not Found"})
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            return self._send(422, {"detail": "JSON okunamadı"})
+        if not name.startswith("mock_"):
+            kind = mf._inject(name)
+            if kind == "drop":
+                self.close_connection = True
+                return
+            if kind:
+                return self._send(int(kind) if kind.isdigit() else 500, {"error": "injected", "detail": f"mock {kind}"})
+        try:
+            code, obj = mf.handle(name, body)
+        except OverflowError as e:
+            code, obj = 503, {"error": "busy", "detail": str(e)}
+        except Exception as e:
+            code, obj = 500, {"error": type(e).__name__, "detail": str(e)}
+        self._send(code, obj)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+
+def _kv_specs(items) -> Dict[str, str]:
+    out = {}
+    for it in items or []:
+        k, _, v = it.partition("=")
+        out[k.strip()] = v.strip()
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Sahte Forge/A1111 API sunucusu (test ve yük benchmark'ı)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=7861)
+    ap.add_argument("--latency", action="append", metavar="UÇ=DAĞILIM",
+                    help="ör. txt2img=uniform:2,4  options_set=fixed:5  *=fixed:0.01 (birden çok kez verilebilir)")
+    ap.add_argument("--error", action="append", metavar="UÇ=ORAN[:TÜR]",
+                    help="ör. txt2img=0.05:503  reactor_image=0.1:drop  *=0.01")
+    ap.add_argument("--concurrency", type=int, default=1, help="Aynı anda işlenen GPU isteği")
+    ap.add_argument("--max-queue", type=int, default=-1, help="Bekleyen GPU isteği sınırı (aşılırsa 503; -1 sınırsız)")
+    ap.add_argument("--step", type=float, default=0.0, help="txt2img'e adım başına eklenen saniye")
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+
+    mf = MockForge(latency=_kv_specs(args.latency), errors=_kv_specs(args.error), concurrency=args.concurrency,
+                   max_queue=args.max_queue, step=args.step, host=args.host, port=args.port, seed=args.seed)
+    print(f"[INFO] Sahte Forge: {mf.start()} | eşzamanlılık={mf.concurrency} | Ctrl+C ile dur")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mf.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+# output_manifest.py
+# Kitap başına çıktı manifesti (SQLite): tamamlanan her sayfa{N}.png için yol, boyut, sha1, mtime.
+# - Atlama kararları, Excel @sayfaN geri doldurma ve ilerleme sayıları diske dokunmadan buradan okunur
+#   (ağ paylaşımında çocuk × sayfa kadar os.path.exists yerine açılışta tek SELECT).
+# - Kayıt: dosya geçici adla yazılıp os.replace ile yerine konur, ardından manifest satırı tek işlemde güncellenir.
+# - Manifest ilk kurulumu tamamlanana kadar (meta: bootstrap_complete) ya da --rescan ile diskten kurulur.
+# - Her satır çıktının kaynak özetini (provenance) taşır: sayfa ayarı, işlenmiş prompt, satır değişkenleri,
+#   yüz dosyasının içerik hash'i ve checkpoint. Özet değişen (çocuk, sayfa) çiftleri yeniden üretilir;
+#   özeti olmayan (eski) ya da başka runner'ın damgaladığı satırlar güncel sayılır ve damgalanır.
+#   Kullanım: python output_manifest.py --book-id <id> --rescan
+from __future__ import annotations
+import argparse, hashlib, json, os, pathlib, re, sqlite3, threading, time, uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+MANIFESTS_DIR = os.path.join(DATA_DIR, "manifests")
+PAGE_FILE_RE = re.compile(r"^sayfa(\d+)\.png$", re.I)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    path        TEXT PRIMARY KEY,
+    child_dir   TEXT NOT NULL,
+    page_index  INTEGER NOT NULL,
+    size        INTEGER NOT NULL,
+    sha1        TEXT NOT NULL,
+    mtime       REAL NOT NULL,
+    recorded_at REAL NOT NULL,
+    provenance  TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS outputs_child ON outputs(child_dir);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+# Diskteki mevcut çıktılar manifeste tam olarak aktarıldı mı? İlk kurulum yarıda kalırsa (çökme / iptal)
+# işaret yazılmaz ve sonraki çalıştırma taramaya devam eder; dosyanın varlığı tek başına yeterli değildir.
+BOOTSTRAP_KEY = "bootstrap_complete"
+
+
+def manifest_path(book_id: str, manifests_dir: str = MANIFESTS_DIR) -> str:
+    return os.path.join(manifests_dir, f"{book_id}.sqlite3")
+
+
+def _key(path: str) -> str:
+    return os.path.normcase(os.path.abspath(str(path)))
+
+
+def _sha1_file(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+PROVENANCE_VERSION = 1
+# Sayfa ayarında çıktıyı etkilemeyen alanlar
+_PAGE_VOLATILE = ("id", "created_at", "updated_at")
+# Runner'ların listeye geri yazdığı çıktı sütunları ('@sayfaN', eski 'out'): satır değişkeni sayılmaz
+OUTPUT_COL_RE = re.compile(r"^'?@sayfa\d+$|^out$", re.I)
+_SHA_MEMO: Dict[Tuple[str, int, int], str] = {}
+_SHA_LOCK = threading.Lock()
+
+
+def file_sha1(path: str) -> str:
+    """İçerik sha1'i; (yol, boyut, mtime) aynı kaldıkça süreç içinde yeniden okunmaz (yüz dosyaları)."""
+    st = os.stat(path)
+    k = (_key(path), st.st_size, st.st_mtime_ns)
+    with _SHA_LOCK:
+        h = _SHA_MEMO.get(k)
+    if h is None:
+        h = _sha1_file(path)
+        with _SHA_LOCK:
+            _SHA_MEMO[k] = h
+    return h
+
+
+def provenance_hash(ns: str, page: Dict[str, object], child_vars: Dict[str, object], face_sha1: str,
+                    prompt: str = "", negative: str = "", checkpoint: str = "",
+                    extra: Optional[Dict[str, object]] = None) -> str:
+    """
+    "<ns>:<sha1>" — ns runner adıdır ("api" / "ui"); iki runner aynı girdiden farklı özet üretebildiği için
+    karşılaştırma yalnız aynı ns içinde yapılır (bkz. OutputManifest.current).
+    """
+    doc = {
+        "v": PROVENANCE_VERSION,
+        "page": {k: v for k, v in (page or {}).items() if k not in _PAGE_VOLATILE},
+        "vars": {str(k): "" if v is None else str(v) for k, v in (child_vars or {}).items()
+                 if not OUTPUT_COL_RE.match(str(k).strip())},
+        "face": face_sha1, "prompt": prompt, "negative": negative, "checkpoint": checkpoint or "",
+        "extra": extra or {},
+    }
+    raw = json.dumps(doc, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return f"{ns}:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+
+def _prov_ns(prov: Optional[str]) -> str:
+    return prov.split(":", 1)[0] if prov and ":" in prov else ""
+
+
+class OutputManifest:
+    """
+    - has(path) -> bool                       (bellekteki indeks, O(1), disk erişimi yok)
+    - existing(paths) -> List[str]            (verilen sırayla, manifestte olanlar)
+    - write_bytes(path, data)                 (atomik yaz + kaydet)
+    - record(path, data=None)                 (başka yoldan yazılmış dosyayı kaydet)
+    - count(paths=None), rescan(out_root=None, child_dirs=None)
+    - bootstrapped / mark_bootstrapped()      (ilk kurulum bitti mi; bitmediyse çocuk klasörleri taranır)
+    - current(paths, provs, adopt=True) -> List[str]   (var olan ve kaynak özeti değişmemiş çıktılar)
+    - plan(paths, provs) -> List[str]                  (her yol için: current / missing / changed / unstamped)
+    - open_readonly(book_id) -> OutputManifest | None  (salt okunur; manifest yoksa oluşturmaz)
+    Aynı nesne birden çok thread'den kullanılabilir; ayrı süreçler aynı dosyayı WAL ile paylaşır.
+    """
+    def __init__(self, db_path: str, readonly: bool = False):
+        """readonly=True: var olan dosya salt okunur açılır (şema/göç/yazma yok; dry-run ve panel sayfaları için)."""
+        self.db_path = db_path
+        self.readonly = readonly
+        self.is_new = not os.path.exists(db_path)
+        self._lock = threading.Lock()
+        if readonly:
+            uri = pathlib.Path(os.path.abspath(db_path)).as_uri() + "?mode=ro"
+            self._db = sqlite3.connect(uri, uri=True, timeout=30, check_same_thread=False)
+        else:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            with self._db:
+                self._db.executescript(_SCHEMA)
+                cols = {r[1] for r in self._db.execute("PRAGMA table_info(outputs)")}
+                if "provenance" not in cols:
+                    # eski manifest: sütun eklenir, mevcut satırlar özetsiz (ilk çalıştırmada damgalanır)
+                    self._db.execute("ALTER TABLE outputs ADD COLUMN provenance TEXT")
+        self._rows: Dict[str, Tuple[int, str, float, Optional[str]]] = {}
+        self.reload()
+
+    @classmethod
+    def for_book(cls, book_id: str, manifests_dir: str = MANIFESTS_DIR) -> "OutputManifest":
+        return cls(manifest_path(book_id, manifests_dir))
+
+    @classmethod
+    def open_readonly(cls, book_id: str, manifests_dir: str = MANIFESTS_DIR) -> Optional["OutputManifest"]:
+        """Kitabın manifesti salt okunur; henüz yoksa None (oluşturulmaz)."""
+        path = manifest_path(book_id, manifests_dir)
+        return cls(path, readonly=True) if os.path.exists(path) else None
+
+    def reload(self):
+        """Başka bir süreç (ör. UI runner) yazdıysa bellekteki indeksi tazeler."""
+        with self._lock:
+            cols = {r[1] for r in self._db.execute("PRAGMA table_info(outputs)")}
+            prov = "provenance" if "provenance" in cols else "NULL"      # salt okunur eski manifest
+            self._rows = {r[0]: (r[1], r[2], r[3], r[4]) for r in
+                          self._db.execute(f"SELECT path, size, sha1, mtime, {prov} FROM outputs")}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # ----- meta -----
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            try:
+                row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            except sqlite3.OperationalError:
+                if not self.readonly:
+                    raise
+                row = None                   # salt okunur açılan eski manifestte meta tablosu yok
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._lock, self._db:
+            self._db.execute("INSERT INTO meta(key, value) VALUES(?, ?) "
+                             "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, str(value)))
+
+    @property
+    def bootstrapped(self) -> bool:
+        return self.get_meta(BOOTSTRAP_KEY) is not None
+
+    def mark_bootstrapped(self):
+        """Yalnız tüm çocuk klasörleri taranıp kaydedildikten sonra çağrılmalı."""
+        self.set_meta(BOOTSTRAP_KEY, f"{time.time():.0f}")
+
+    # ----- okuma -----
+    def has(self, path: str) -> bool:
+        return _key(path) in self._rows
+
+    def get(self, path: str) -> Optional[Dict[str, object]]:
+        r = self._rows.get(_key(path))
+        return {"size": r[0], "sha1": r[1], "mtime": r[2], "provenance": r[3]} if r else None
+
+    def existing(self, paths: Iterable[str]) -> List[str]:
+        return [p for p in paths if _key(p) in self._rows]
+
+    def count(self, paths: Optional[Iterable[str]] = None) -> int:
+        if paths is None:
+            return len(self._rows)
+        return sum(1 for p in paths if _key(p) in self._rows)
+
+    def plan(self, paths: Iterable[str], provs: Iterable[str]) -> List[str]:
+        """Salt okunur (dry-run): her yol için 'current' | 'missing' | 'changed' | 'unstamped'."""
+        out = []
+        for path, prov in zip(paths, provs):
+            r = self._rows.get(_key(path))
+            if r is None:
+                out.append("missing")
+            elif r[3] == prov:
+                out.append("current")
+            elif r[3] is None or _prov_ns(r[3]) != _prov_ns(prov):
+                out.append("unstamped")
+            else:
+                out.append("changed")
+        return out
+
+    def current(self, paths: Iterable[str], provs: Iterable[str], adopt: bool = True) -> List[str]:
+        """
+        Verilen sırayla, var olan ve özeti güncel çıktılar.
+        Özetsiz / başka ns'li satırlar güncel sayılır; adopt=True ise verilen özetle damgalanır.
+        """
+        paths, provs = list(paths), list(provs)
+        done, stamp = [], []
+        for path, prov, st in zip(paths, provs, self.plan(paths, provs)):
+            if st == "current":
+                done.append(path)
+            elif st == "unstamped":
+                done.append(path)
+                stamp.append((prov, _key(path)))
+        if adopt and stamp:
+            with self._lock:
+                with self._db:
+                    self._db.executemany("UPDATE outputs SET provenance = ? WHERE path = ?", stamp)
+                for prov, k in stamp:
+                    r = self._rows.get(k)
+                    if r:
+                        self._rows[k] = (r[0], r[1], r[2], prov)
+        return done
+
+    # ----- yazma -----
+    def write_bytes(self, path: str, data: bytes, provenance: Optional[str] = None):
+        """Geçici dosyaya yazar, os.replace ile yerine koyar, sonra manifeste işler."""
+        path = str(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.record(path, data, provenance=provenance)
+
+    def record(self, path: str, data: Optional[bytes] = None, provenance: Optional[str] = None):
+        path = str(path)
+        st = os.stat(path)
+        sha1 = hashlib.sha1(data).hexdigest() if data is not None else _sha1_file(path)
+        self._upsert([(path, st.st_size, sha1, st.st_mtime)], provenance=provenance)
+
+    def forget(self, path: str):
+        k = _key(path)
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM outputs WHERE path = ?", (k,))
+            self._rows.pop(k, None)
+
+    def _upsert(self, rows: List[Tuple[str, int, str, float]], provenance: Optional[str] = None):
+        """provenance verilmezse (rescan) satırın mevcut özeti korunur."""
+        now = time.time()
+        vals = []
+        for path, size, sha1, mtime in rows:
+            k = _key(path)
+            m = PAGE_FILE_RE.match(os.path.basename(path))
+            vals.append((k, os.path.dirname(k), int(m.group(1)) if m else 0, int(size), sha1, float(mtime), now,
+                         provenance))
+        with self._lock:
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO outputs (path, child_dir, page_index, size, sha1, mtime, recorded_at, provenance) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET size = excluded.size, sha1 = excluded.sha1, "
+                    "mtime = excluded.mtime, recorded_at = excluded.recorded_at, "
+                    "provenance = COALESCE(excluded.provenance, outputs.provenance)", vals)
+            for v in vals:
+                old = self._rows.get(v[0])
+                prov = provenance if provenance is not None else (old[3] if old else None)
+                self._rows[v[0]] = (v[3], v[4], v[5], prov)
+
+    # ----- diskten yeniden kurma -----
+    def rescan(self, out_root: Optional[str] = None, child_dirs: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """
+        child_dirs verilirse yalnız o klasörler (çocuk başına tek listdir), yoksa out_root altı baştan sona taranır.
+        Boyut + mtime değişmemişse eski hash korunur (dosya yeniden okunmaz).
+        Diskte artık olmayan kayıtlar taranan kapsamdan silinir.
+        """
+        if child_dirs is not None:
+            dirs = [str(d) for d in child_dirs]
+        elif out_root:
+            dirs = [root for root, _, files in os.walk(out_root) if any(PAGE_FILE_RE.match(f) for f in files)]
+        else:
+            raise ValueError("rescan: out_root ya da child_dirs gerekli")
+
+        found: List[Tuple[str, int, str, float]] = []
+        hashed = 0
+        for d in dirs:
+            try:
+                entries = list(os.scandir(d))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            for e in entries:
+                if not (PAGE_FILE_RE.match(e.name) and e.is_file()):
+                    continue
+                st = e.stat()
+                old = self._rows.get(_key(e.path))
+                if old and old[0] == st.st_size and old[2] == st.st_mtime:
+                    sha1 = old[1]
+                else:
+                    sha1 = _sha1_file(e.path); hashed += 1
+                found.append((e.path, st.st_size, sha1, st.st_mtime))
+
+        scope = {_key(d) for d in dirs}
+        if child_dirs is None and out_root:
+            root_k = _key(out_root)
+            in_scope = lambda k: k == root_k or k.startswith(root_k + os.sep)
+        else:
+            in_scope = lambda k: os.path.dirname(k) in scope
+        seen = {_key(p) for p, *_ in found}
+        stale = [k for k in list(self._rows) if in_scope(k) and k not in seen]
+        with self._lock:
+            with self._db:
+                self._db.executemany("DELETE FROM outputs WHERE path = ?", [(k,) for k in stale])
+            for k in stale:
+                self._rows.pop(k, None)
+        if found:
+            self._upsert(found)
+        return {"dirs": len(dirs), "files": len(found), "hashed": hashed, "removed": len(stale)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Kitap çıktı manifesti (data/manifests/<book_id>.sqlite3)")
+    ap.add_argument("--book-id", required=True, help="data/books/<book_id>.json")
+    ap.add_argument("--out-root", default=None, help="Varsayılan: kitap ayarındaki output_root")
+    ap.add_argument("--rescan", action="store_true", help="Manifesti diskteki sayfa{N}.png dosyalarından yeniden kur")
+    args = ap.parse_args()
+
+    out_root = args.out_root
+    if not out_root:
+        with open(os.path.join(DATA_DIR, "books", f"{args.book_id}.json"), "r", encoding="utf-8") as f:
+            out_root = ((json.load(f).get("settings") or {}).get("output_root") or "").strip()
+    m = OutputManifest.for_book(args.book_id)
+    if args.rescan:
+        if not out_root:
+            ap.error("output_root bulunamadı; --out-root verin")
+        t0 = time.time()
+        st = m.rescan(out_root=out_root)
+        m.mark_bootstrapped()
+        print(f"[MANIFEST] {out_root} tarandı: klasör={st['dirs']} dosya={st['files']} "
+              f"hash={st['hashed']} silinen={st['removed']} ({time.time() - t0:.1f}s)")
+    print(f"[MANIFEST] {m.db_path}: {m.count()} çıktı")
+
+
+if __name__ == "__main__":
+    main()
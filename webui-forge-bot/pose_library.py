@@ -0,0 +1,140 @@
+# pose_library.py
+# Poz kütüphanesi: poz klasörleri/dosyaları süreç boyunca bir kez indekslenir.
+# - Kaynak (sayfanın pose_path'i ya da kitabın poses_dir'i) → poz kimliği; klasörse sıralı ilk görsel
+#   (find_pose_image_path ile aynı kural). Klasör mtime'ı en fazla CHECK_SEC'te bir kontrol edilir;
+#   sayfa başına listdir + sort yapılmaz.
+# - Her poz kaydı gönderime hazır base64'ünü (image_cache üzerinden, bir kez) ve isteğe bağlı
+#   /controlnet/detect haritalarını (modül, çözünürlük) tutar; kimlikle O(1) erişim.
+from __future__ import annotations
+import hashlib, os, threading, time
+from typing import Dict, Optional, Tuple
+
+from image_cache import cached_png_b64
+
+POSE_EXTS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+CHECK_SEC = float(os.environ.get("POSE_INDEX_CHECK_SEC", "5"))
+
+
+def pose_id(path: str) -> str:
+    return hashlib.sha1(os.path.normcase(os.path.abspath(path)).encode("utf-8")).hexdigest()[:16]
+
+
+def _file_sig(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def first_pose_file(source: str) -> Optional[str]:
+    """Dosyaysa kendisi, klasörse ada göre sıralı ilk görsel."""
+    p = (source or "").strip()
+    if not p:
+        return None
+    if os.path.isfile(p):
+        return p
+    if os.path.isdir(p):
+        files = sorted(os.path.join(p, n) for n in os.listdir(p) if n.lower().endswith(POSE_EXTS))
+        if files:
+            return files[0]
+    return None
+
+
+class PoseEntry:
+    """Tek poz: yol, dosya imzası, base64 (ilk istekte) ve detect haritaları."""
+    __slots__ = ("id", "path", "sig", "convert_rgb", "_b64", "maps", "_lock")
+
+    def __init__(self, path: str, sig: Tuple[int, int], convert_rgb: bool = False):
+        self.id = pose_id(path)
+        self.path = path
+        self.sig = sig
+        self.convert_rgb = convert_rgb
+        self._b64: Optional[str] = None
+        self.maps: Dict[Tuple[str, int], Optional[str]] = {}
+        self._lock = threading.Lock()
+
+    def b64(self) -> str:
+        if self._b64 is None:
+            with self._lock:
+                if self._b64 is None:
+                    self._b64 = cached_png_b64(self.path, convert_rgb=self.convert_rgb)
+        return self._b64
+
+
+class PoseLibrary:
+    """
+    - resolve(source) -> Optional[PoseEntry]  (kaynak → poz; kontroller CHECK_SEC ile seyreltilir)
+    - get(pose_id) -> Optional[PoseEntry]      (O(1))
+    - control_map(entry, module, res, control_maps) -> Optional[str]  (poz başına bir kez detect)
+    stats: scans, hits — worker'lardan; _lock altında
+    """
+    def __init__(self, convert_rgb: bool = False, check_sec: float = CHECK_SEC):
+        self.convert_rgb = convert_rgb
+        self.check_sec = float(check_sec)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, PoseEntry] = {}
+        # kaynak -> (son kontrol, klasör/dosya imzası, poz kimliği ya da None)
+        self._sources: Dict[str, Tuple[float, Optional[Tuple[int, int]], Optional[str]]] = {}
+        self.stats = {"scans": 0, "hits": 0}
+
+    def get(self, pid: str) -> Optional[PoseEntry]:
+        return self._entries.get(pid)
+
+    def resolve(self, source: str) -> Optional[PoseEntry]:
+        src = (source or "").strip()
+        if not src:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            hit = self._sources.get(src)
+        if hit and now - hit[0] < self.check_sec:
+            with self._lock:
+                self.stats["hits"] += 1
+            return self._entries.get(hit[2]) if hit[2] else None
+
+        src_sig = _file_sig(src)
+        if hit and src_sig is not None and hit[1] == src_sig and hit[2] in self._entries:
+            # klasör içeriği (ya da dosya) değişmedi; seçili dosyanın kendisi değişmiş olabilir
+            entry = self._entries[hit[2]]
+            path = entry.path
+        else:
+            with self._lock:
+                self.stats["scans"] += 1
+            path = first_pose_file(src)
+            entry = None
+        sig = _file_sig(path) if path else None
+        if sig is None:
+            with self._lock:
+                self._sources[src] = (now, src_sig, None)
+            return None
+        if entry is None or entry.sig != sig:
+            with self._lock:
+                entry = self._entries.get(pose_id(path))
+                if entry is None or entry.sig != sig:
+                    entry = PoseEntry(path, sig, self.convert_rgb)
+                    self._entries[entry.id] = entry
+        with self._lock:
+            self._sources[src] = (now, src_sig, entry.id)
+        return entry
+
+    def control_map(self, entry: PoseEntry, module: str, res: int, control_maps) -> Optional[str]:
+        key = (module, int(res))
+        if key not in entry.maps:
+            m = control_maps.control_map(entry.b64(), module, res)
+            if m is None:
+                return None          # detect yok / geçici hata: kalıcı "None" yazma, sonra yeniden denensin
+            entry.maps[key] = m
+        return entry.maps[key]
+
+
+_DEFAULTS: Dict[bool, PoseLibrary] = {}
+_DEFAULTS_LOCK = threading.Lock()
+
+
+def default_library(convert_rgb: bool = False) -> PoseLibrary:
+    with _DEFAULTS_LOCK:
+        lib = _DEFAULTS.get(convert_rgb)
+        if lib is None:
+            lib = _DEFAULTS[convert_rgb] = PoseLibrary(convert_rgb=convert_rgb)
+        return lib
@@ -0,0 +1,123 @@
+# preview_service.py
+# İş önizlemeleri için küçültülmüş WebP/JPEG kopyalar (tam boy PNG yerine; VPN'de yenileme başına 3–5 MB gitmesin).
+# - Birkaç sabit boyut (SIZES); istenen boyut bir üstteki sabite yuvarlanır.
+# - Anahtar: çıktının içerik hash'i (sha1) + boyut + biçim → data/cache/previews/<sha1>_<boyut>.<uzantı>
+#   Hash (yol, boyut, mtime) ile bellekte tutulur; aynı dosya için yeniden okunmaz.
+# - ETag içerikten türetilir; tarayıcı If-None-Match ile 304 alır.
+# - inline(): SSE 'image' olayına gömülecek küçük data URI (ilk boyama ek istek beklemez).
+from __future__ import annotations
+import base64, hashlib, io, os, threading, uuid
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache", "previews")
+SIZES = (64, 256, 512, 1024)
+INLINE_SIZE = 64
+QUALITY = int(os.environ.get("PREVIEW_QUALITY", "80"))
+MIMETYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+try:
+    from PIL import features as _pil_features
+    WEBP_OK = bool(_pil_features.check("webp"))
+except Exception:
+    WEBP_OK = False
+
+
+def snap_size(n: Optional[int]) -> int:
+    n = int(n or SIZES[-1])
+    return next((s for s in SIZES if s >= n), SIZES[-1])
+
+
+def best_format(accept: str) -> str:
+    """Accept başlığına göre: image/webp destekleniyorsa webp, yoksa jpeg."""
+    return "webp" if WEBP_OK and "image/webp" in (accept or "") else "jpeg"
+
+
+def _sha1_file(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _encode(path: str, size: int, fmt: str) -> bytes:
+    from PIL import Image
+    with Image.open(path) as im:
+        im.draft("RGB", (size, size))
+        im = im.convert("RGB")
+        im.thumbnail((size, size), Image.LANCZOS)
+        buf = io.BytesIO()
+        if fmt == "webp":
+            im.save(buf, format="WEBP", quality=QUALITY, method=4)
+        else:
+            im.save(buf, format="JPEG", quality=QUALITY, optimize=True, progressive=size >= 512)
+        return buf.getvalue()
+
+
+class PreviewService:
+    """
+    - source_hash(path) -> sha1                     ((yol, boyut, mtime) anahtarlı bellek önbelleği)
+    - get(path, size, fmt) -> (dosya yolu, etag)     (yoksa üretilip diske atomik yazılır)
+    - inline(path, size=INLINE_SIZE) -> data URI    (küçük; SSE olayına gömülür)
+    """
+    def __init__(self, cache_dir: str = CACHE_DIR, hash_memo: int = 4096):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._hashes: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._hash_memo = hash_memo
+        self.stats = {"generated": 0, "hits": 0}
+
+    def source_hash(self, path: str) -> str:
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            h = self._hashes.get(key)
+            if h:
+                self._hashes.move_to_end(key)
+                return h
+        h = _sha1_file(path)
+        with self._lock:
+            self._hashes[key] = h
+            while len(self._hashes) > self._hash_memo:
+                self._hashes.popitem(last=False)
+        return h
+
+    @staticmethod
+    def etag(src_hash: str, size: int, fmt: str) -> str:
+        return f"{src_hash[:20]}-{size}-{fmt}"
+
+    def get(self, path: str, size: int, fmt: str = "jpeg") -> Tuple[str, str]:
+        size, fmt = snap_size(size), (fmt if fmt in MIMETYPES else "jpeg")
+        h = self.source_hash(path)
+        out = os.path.join(self.cache_dir, h[:2], f"{h}_{size}.{'jpg' if fmt == 'jpeg' else fmt}")
+        if os.path.exists(out):
+            self.stats["hits"] += 1
+        else:
+            data = _encode(path, size, fmt)
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            tmp = f"{out}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, out)
+            self.stats["generated"] += 1
+        return out, self.etag(h, size, fmt)
+
+    def inline(self, path: str, size: int = INLINE_SIZE) -> str:
+        fmt = "webp" if WEBP_OK else "jpeg"
+        p, _ = self.get(path, size, fmt)
+        with open(p, "rb") as f:
+            return f"data:{MIMETYPES[fmt]};base64," + base64.b64encode(f.read()).decode("ascii")
+
+
+_DEFAULT: Optional[PreviewService] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_service() -> PreviewService:
+    global _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = PreviewService()
+        return _DEFAULT
@@ -0,0 +1,332 @@
+# progress_hub.py
+# /jobs/<id>/stream SSE bağlantıları için ortak yayıncı (bellek içi pub/sub).
+# - İş başına tek thread (JobFeed): log dosyasını bir kez izler, son görsel ve iş durumunu okur,
+#   olayları (log / image / progress / done) tüm abonelere dağıtır.
+# - Backend başına tek /sdapi/v1/progress yoklayıcısı (BackendProgress); yalnız dinleyen iş varken çalışır,
+#   backend boştayken aralığı katlayarak uzatır. 5 kişi izlerken Forge'a saniyede 10 istek gitmez.
+# - Son abone ayrıldıktan LINGER_SEC sonra thread'ler durur; ilk abone yeniden başlatır.
+# - Log olaylarının kimliği log dosyasındaki bayt ofsetidir (satır sonu). Son RING_LINES satır bellekte
+#   halka tamponda; yeniden bağlanan istemci Last-Event-ID'den devam eder (tampon dışı kalan kısım dosyadan).
+#   Durum sayfası eski logları log_chunk() ile ofsetten parça parça yükler.
+from __future__ import annotations
+import os, queue, threading, time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from forge_client import get_client
+
+POLL_SEC = float(os.environ.get("PROGRESS_POLL_SEC", "0.5"))
+IDLE_POLL_SEC = float(os.environ.get("PROGRESS_IDLE_POLL_SEC", "4"))
+TICK_SEC = 0.25
+IDLE_TICK_SEC = 1.0
+LINGER_SEC = 5.0
+KEEPALIVE_SEC = 15.0
+SUB_QUEUE = 2000
+RING_LINES = int(os.environ.get("JOB_LOG_RING", "2000"))
+LOG_CHUNK = 64 * 1024
+REPLAY_MAX = 4 * 1024 * 1024   # dosyadan tekrar oynatma sınırı (daha eskisi log_chunk ile)
+
+# (olay, veri) ya da kimlikli (olay, veri, id)
+Event = Tuple[Any, ...]
+
+
+def _decode(b: bytes) -> str:
+    return b.decode("utf-8", errors="replace").rstrip("\r\n")
+
+
+def log_chunk(path: str, before: Optional[int] = None, limit: int = LOG_CHUNK) -> Dict[str, Any]:
+    """
+    Log dosyasından `before` ofsetinden (yoksa dosya sonundan) geriye en fazla `limit` bayt, satır başına hizalı.
+    Dönen: {start, end, text}; start == 0 ise daha eski kayıt yok.
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return {"start": 0, "end": 0, "text": ""}
+    end = size if before is None else max(0, min(int(before), size))
+    start = max(0, end - max(1, int(limit)))
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    if start > 0:
+        nl = data.find(b"\n")
+        if nl < 0:
+            return {"start": end, "end": end, "text": ""}
+        start += nl + 1
+        data = data[nl + 1:]
+    return {"start": start, "end": end, "text": data.decode("utf-8", errors="replace")}
+
+
+class BackendProgress:
+    """
+    Tek backend için yoklayıcı. acquire()/release() ile dinleyen iş sayısı tutulur; sayı 0 iken thread durur.
+    Aralık: üretim sürerken POLL_SEC, progress 0 okundukça IDLE_POLL_SEC'e kadar iki katına çıkar.
+    """
+    def __init__(self, base: str):
+        self.base = base
+        self.pct = 0
+        self.stats = {"polls": 0}
+        self._refs = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def acquire(self):
+        with self._lock:
+            self._refs += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, daemon=True, name=f"progress:{self.base}")
+                self._thread.start()
+
+    def release(self):
+        with self._lock:
+            self._refs = max(0, self._refs - 1)
+
+    def _loop(self):
+        interval = POLL_SEC
+        while True:
+            with self._lock:
+                if self._refs == 0:
+                    self._thread = None
+                    return
+            pct = self.pct
+            try:
+                r = get_client(self.base).get("/sdapi/v1/progress?skip_current_image=true", retries=0)
+                if r.ok:
+                    pct = int(round(float((r.json() or {}).get("progress") or 0.0) * 100))
+            except Exception:
+                pass
+            self.stats["polls"] += 1
+            self.pct = pct
+            interval = POLL_SEC if pct > 0 else min(IDLE_POLL_SEC, interval * 2)
+            time.sleep(interval)
+
+
+_BACKENDS: Dict[str, BackendProgress] = {}
+_BACKENDS_LOCK = threading.Lock()
+
+
+def backend_progress(base: str) -> BackendProgress:
+    key = (base or "").rstrip("/")
+    with _BACKENDS_LOCK:
+        bp = _BACKENDS.get(key)
+        if bp is None:
+            bp = _BACKENDS[key] = BackendProgress(key)
+        return bp
+
+
+class Subscription:
+    """Tek SSE istemcisi. Yineleyince (olay, veri[, id]); KEEPALIVE_SEC sessizlikte ("ping", "")."""
+    def __init__(self, feed: "JobFeed"):
+        self.feed = feed
+        self.dropped = 0
+        self._q: "queue.Queue[Optional[Event]]" = queue.Queue(maxsize=SUB_QUEUE)
+
+    def put(self, ev: Optional[Event]):
+        try:
+            self._q.put_nowait(ev)
+        except queue.Full:
+            self.dropped += 1
+
+    def __iter__(self) -> Iterator[Event]:
+        while True:
+            try:
+                ev = self._q.get(timeout=KEEPALIVE_SEC)
+            except queue.Empty:
+                yield ("ping", "")
+                continue
+            if ev is None:
+                return
+            yield ev
+
+    def close(self):
+        self.feed.unsubscribe(self)
+
+
+class JobFeed:
+    """
+    İş başına yayıncı. get_job() -> iş kaydı (status, last_image); backends: ilerlemesi izlenecek Forge'lar.
+    - subscribe(after=None): after (Last-Event-ID / bayt ofseti) verilirse o noktadan sonraki log satırları
+      önce tekrar oynatılır (halka tampon, gerekirse dosya); yoksa yalnız bağlandıktan sonrakiler gelir.
+    - Yeni abone o anki önizleme ve ilerlemeyi hemen alır.
+    - image_data(yol, mtime) -> 'image' olayının verisi (varsayılan: mtime); yeni görsel başına bir kez çağrılır.
+    """
+    def __init__(self, job_id: str, log_path: str, get_job: Callable[[], Optional[dict]], backends: List[str],
+                 ring_lines: int = RING_LINES, image_data: Optional[Callable[[str, int], str]] = None):
+        self.job_id = job_id
+        self.log_path = log_path
+        self.get_job = get_job
+        self.image_data = image_data or (lambda path, ts: str(ts))
+        self.backends = [backend_progress(b) for b in backends]
+        self._subs: List[Subscription] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._last_img: Optional[Tuple[str, int]] = None
+        self._last_img_data = ""
+        self._last_pct = -1
+        self._pos: Optional[int] = None          # log dosyasında okunan son tam satırın sonu
+        self._ring: Deque[Tuple[int, int, str]] = deque(maxlen=max(1, int(ring_lines)))  # (başlangıç, bitiş, satır)
+
+    def subscribe(self, after: Optional[int] = None) -> Subscription:
+        sub = Subscription(self)
+        with self._lock:
+            if self._pos is None:
+                try:
+                    self._pos = os.path.getsize(self.log_path)
+                except OSError:
+                    self._pos = 0
+            if after is not None:
+                self._replay(sub, int(after))
+            self._subs.append(sub)
+            if self._last_img:
+                sub.put(("image", self._last_img_data))
+            if self._last_pct >= 0:
+                sub.put(("progress", str(self._last_pct)))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, daemon=True, name=f"jobfeed:{self.job_id}")
+                self._thread.start()
+        return sub
+
+    def _replay(self, sub: Subscription, after: int):
+        """Kilit altında: after'dan sonraki satırlar; tamponun gerisindeki kısım dosyadan (en fazla REPLAY_MAX)."""
+        ring_start = self._ring[0][0] if self._ring else self._pos
+        if after < ring_start:
+            begin = max(after, ring_start - REPLAY_MAX)
+            try:
+                with open(self.log_path, "rb") as f:
+                    f.seek(begin)
+                    data = f.read(ring_start - begin)
+            except OSError:
+                data = b""
+            if begin > after:                      # kesilen baş kısımdaki yarım satırı at
+                nl = data.find(b"\n")
+                begin, data = (begin + nl + 1, data[nl + 1:]) if nl >= 0 else (ring_start, b"")
+            pos = begin
+            for raw in data.splitlines(keepends=True):
+                pos += len(raw)
+                sub.put(("log", _decode(raw), pos))
+        for start, end, line in self._ring:
+            if end > after:
+                sub.put(("log", line, end))
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+
+    @property
+    def listeners(self) -> int:
+        return len(self._subs)
+
+    def _publish(self, ev: Optional[Event]):
+        with self._lock:
+            subs = list(self._subs)
+        for s in subs:
+            s.put(ev)
+
+    def _read_lines(self) -> bool:
+        """Yeni tam satırları tampona ekleyip yayınlar (tampon + yayın aynı kilit altında: replay ile yarışmaz)."""
+        try:
+            size = os.path.getsize(self.log_path)
+        except OSError:
+            return False
+        with self._lock:
+            pos = self._pos or 0
+        if size < pos:                             # dosya yeniden oluşturulmuş
+            pos = 0
+        if size == pos:
+            return False
+        with open(self.log_path, "rb") as f:
+            f.seek(pos)
+            data = f.read(size - pos)
+        cut = data.rfind(b"\n")
+        if cut < 0:
+            return False                           # yarım satır: tamamlanınca okunur
+        with self._lock:
+            for raw in data[:cut + 1].splitlines(keepends=True):
+                start, pos = pos, pos + len(raw)
+                line = _decode(raw)
+                self._ring.append((start, pos, line))
+                for s in self._subs:
+                    s.put(("log", line, pos))
+            self._pos = pos
+        return True
+
+    def _progress(self) -> int:
+        active = [b.pct for b in self.backends if b.pct > 0]
+        return int(round(sum(active) / len(active))) if active else 0
+
+    def _loop(self):
+        for b in self.backends:
+            b.acquire()
+        idle_since: Optional[float] = None
+        tick = TICK_SEC
+        try:
+            while True:
+                with self._lock:
+                    if not self._subs:
+                        idle_since = idle_since or time.monotonic()
+                        if time.monotonic() - idle_since >= LINGER_SEC:
+                            self._thread = None
+                            return
+                    else:
+                        idle_since = None
+
+                busy = self._read_lines()
+
+                job = self.get_job() or {}
+                li = job.get("last_image")
+                if li:
+                    try:
+                        ts = int(os.path.getmtime(li))
+                    except OSError:
+                        ts = None
+                    if ts is not None and self._last_img != (li, ts):
+                        try:
+                            data = self.image_data(li, ts)
+                        except Exception:
+                            data = str(ts)
+                        with self._lock:
+                            self._last_img, self._last_img_data = (li, ts), data
+                        self._publish(("image", data))
+                        busy = True
+
+                if self.backends:
+                    pct = self._progress()
+                    if pct != self._last_pct:
+                        self._last_pct = pct
+                        self._publish(("progress", str(pct)))
+
+                st = job.get("status")
+                if st != "running":
+                    self._read_lines()
+                    if self._last_pct < 100:
+                        self._publish(("progress", "100"))
+                    self._publish(("done", str(st)))
+                    self._publish(None)
+                    with self._lock:
+                        self._subs.clear()
+                        self._thread = None
+                    return
+
+                tick = TICK_SEC if busy else min(IDLE_TICK_SEC, tick * 1.5)
+                time.sleep(tick)
+        finally:
+            for b in self.backends:
+                b.release()
+            with _FEEDS_LOCK:
+                if _FEEDS.get(self.job_id) is self and self._thread is None:
+                    _FEEDS.pop(self.job_id, None)
+
+
+_FEEDS: Dict[str, JobFeed] = {}
+_FEEDS_LOCK = threading.Lock()
+
+
+def job_feed(job_id: str, log_path: str, get_job: Callable[[], Optional[dict]], backends: List[str],
+             image_data: Optional[Callable[[str, int], str]] = None) -> JobFeed:
+    """İşin paylaşılan yayıncısı (yoksa oluşturulur)."""
+    with _FEEDS_LOCK:
+        feed = _FEEDS.get(job_id)
+        if feed is None:
+            feed = _FEEDS[job_id] = JobFeed(job_id, log_path, get_job, backends, image_data=image_data)
+        return feed
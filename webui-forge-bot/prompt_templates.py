@@ -0,0 +1,148 @@
+# prompt_templates.py
+# Prompt değişkenleri: {KolonAdi} yer tutucuları + Excel satır değişkenleri.
+# - Şablon iş başına bir kez derlenir (sabit parçalar + çözülmüş aday anahtarlar)
+# - Her çocuk için normalize edilmiş değişken indeksi bir kez kurulur
+# - Sayfa başına render yalnızca sözlük araması + join
+# Sütun adı varyantları (unicodedata normalizasyonu) süreç boyunca bir kez hesaplanıp önbelleğe alınır.
+from __future__ import annotations
+import re, unicodedata
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple, Union
+
+
+@lru_cache(maxsize=8192)
+def _make_key_variants(key: str) -> Tuple[str, ...]:
+    """
+    Bir sütun adı için çoklu anahtar varyantları üretir:
+    - Orijinal / lower
+    - Boşluklar '_' ve tamamen silinmiş (snake / nospace)
+    - Türkçe katlama: ı->i, İ->I (hem orijinal hem lower formları)
+    - Aksan/diakritik temizlenmiş ASCII formlar (ör. 'Adı' -> 'Adi')
+    Bu varyantların hepsi için snake/nospace türevleri de eklenir.
+    Sonuç önbellekli ve sıralı (ilk eleman her zaman orijinal ad).
+    """
+    k = (key or "").strip()
+    if not k:
+        return ()
+
+    def _forms(s: str) -> List[str]:
+        snake   = re.sub(r"\s+", "_", s)
+        nospace = re.sub(r"\s+", "", s)
+        return [s, s.lower(), snake, snake.lower(), nospace, nospace.lower()]
+
+    def _deaccent(s: str) -> str:
+        return "".join(c for c in unicodedata.normalize("NFKD", s) if not unicodedata.combining(c))
+
+    variants: Dict[str, None] = dict.fromkeys(_forms(k))
+
+    # Türkçe 'ı/İ' katlaması
+    tr = k.replace("ı", "i").replace("İ", "I")
+    variants.update(dict.fromkeys(_forms(tr)))
+    variants.update(dict.fromkeys(_forms(tr.lower())))
+
+    # Aksan/diakritik temizleme (örn. 'Adı' -> 'Adi') + Türkçe katlanmış + deaccent
+    variants.update(dict.fromkeys(_forms(_deaccent(k))))
+    variants.update(dict.fromkeys(_forms(_deaccent(tr))))
+
+    return tuple(v for v in variants if v)
+
+
+def _lower_tr(s: str) -> str:
+    """Türkçe küçük harf dönüşümü (ı -> i, İ -> i)."""
+    return (s or "").lower().replace("ı", "i").replace("İ", "i")
+
+def _gender_en(raw: str) -> str:
+    """Türkçe veya İngilizce cinsiyet değerini 'girl'/'boy' olarak normalize eder."""
+    v = _lower_tr(raw).strip()
+    if v in {"kiz", "kız", "k", "female", "f", "kadin", "kadın", "girl"}:
+        return "girl"
+    if v in {"erkek", "e", "male", "m", "boy", "adam"}:
+        return "boy"
+    return raw or ""
+
+
+# Boşluk, Türkçe latin, @ ve _,- içerir (sütun adı boşluklu olabilir)
+VAR_TOKEN_RE = re.compile(r"\{([A-Za-z0-9_ @\-\u00C0-\u024F\u1E00-\u1EFF]+)\}")
+
+# Cinsiyet sütununun olası başlıkları (tüm varyantlarıyla, sıralı)
+GENDER_KEYS: Tuple[str, ...] = tuple(dict.fromkeys(
+    kv for cand in ("Cinsiyet", "cinsiyet", "Gender", "gender", "GENDER") for kv in _make_key_variants(cand)))
+
+
+def build_var_index(child: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Çocuğun tüm değişkenlerini (yerleşikler + satır sütunları) varyant anahtarlarıyla tek sözlükte toplar.
+    - 'Cinsiyet' özel kuralı: kız -> girl, erkek -> boy (tüm varyant anahtarlara uygulanır).
+    Çocuk başına bir kez kurulur; aynı çocuğun tüm sayfa şablonları bunu kullanır.
+    """
+    row_vars = (child.get("vars") or {})
+    idx: Dict[str, str] = {
+        "name": child.get("name", ""),
+        "class": child.get("class", ""),
+        "photo": child.get("face", ""),
+        "@photo": row_vars.get("@photo", ""),
+    }
+    for k, v in row_vars.items():
+        val = "" if v is None else str(v)
+        for key_variant in _make_key_variants(k):
+            idx[key_variant] = val
+
+    gender_raw = next((idx[gk] for gk in GENDER_KEYS if idx.get(gk)), None)
+    if gender_raw is not None:
+        mapped = _gender_en(gender_raw)
+        for gk in GENDER_KEYS:
+            idx[gk] = mapped
+    return idx
+
+
+class CompiledTemplate:
+    """
+    Parçalanmış şablon: sabit metinler ve (token, aday anahtarlar) çiftleri dönüşümlü.
+    render(index): her yer tutucu için ilk bulunan aday; hiçbiri yoksa {token} olduğu gibi kalır.
+    """
+    __slots__ = ("text", "parts")
+
+    def __init__(self, text: str):
+        self.text = text or ""
+        self.parts: List[Union[str, Tuple[str, Tuple[str, ...]]]] = []
+        pos = 0
+        for m in VAR_TOKEN_RE.finditer(self.text):
+            if m.start() > pos:
+                self.parts.append(self.text[pos:m.start()])
+            key = (m.group(1) or "").strip()
+            cands = tuple(dict.fromkeys((key, key.lower()) + _make_key_variants(key)))
+            self.parts.append((m.group(0), cands))
+            pos = m.end()
+        if pos < len(self.text):
+            self.parts.append(self.text[pos:])
+
+    def render(self, index: Dict[str, str]) -> str:
+        out = []
+        for part in self.parts:
+            if isinstance(part, str):
+                out.append(part)
+                continue
+            token, cands = part
+            for kv in cands:
+                if kv in index:
+                    out.append(index[kv]); break
+            else:
+                out.append(token)
+        return "".join(out)
+
+
+@lru_cache(maxsize=1024)
+def compile_template(text: str) -> CompiledTemplate:
+    return CompiledTemplate(text)
+
+
+def render_text_template(text: str, child: Dict[str, Any]) -> str:
+    """
+    {KolonAdi} yer tutucularını, child['vars'] içindeki değerlerle doldurur.
+    - Kolon adları case-insensitive.
+    - Sütun adını farklı şekillerde yazabil (örn. {student name}, {Student_Name}, {studentname}).
+    Tek seferlik çağrılar için; döngüde compile_template + build_var_index kullanın.
+    """
+    if not text:
+        return text
+    return compile_template(text).render(build_var_index(child))
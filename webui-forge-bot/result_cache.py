@@ -0,0 +1,199 @@
+# result_cache.py
+# txt2img sonuç önbelleği: aynı payload (sabit seed) ikinci kez Forge'a gitmez, sonuç diskten verilir.
+# - Anahtar: payload'ın kanonik hash'i (sha256). Prompt, parametreler, checkpoint (checkpoint_key ile) ve
+#   ControlNet girdileri dahil; uzun base64 görseller içerik hash'i ile temsil edilir (data URI öneki yok sayılır).
+# - seed < 0 (rastgele) payload'lar önbelleğe girmez: sonuç her seferinde farklıdır.
+# - Depo: data/cache/results/<k[:2]>/<k>.bin + SQLite indeks (boyut, son kullanım);
+#   toplam boyut RESULT_CACHE_MB'ı aşınca en eski kullanılan kayıtlar silinir (LRU).
+# - Ayrı süreçler (panel, runner_api) aynı indeksi WAL ile paylaşır.
+from __future__ import annotations
+import hashlib, json, os, sqlite3, threading, time, uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from forge_pool import checkpoint_key
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache", "results")
+ENABLED = os.environ.get("RESULT_CACHE", "1") == "1"
+MAX_BYTES = int(float(os.environ.get("RESULT_CACHE_MB", "2048")) * 1024 * 1024)
+BLOB_MIN = 512          # bu uzunluktan büyük metinler (base64 görseller) içerik hash'i ile anahtara girer
+KEY_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key        TEXT PRIMARY KEY,
+    size       INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used  REAL NOT NULL,
+    hits       INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_last_used ON results(last_used);
+"""
+
+# Aynı yüz/poz base64'ü sayfa başına yeniden hash'lenmesin: (id, uzunluk) → (metin, hash)
+_BLOB_MEMO: "OrderedDict[tuple, tuple]" = OrderedDict()
+_BLOB_MEMO_MAX = 256
+_BLOB_LOCK = threading.Lock()
+
+
+def _blob_hash(s: str) -> str:
+    k = (id(s), len(s))
+    with _BLOB_LOCK:
+        hit = _BLOB_MEMO.get(k)
+        if hit and hit[0] is s:
+            _BLOB_MEMO.move_to_end(k)
+            return hit[1]
+    body = s.split(",", 1)[-1] if s.startswith("data:") else s
+    h = "sha256:" + hashlib.sha256(body.encode("ascii", "ignore")).hexdigest()
+    with _BLOB_LOCK:
+        _BLOB_MEMO[k] = (s, h)              # metne güçlü referans: id yeniden kullanılamaz
+        while len(_BLOB_MEMO) > _BLOB_MEMO_MAX:
+            _BLOB_MEMO.popitem(last=False)
+    return h
+
+
+def _canon(v: Any) -> Any:
+    if isinstance(v, dict):
+        return {str(k): _canon(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [_canon(x) for x in v]
+    if isinstance(v, str) and len(v) > BLOB_MIN:
+        return _blob_hash(v)
+    if isinstance(v, float) and v.is_integer():
+        return int(v)                       # 7 ile 7.0 aynı anahtar
+    return v
+
+
+def payload_key(payload: Dict[str, Any], checkpoint: Optional[str] = None) -> Optional[str]:
+    """
+    Kanonik sha256 ya da None (rastgele seed → önbelleğe alınmaz).
+    checkpoint verilmezse payload'daki override_settings.sd_model_checkpoint kullanılır.
+    """
+    try:
+        if int(payload.get("seed", -1)) < 0:
+            return None
+    except (TypeError, ValueError):
+        return None
+    p = dict(payload)
+    ov = dict(p.pop("override_settings", None) or {})
+    ckpt = checkpoint if checkpoint is not None else ov.pop("sd_model_checkpoint", "")
+    ov.pop("sd_model_checkpoint", None)
+    doc = {"v": KEY_VERSION, "checkpoint": checkpoint_key(ckpt), "override_settings": ov, "payload": p}
+    raw = json.dumps(_canon(doc), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    - get(key) -> Optional[bytes]     (isabette son kullanım güncellenir)
+    - put(key, data)                  (atomik yaz + indeks; gerekirse LRU tahliye)
+    - total_bytes(), evict()
+    stats: hits, misses, stores, evicted   (generate worker'larından eşzamanlı güncellenir; _lock altında)
+    """
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max(0, int(max_bytes))
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite3"), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.executescript(_SCHEMA)
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evicted": 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.bin")
+
+    def get(self, key: Optional[str]) -> Optional[bytes]:
+        if not key:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT size FROM results WHERE key=?", (key,)).fetchone()
+        data = None
+        if row:
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = None
+            if data is None or len(data) != row[0]:
+                # dosya elle silinmiş / yarım: kaydı düşür
+                with self._lock, self._db:
+                    self._db.execute("DELETE FROM results WHERE key=?", (key,))
+                data = None
+        if data is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        with self._lock, self._db:
+            self._db.execute("UPDATE results SET last_used=?, hits=hits+1 WHERE key=?", (time.time(), key))
+            self.stats["hits"] += 1
+        return data
+
+    def put(self, key: Optional[str], data: bytes):
+        if not key or not data or len(data) > self.max_bytes:
+            return
+        p = self._path(key)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = f"{p}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, p)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO results(key, size, created_at, last_used) VALUES(?,?,?,?) "
+                "ON CONFLICT(key) DO UPDATE SET size=excluded.size, last_used=excluded.last_used",
+                (key, len(data), now, now))
+            self.stats["stores"] += 1
+        self.evict()
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return int(self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0])
+
+    def evict(self) -> int:
+        """Toplam boyut sınırın altına inene kadar en eski kullanılanları siler; silinen kayıt sayısı."""
+        over = self.total_bytes() - self.max_bytes
+        if over <= 0:
+            return 0
+        victims = []
+        with self._lock:
+            for key, size in self._db.execute("SELECT key, size FROM results ORDER BY last_used"):
+                victims.append(key)
+                over -= size
+                if over <= 0:
+                    break
+            with self._db:
+                self._db.executemany("DELETE FROM results WHERE key=?", [(k,) for k in victims])
+            self.stats["evicted"] += len(victims)
+        for key in victims:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+        return len(victims)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_DEFAULT: Optional[ResultCache] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_cache() -> Optional[ResultCache]:
+    """RESULT_CACHE=0 ise None (önbellek kapalı)."""
+    global _DEFAULT
+    if not ENABLED:
+        return None
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = ResultCache()
+        return _DEFAULT
@@ -1,19 +1,23 @@
 # runner_api.py
 from __future__ import annotations
-import base64, io, json, time, hashlib, os, re
+import base64, json, time, hashlib, os, re
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
-import requests
-from PIL import Image
 import pandas as pd
 
+from image_cache import cached_png_b64
+from face_normalize import normalized_face_b64, target_res
+import cn_detect
+from pose_library import default_library as pose_library
+from forge_client import get_client
+from result_cache import default_cache as result_cache, payload_key
+from forge_pool import CheckpointTracker, Stage, StagePipeline, checkpoint_key, checkpoint_window, order_by_checkpoint
+
 # ----------------- Yardımcılar -----------------
 _VALID_IMG_SUFFIXES = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
 
 def _b64_image_from_path(p: Path) -> str:
-    img = Image.open(p).convert("RGB")
-    buf = io.BytesIO(); img.save(buf, format="PNG")
-    return base64.b64encode(buf.getvalue()).decode("utf-8")
+    return cached_png_b64(str(p), convert_rgb=True)
 
 def _to_data_url(b64: str) -> str:
     return b64 if b64.startswith("data:image") else f"data:image/png;base64,{b64}"
@@ -23,10 +27,10 @@ def _clamp_dim(v: int) -> int:
     return v - (v % 8)
 
 def _get(api: str, path: str) -> Dict[str, Any]:
-    r = requests.get(f"{api}{path}", timeout=30); r.raise_for_status(); return r.json()
+    return get_client(api).get_json(path)
 
 def _post(api: str, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-    r = requests.post(f"{api}{path}", json=payload, timeout=600); r.raise_for_status(); return r.json()
+    return get_client(api).post_json(path, payload)
 
 def _sha1_of_b64(b64_plain: str) -> str:
     try: return hashlib.sha1(base64.b64decode(b64_plain)).hexdigest()
@@ -75,9 +79,8 @@ def _apply_placeholders(text: str, gender_token: str) -> str:
 
 # ----------------- ControlNet Units -----------------
 def _compute_processor_res(w: int, h: int) -> int:
-    # 1020x1980 gibi geniş görüntülerde daha güçlü koşullama için:
-    short = min(_clamp_dim(w), _clamp_dim(h))
-    return max(384, min(1024, short))
+    # 1020x1980 gibi geniş görüntülerde daha güçlü koşullama için (yüz normalleştirme hedefi de bu):
+    return target_res(w, h)
 
 # ------- ControlNet Unit kurucu (Forge UI ile birebir alanlar) -------
 def _build_cnet_units(
@@ -201,7 +204,7 @@ def _txt2img(
 def _reactor_available(api_base: str) -> bool:
     for path in ("/reactor/ping", "/reactor/models", "/reactor/model_list"):
         try:
-            r = requests.get(f"{api_base}{path}", timeout=5)
+            r = get_client(api_base).get(path, timeout=5, retries=0)
             if r.ok: return True
         except Exception: pass
     return False
@@ -306,6 +309,10 @@ def _reactor_alwayson_payload_from_scriptinfo(api_base: str, face_b64_plain: str
     """
     try: info = _get(api_base, "/sdapi/v1/script-info")
     except Exception: return None
+    if isinstance(info, list):
+        # A1111/Forge biçimi: [{name, is_alwayson, args: [{label, value}]}]
+        info = {"alwayson_scripts": {sc.get("name"): {"title": sc.get("name"), "args": sc.get("args") or []}
+                                     for sc in info if isinstance(sc, dict) and sc.get("is_alwayson")}}
     aos = info.get("alwayson_scripts") or {}
     key, spec = None, None
     for k, v in aos.items():
@@ -317,7 +324,7 @@ def _reactor_alwayson_payload_from_scriptinfo(api_base: str, face_b64_plain: str
     args: List[Any] = []
     for a in args_spec:
         name = (a.get("label") or a.get("name") or "").lower()
-        default = a.get("default")
+        default = a.get("default", a.get("value"))
         val = default
         if "enable" in name: val = True
         elif "source" in name and "image" in name: val = _to_data_url(face_b64_plain)
@@ -327,12 +334,22 @@ def _reactor_alwayson_payload_from_scriptinfo(api_base: str, face_b64_plain: str
     return {"alwayson_scripts": { key: { "args": args } }}
 
 # ----------------- txt2img -----------------
+def _get_active_checkpoint(api_base: str) -> Optional[str]:
+    return _get(api_base, "/sdapi/v1/options").get("sd_model_checkpoint")
+
+def _post_checkpoint(api_base: str, checkpoint_name: str) -> None:
+    _post(api_base, "/sdapi/v1/options", {"sd_model_checkpoint": checkpoint_name})
+    time.sleep(0.5)
+
+# Backend başına aktif model; aynı modelse /options çağrısı (ve 0.5 sn bekleme) atlanır
+_CKPT_TRACKER = CheckpointTracker(_get_active_checkpoint, _post_checkpoint)
+
 def _set_checkpoint_if_needed(api_base: str, checkpoint_name: Optional[str]) -> None:
     if not checkpoint_name: return
     try:
-        _post(api_base, "/sdapi/v1/options", {"sd_model_checkpoint": checkpoint_name})
-        time.sleep(0.5)
+        _CKPT_TRACKER.ensure(api_base, checkpoint_name)
     except Exception as e:
+        _CKPT_TRACKER.forget(api_base)
         print(f"[WARN] Checkpoint ayarlanamadı: {e}")
 
 def _txt2img(
@@ -352,8 +369,6 @@ def _txt2img(
     cn_args: Optional[List[Dict[str, Any]]] = None,
     styles: Optional[List[str]] = None,
 ) -> Dict[str, Any]:
-    _set_checkpoint_if_needed(api_base, checkpoint)
-
     payload: Dict[str, Any] = {
         "prompt": prompt,
         "negative_prompt": negative_prompt or "",
@@ -375,7 +390,22 @@ def _txt2img(
         aos = _reactor_alwayson_payload_from_scriptinfo(api_base, face_b64_plain)
         if aos: payload.setdefault("alwayson_scripts", {}).update(aos)
 
-    return _post(api_base, "/sdapi/v1/txt2img", payload)
+    # Sabit seed + aynı payload → sonuç önbellekten (Forge'a ve checkpoint değişimine gidilmez)
+    results = result_cache()
+    key = payload_key(payload, checkpoint) if results else None
+    cached = results.get(key) if key else None
+    if cached is not None:
+        return {"images": [base64.b64encode(cached).decode("ascii")], "cached": True}
+
+    _set_checkpoint_if_needed(api_base, checkpoint)
+    resp = _post(api_base, "/sdapi/v1/txt2img", payload)
+    images = resp.get("images") or []
+    if key and images:
+        try:
+            results.put(key, base64.b64decode(images[0].split(",", 1)[-1]))
+        except Exception as e:
+            print(f"[WARN] Sonuç önbelleğe yazılamadı: {e}")
+    return resp
 
 # ----------------- Ana çağırıcı -----------------
 def run_book_via_api(
@@ -410,142 +440,194 @@ def run_book_via_api(
     r_models = _reactor_models(api_base) if reactor_ok else []
     print(f"[INFO] API: {api_base} | REActor: {'OK' if reactor_ok else 'YOK'} | Models: {r_models[:3]}{'...' if len(r_models)>3 else ''}")
     print(f"[INFO] Başlıyor: {title} | faces:{len(face_paths)} pages:{len(pages)}")
+    # Birim 1 haritası kaynak başına bir kez /controlnet/detect ile (CN_DETECT_KEYPOINTS=1)
+    control_maps = cn_detect.ControlMapCache(api_base) if cn_detect.ENABLED else None
+    poses = pose_library(convert_rgb=True)   # poz indeksi: sayfa başına klasör listeleme / yeniden kodlama yok
+
+    def iter_tasks():
+        for ci, fpath in enumerate(face_paths, start=1):
+            face_by_res: Dict[int, str] = {}   # normalleştirilmiş yüz, hedef çözünürlük başına bir kez
+            child_name = fpath.stem
+            child_out = base_out / f"{title}-{child_name}"
+            child_out.mkdir(parents=True, exist_ok=True)
+            gender = _resolve_gender_for_face(df_excel, settings, fpath)
+
+            for pi, page in enumerate(pages, start=1):
+                raw_prompt = (page.get("prompt") or "").strip()
+                raw_neg    = (page.get("negative_prompt") or book_neg).strip()
+                prompt     = _apply_placeholders(raw_prompt, gender)
+                neg_prompt = _apply_placeholders(raw_neg, gender)
+
+                seed       = int(page.get("seed", -1))
+                sampler    = page.get("sampling_method") or book_smpl
+                steps      = int(page.get("sampling_steps", book_steps))
+                width      = int(page.get("width",  book_w))
+                height     = int(page.get("height", book_h))
+                cfg_scale  = float(page.get("cfg_scale", book_cfg))
+                checkpoint = page.get("checkpoint") or book_ckpt or None
+                styles     = page.get("styles") or []
 
-    for ci, fpath in enumerate(face_paths, start=1):
-        face_b64_plain = _b64_image_from_path(fpath)
-        child_name = fpath.stem
-        child_out = base_out / f"{title}-{child_name}"
-        child_out.mkdir(parents=True, exist_ok=True)
-        gender = _resolve_gender_for_face(df_excel, settings, fpath)
-
-        for pi, page in enumerate(pages, start=1):
-            raw_prompt = (page.get("prompt") or "").strip()
-            raw_neg    = (page.get("negative_prompt") or book_neg).strip()
-            prompt     = _apply_placeholders(raw_prompt, gender)
-            neg_prompt = _apply_placeholders(raw_neg, gender)
-
-            seed       = int(page.get("seed", -1))
-            sampler    = page.get("sampling_method") or book_smpl
-            steps      = int(page.get("sampling_steps", book_steps))
-            width      = int(page.get("width",  book_w))
-            height     = int(page.get("height", book_h))
-            cfg_scale  = float(page.get("cfg_scale", book_cfg))
-            checkpoint = page.get("checkpoint") or book_ckpt or None
-            styles     = page.get("styles") or []
-
-            use_cnet       = bool(page.get("use_controlnet", True))
-            use_reactor    = bool(page.get("use_reactor", False))
-            reactor_model  = page.get("reactor_model", "inswapper_128.onnx")
-            reactor_fidx   = int(page.get("reactor_face_index", -1))
-            reactor_s_fidx = int(page.get("reactor_source_face_index", -1))
-
-            # POSE
-            pose_source = (page.get("pose_path") or book_pose_default or poses_dir or "").strip()
-            pose_b64_plain: Optional[str] = None
-            if pose_source:
-                pth = Path(pose_source)
-                if pth.is_dir():
-                    for n in sorted(pth.iterdir()):
-                        if n.suffix.lower() in _VALID_IMG_SUFFIXES:
-                            pose_b64_plain = _b64_image_from_path(n); break
-                elif pth.exists():
-                    pose_b64_plain = _b64_image_from_path(pth)
-
-            # ControlNet units (Forge ile hizalı)
-            cn_args: Optional[List[Dict[str, Any]]] = None
-            if use_cnet:
                 proc_res = _compute_processor_res(width, height)
-                cn_args = _build_cnet_units(
-                    face_b64_plain=face_b64_plain,
-                    pose_b64_plain=pose_b64_plain,
-                    cn0_module=page.get("cn0_module", "InsightFace (InstantID)"),
-                    cn0_model=page.get("cn0_model", "ip-adapter_instant_id_sdxl [eb2d3ec0]"),
-                    cn0_resize=int(page.get("cn0_resize", 0)),
-                    cn1_module=page.get("cn1_module", "instant_id_face_keypoints"),
-                    cn1_model=page.get("cn1_model", "control_instant_id_sdxl [c5c25a50]"),
-                    cn1_resize=int(page.get("cn1_resize", 1)),
-                    cn0_weight=float(page.get("cn0_weight", 0.5)),
-                    cn1_weight=float(page.get("cn1_weight", 0.7)),
-                    cn0_mode=int(page.get("cn0_mode", 0)),
-                    cn1_mode=int(page.get("cn1_mode", 2)),
-                    # >>> Instant-ID strength ve keypoints çözünürlüğü
-                    u0_processor=float(page.get("cn0_processor", 0.5)),
-                    u1_processor=int(page.get("cn1_processor", 512)),
-                    pixel_perfect=False,
-                    guidance_start=0.0,
-                    guidance_end=1.0,
-                )
-
-            print(f"[GEN] child={child_name} page={pi} seed={seed} sampler={sampler} steps={steps} "
-                  f"{width}x{height} cfg={cfg_scale} cnet={use_cnet} reactor={use_reactor}")
-
+                if proc_res not in face_by_res:
+                    face_by_res[proc_res] = normalized_face_b64(str(fpath), proc_res)
+                face_b64_plain = face_by_res[proc_res]
+
+                use_cnet       = bool(page.get("use_controlnet", True))
+                use_reactor    = bool(page.get("use_reactor", False))
+
+                # POSE
+                pose_source = (page.get("pose_path") or book_pose_default or poses_dir or "").strip()
+                pose = poses.resolve(pose_source) if pose_source else None
+                pose_b64_plain: Optional[str] = pose.b64() if pose else None
+
+                # ControlNet units (Forge ile hizalı)
+                cn_args: Optional[List[Dict[str, Any]]] = None
+                if use_cnet:
+                    # önceden hesaplanmış harita varsa birim 1'e module "none" ile gider
+                    cn1_module = page.get("cn1_module", "instant_id_face_keypoints")
+                    u1_b64 = pose_b64_plain or face_b64_plain
+                    u1_map = None
+                    if control_maps:
+                        cn1_res = int(page.get("cn1_processor", 512))
+                        u1_map = poses.control_map(pose, cn1_module, cn1_res, control_maps) if pose \
+                            else control_maps.control_map(face_b64_plain, cn1_module, cn1_res)
+                    if u1_map:
+                        cn1_module, u1_b64 = "none", u1_map
+                    cn_args = _build_cnet_units(
+                        face_b64_plain=face_b64_plain,
+                        pose_b64_plain=u1_b64,
+                        cn0_module=page.get("cn0_module", "InsightFace (InstantID)"),
+                        cn0_model=page.get("cn0_model", "ip-adapter_instant_id_sdxl [eb2d3ec0]"),
+                        cn0_resize=int(page.get("cn0_resize", 0)),
+                        cn1_module=cn1_module,
+                        cn1_model=page.get("cn1_model", "control_instant_id_sdxl [c5c25a50]"),
+                        cn1_resize=int(page.get("cn1_resize", 1)),
+                        cn0_weight=float(page.get("cn0_weight", 0.5)),
+                        cn1_weight=float(page.get("cn1_weight", 0.7)),
+                        cn0_mode=int(page.get("cn0_mode", 0)),
+                        cn1_mode=int(page.get("cn1_mode", 2)),
+                        # >>> Instant-ID strength ve keypoints çözünürlüğü
+                        u0_processor=float(page.get("cn0_processor", 0.5)),
+                        u1_processor=int(page.get("cn1_processor", 512)),
+                        pixel_perfect=False,
+                        guidance_start=0.0,
+                        guidance_end=1.0,
+                    )
+
+                print(f"[GEN] child={child_name} page={pi} seed={seed} sampler={sampler} steps={steps} "
+                      f"{width}x{height} cfg={cfg_scale} cnet={use_cnet} reactor={use_reactor}")
+
+                yield {
+                    "child_name": child_name, "child_out": child_out, "pi": pi, "page": page, "checkpoint": checkpoint,
+                    "face_b64_plain": face_b64_plain, "use_reactor": use_reactor,
+                    "txt2img": dict(
+                        prompt=prompt,
+                        negative_prompt=neg_prompt,
+                        seed=seed,
+                        sampler=sampler,
+                        steps=steps,
+                        width=width,
+                        height=height,
+                        cfg_scale=cfg_scale,
+                        use_controlnet=use_cnet,
+                        face_b64_plain=face_b64_plain,
+                        checkpoint=checkpoint,
+                        reactor_in_loop=(use_reactor and reactor_ok),
+                        cn_args=cn_args,
+                        styles=styles,
+                    ),
+                }
+
+    # 1) Üretimde de REActor’ı tak (UI davranışı)
+    def stage_generate(task: Dict[str, Any], backend: str) -> Dict[str, Any]:
+        resp = _txt2img(api_base=backend, **task.pop("txt2img"))
+        images = resp.get("images") or []
+        if not images: raise RuntimeError("API boş döndü")
+        task["gen_b64_plain"] = images[0].split(",", 1)[-1]
+        if resp.get("cached"):
+            print(f"[CACHE] child={task['child_name']} page={task['pi']} → sonuç önbellekten (Forge çağrılmadı)")
+        return task
+
+    # 2) Post-process REActor (ek temkin)
+    def stage_reactor(task: Dict[str, Any], _slot) -> Dict[str, Any]:
+        page, child_out, pi = task["page"], task["child_out"], task["pi"]
+        gen_b64_plain = task["gen_b64_plain"]
+        pre_hash = _sha1_of_b64(gen_b64_plain)
+
+        if debug_save_prepost:
+            _save_b64(gen_b64_plain, child_out / f"sayfa{pi}_pre.png")
+
+        task["final_b64_plain"] = gen_b64_plain
+        task["swapped_ok"] = False
+        if task["use_reactor"] and reactor_ok:
             try:
-                # 1) Üretimde de REActor’ı tak (UI davranışı)
-                resp = _txt2img(
+                swapped = _reactor_swap_image(
                     api_base=api_base,
-                    prompt=prompt,
-                    negative_prompt=neg_prompt,
-                    seed=seed,
-                    sampler=sampler,
-                    steps=steps,
-                    width=width,
-                    height=height,
-                    cfg_scale=cfg_scale,
-                    use_controlnet=use_cnet,
-                    face_b64_plain=face_b64_plain,
-                    checkpoint=checkpoint,
-                    reactor_in_loop=(use_reactor and reactor_ok),
-                    cn_args=cn_args,
-                    styles=styles,
+                    source_b64_plain=task["face_b64_plain"],
+                    target_b64_plain=gen_b64_plain,
+                    model=page.get("reactor_model", "inswapper_128.onnx"),
+                    face_index=int(page.get("reactor_face_index", -1)),
+                    source_face_index=int(page.get("reactor_source_face_index", 0)),
+                    device=page.get("reactor_device", "CPU"),
+                    mask_face=int(page.get("reactor_mask_face", 0)),
+                    restore_first=int(page.get("reactor_restore_first", 1)),
+                    restorer_visibility=float(page.get("reactor_restorer_visibility", 1.0)),
+                    codeformer_weight=float(page.get("reactor_codeformer_weight", 0.5)),
+                    det_thresh=float(page.get("reactor_det_thresh", 0.5)),
+                    det_maxnum=int(page.get("reactor_det_maxnum", 0)),
                 )
-                images = resp.get("images") or []
-                if not images: raise RuntimeError("API boş döndü")
-                gen_b64_plain = images[0].split(",", 1)[-1]
-                pre_hash = _sha1_of_b64(gen_b64_plain)
 
+                post_hash = _sha1_of_b64(swapped)
+                if post_hash and post_hash != pre_hash:
+                    task["final_b64_plain"] = swapped; task["swapped_ok"] = True
+                    print("[REACTOR] swap uygulandı (hash değişti).")
+                else:
+                    print("[REACTOR] yüz bulunamadı/değişmedi (hash aynı).")
                 if debug_save_prepost:
-                    _save_b64(gen_b64_plain, child_out / f"sayfa{pi}_pre.png")
-
-                # 2) Post-process REActor (ek temkin)
-                final_b64_plain = gen_b64_plain
-                swapped_ok = False
-                if use_reactor and reactor_ok:
-                    try:
-                        swapped = _reactor_swap_image(
-                            api_base=api_base,
-                            source_b64_plain=face_b64_plain,
-                            target_b64_plain=gen_b64_plain,
-                            model=page.get("reactor_model", "inswapper_128.onnx"),
-                            face_index=int(page.get("reactor_face_index", -1)),
-                            source_face_index=int(page.get("reactor_source_face_index", 0)),
-                            device=page.get("reactor_device", "CPU"),
-                            mask_face=int(page.get("reactor_mask_face", 0)),
-                            restore_first=int(page.get("reactor_restore_first", 1)),
-                            restorer_visibility=float(page.get("reactor_restorer_visibility", 1.0)),
-                            codeformer_weight=float(page.get("reactor_codeformer_weight", 0.5)),
-                            det_thresh=float(page.get("reactor_det_thresh", 0.5)),
-                            det_maxnum=int(page.get("reactor_det_maxnum", 0)),
-                        )
-
-                        post_hash = _sha1_of_b64(swapped)
-                        if post_hash and post_hash != pre_hash:
-                            final_b64_plain = swapped; swapped_ok = True
-                            print("[REACTOR] swap uygulandı (hash değişti).")
-                        else:
-                            print("[REACTOR] yüz bulunamadı/değişmedi (hash aynı).")
-                        if debug_save_prepost:
-                            _save_b64(swapped, child_out / f"sayfa{pi}_post.png")
-                    except Exception as e:
-                        print(f"[WARN] REActor post-process hata: {e}")
-
-                # 3) Kaydet
-                out_path = child_out / f"sayfa{pi}.png"
-                _save_b64(final_b64_plain, out_path)
-                out["items"].append(str(out_path))
-                print(f"[OK] Kaydedildi: {out_path} {'(swap)' if swapped_ok else '(no-swap)'}")
-
+                    _save_b64(swapped, child_out / f"sayfa{pi}_post.png")
             except Exception as e:
-                out["ok"] = False
-                print(f"[ERR] child={child_name} page={pi}: {e}")
+                print(f"[WARN] REActor post-process hata: {e}")
+        return task
+
+    # 3) Kaydet
+    def stage_save(task: Dict[str, Any], _slot) -> Dict[str, Any]:
+        out_path = task["child_out"] / f"sayfa{task['pi']}.png"
+        _save_b64(task["final_b64_plain"], out_path)
+        task["out_path"] = out_path
+        return task
+
+    def commit(task: Dict[str, Any], result: Optional[Dict[str, Any]], error: Optional[BaseException]):
+        if error is not None:
+            out["ok"] = False
+            print(f"[ERR] child={task['child_name']} page={task['pi']}: {error}")
+            return
+        out["items"].append(str(result["out_path"]))
+        print(f"[OK] Kaydedildi: {result['out_path']} {'(swap)' if result['swapped_ok'] else '(no-swap)'}")
+
+    pipe = StagePipeline([
+        Stage("generate", stage_generate, slots=[api_base]),
+        Stage("reactor", stage_reactor),
+        Stage("save", stage_save),
+    ])
+    # Checkpoint gruplama: aynı modeli kullanan tüm (çocuk, sayfa) görevleri art arda koşar
+    tasks = iter_tasks()
+    ckpt_names = {checkpoint_key(p.get("checkpoint") or book_ckpt) for p in pages} - {""}
+    ckpt_info = {"avoided": 0}
+    if len(ckpt_names) > 1:
+        tasks, ckpt_info = order_by_checkpoint(tasks, ckpt_of=lambda t: t["checkpoint"],
+                                               active=_CKPT_TRACKER.active(api_base),
+                                               window=checkpoint_window(len(pages)))
+
+    swaps0, skipped0 = _CKPT_TRACKER.stats["swaps"], _CKPT_TRACKER.stats["skipped"]
+    pipe.run_ordered(tasks, commit)
+    if "groups" in ckpt_info:
+        print("[CKPT] Gruplar: " + ", ".join(f"{n or '-'}({c})" for n, c in ckpt_info["groups"]))
+    out["checkpoint"] = {
+        "swaps": _CKPT_TRACKER.stats["swaps"] - swaps0,
+        "skipped_options_calls": _CKPT_TRACKER.stats["skipped"] - skipped0,
+        "avoided_by_ordering": ckpt_info["avoided"],
+    }
+    print(f"[CKPT] Model değişimi: {out['checkpoint']['swaps']} | atlanan options çağrısı: "
+          f"{out['checkpoint']['skipped_options_calls']} | sıralamayla önlenen değişim: {ckpt_info['avoided']}")
 
     return out
@@ -19,6 +19,10 @@ from selenium.webdriver.common.action_chains import ActionChains
 from selenium.common.exceptions import StaleElementReferenceException
 from webdriver_manager.chrome import ChromeDriverManager
 
+from output_manifest import OutputManifest, file_sha1, provenance_hash
+from forge_pool import checkpoint_key
+from buffered_writer import BufferedSaveMixin
+
 
 ROOT_DIR   = Path(__file__).resolve().parent
 DATA_DIR   = ROOT_DIR / "data"
@@ -1931,12 +1935,14 @@ def slugify_for_path(s: str) -> str:
     s = re.sub(r'\s+', ' ', s).strip()
     return s
 
-def run_batch(book: dict, forge_url: str, headless=False, initial_delay=1.8):
+def run_batch(book: dict, forge_url: str, headless=False, initial_delay=1.8, rescan=False):
     """
     Excel/CSV varsa çocukları satır sırasına göre, yoksa faces_dir hiyerarşisine göre sırayla işler.
     KALDIĞI YERDEN DEVAM:
-      - output_root/<Sınıf>/<Ad Soyad>/sayfa{N}.png mevcutsa o sayfa atlanır
-      - Tüm sayfaları mevcut olan çocuk atlanır
+      - output_root/<Sınıf>/<Ad Soyad>/sayfa{N}.png çıktı manifestinde kayıtlıysa ve girdi özeti
+        (sayfa ayarı, satır değişkenleri, yüz içeriği, checkpoint) değişmediyse o sayfa atlanır
+      - Tüm sayfaları kayıtlı olan çocuk atlanır
+      - Manifest yoksa (ya da rescan=True) önce çocuk klasörlerinden bir kez kurulur
 
     NOT:
     - Excel kipinde 'out' SÜTUNU KULLANILMAZ / OLUŞTURULMAZ.
@@ -1953,18 +1959,20 @@ def run_batch(book: dict, forge_url: str, headless=False, initial_delay=1.8):
     total_pages = len(pages)
 
     def page_out_path(base_dir: Path, page_index: int) -> Path:
-        base_dir.mkdir(parents=True, exist_ok=True)
+        # Klasör, kaydetme sırasında (ensure_dir) oluşturulur
         return base_dir / f"sayfa{int(page_index)}.png"
 
     # ---------------- Excel Writer (yalın, 'out' yok) ----------------
-    class _ExcelOutWriter:
+    class _ExcelOutWriter(BufferedSaveMixin):
         """
         - Başlık satırında '@sayfa1..@sayfaN' blokunu sadece 1 kez yerleştirir.
         - 'out' kolonuna dokunmaz (varsa bile yazmaz, yoksa yaratmaz).
+        - save() tamponludur (EXCEL_FLUSH_ROWS / EXCEL_FLUSH_SEC); iş sonunda flush().
         """
         def __init__(self, path: str):
             import csv
             self.path = path
+            self._init_buffer()
             self.ext = os.path.splitext(path)[1].lower()
             self.mode = "xlsx" if self.ext in (".xlsx", ".xlsm") else "csv"
             self.valid = False
@@ -2067,6 +2075,7 @@ def run_batch(book: dict, forge_url: str, headless=False, initial_delay=1.8):
 
             self.pages_start_col = start_col
             self.pages_count = pages_count
+            self._touch()
 
         # ---- satır yazımı ----
         def set_pages_for_row(self, row_index_2based: int, page_paths: list[str]):
@@ -2081,7 +2090,9 @@ def run_batch(book: dict, forge_url: str, headless=False, initial_delay=1.8):
 
             if self.mode == "xlsx":
                 for k, p in enumerate(vals, start=0):
-                    self.ws.cell(row=row_index_2based, column=self.pages_start_col + k, value=p)
+                    cell = self.ws.cell(row=row_index_2based, column=self.pages_start_col + k)
+                    if (cell.value or "") != p:
+                        cell.value = p; self._touch()
             else:
                 i = row_index_2based - 2
                 while i >= len(self.rows):
@@ -2093,25 +2104,30 @@ def run_batch(book: dict, forge_url: str, headless=False, initial_delay=1.8):
                     idx = self.pages_start_col - 1 + k
                     if idx >= len(self.rows[i]):
                         self.rows[i] += [""] * (idx - len(self.rows[i]) + 1)
-                    self.rows[i][idx] = p
+                    if self.rows[i][idx] != p:
+                        self.rows[i][idx] = p; self._touch()
 
-        def save(self):
+        def save(self, force: bool = False) -> bool:
             if not self.valid:
-                return
+                return False
             try:
-                if self.mode == "xlsx":
-                    self.wb.save(self.path)
-                else:
-                    import csv
-                    with open(self.path, "w", newline="", encoding="utf-8-sig") as f:
-                        w = csv.writer(f)
-                        w.writerow(self.header)
-                        for r in self.rows:
-                            if len(r) < len(self.header):
-                                r = r + [""] * (len(self.header) - len(r))
-                            w.writerow(r)
+                return super().save(force)
             except Exception as e:
                 print("⚠️ ExcelOutWriter.save hata:", e)
+                return False
+
+        def _write_to(self, path: str):
+            if self.mode == "xlsx":
+                self.wb.save(path)
+            else:
+                import csv
+                with open(path, "w", newline="", encoding="utf-8-sig") as f:
+                    w = csv.writer(f)
+                    w.writerow(self.header)
+                    for r in self.rows:
+                        if len(r) < len(self.header):
+                            r = r + [""] * (len(self.header) - len(r))
+                        w.writerow(r)
 
     # ---------------- çocukları hazırla ----------------
     children = []
@@ -2189,7 +2205,9 @@ def run_batch(book: dict, forge_url: str, headless=False, initial_delay=1.8):
                 last  = _get(row, col_last, "")
                 cls   = _get(row, col_class, "")
                 name  = " ".join([x for x in [first, last] if x]).strip() or os.path.splitext(os.path.basename(face_abs))[0]
-                children.append({"face": face_abs, "class": cls or "ANA", "name": name, "row_index": i})
+                row_vars = {str(k): ("" if pd.isna(v) else v) for k, v in row.items()}
+                children.append({"face": face_abs, "class": cls or "ANA", "name": name, "row_index": i,
+                                 "vars": row_vars})
 
     if not used_excel:
         faces = list_faces_in_dir(faces_dir)
@@ -2201,38 +2219,51 @@ def run_batch(book: dict, forge_url: str, headless=False, initial_delay=1.8):
             name = os.path.splitext(Path(fp).name)[0]
             children.append({"face": fp, "class": cls, "name": name, "row_index": None})
 
+    # Excel DataFrame (placeholder lookup için)
+    df_for_lookup = df if used_excel else load_excel(excel_path)
+
+    def child_dir_of(ch: dict) -> tuple:
+        cls0, name0, _ = student_info_from_excel(df_for_lookup, ch["face"], settings)
+        cls  = slugify_for_path(ch.get("class") or cls0 or "ANA")
+        name = slugify_for_path(ch.get("name")  or name0 or "ÖĞRENCİ")
+        return cls, name, Path(output_root) / cls / name
+
+    # Çıktı manifesti (kitap başına; app.py ile paylaşılır)
+    manifest = OutputManifest.for_book(book.get("id") or "default")
+    if not manifest.bootstrapped or rescan:
+        st = manifest.rescan(child_dirs=[child_dir_of(ch)[2] for ch in children])
+        manifest.mark_bootstrapped()
+        print(f"🗂️ Manifest kuruldu: {st['files']} mevcut çıktı ({st['dirs']} klasör, {st['hashed']} hash, {st['removed']} silinen)")
+
     drv = new_driver(headless=headless)
     to_fullscreen(drv)
     print(f"🧒 Öğrenci sayısı: {len(children)}  |  Sayfa adedi: {len(pages)}  |  Kaynak: {'Excel' if used_excel else 'Klasör'}")
 
-    # Excel DataFrame (placeholder lookup için)
-    df_for_lookup = df if used_excel else load_excel(excel_path)
-
     for idx_child, ch in enumerate(children, start=1):
         face_path = ch["face"]
-        cls0, name0, _ = student_info_from_excel(df_for_lookup, face_path, settings)
-        cls  = slugify_for_path(ch.get("class") or cls0 or "ANA")
-        name = slugify_for_path(ch.get("name")  or name0 or "ÖĞRENCİ")
-        child_base = Path(output_root) / cls / name
+        cls, name, child_base = child_dir_of(ch)
 
-        # Bitmiş sayfaları saptama
-        done_map = {}
-        for pg in pages:
-            pidx = int(pg.get("index", 0) or 0)
-            done_map[pidx] = page_out_path(child_base, pidx).exists()
-        all_done = all(done_map.values()) if done_map else False
+        # Bitmiş ve girdi özeti değişmemiş sayfaları saptama (manifest; diske sorulmaz)
+        try:
+            face_sha = file_sha1(face_path)
+        except OSError:
+            face_sha = ""
+        child_vars = ch.get("vars") or {"name": ch.get("name", ""), "class": ch.get("class", "")}
+        prov_of = {int(pg.get("index", 0) or 0): provenance_hash("ui", pg, child_vars, face_sha,
+                                                                  pg.get("prompt", ""), pg.get("negative_prompt", ""),
+                                                                  checkpoint=checkpoint_key(pg.get("checkpoint")))
+                   for pg in pages}
+        outs = {pidx: str(page_out_path(child_base, pidx)) for pidx in prov_of}
+        current = set(manifest.current(list(outs.values()), [prov_of[pidx] for pidx in outs]))
+        existing_map = {pidx: p for pidx, p in outs.items() if p in current}
+        all_done = bool(pages) and len(existing_map) == len(pages)
         if all_done:
             print(f"\n=== [{idx_child}/{len(children)}] {cls} / {name} → TÜM SAYFALAR VAR, ATLANIYOR ===")
             # 'out' sütununa kesinlikle yazma (legacy kapalı)
             # Ancak '@sayfa*' başlıkları zaten sabit; satırda mevcut yolları güncelle:
             if used_excel and writer and ch.get("row_index"):
                 try:
-                    existing = []
-                    for pg in pages:
-                        pidx = int(pg.get("index", 0) or 0)
-                        pth = page_out_path(child_base, pidx)
-                        if pth.exists():
-                            existing.append(str(pth))
+                    existing = list(existing_map.values())
                     writer.set_pages_for_row(ch["row_index"], existing)
                     writer.save()
                 except Exception as e:
@@ -2248,20 +2279,16 @@ def run_batch(book: dict, forge_url: str, headless=False, initial_delay=1.8):
 
         # Satır için toplanacak yollar
         page_paths_for_row = []
-        # Önce mevcutları sıraya koyalım (1..N)
-        existing_map = {}
-        for pg in pages:
-            pidx = int(pg.get("index", 0) or 0)
-            out_p = page_out_path(child_base, pidx)
-            if out_p.exists():
-                existing_map[pidx] = str(out_p)
 
         for pg in pages:
             pidx = int(pg.get("index", 0) or 0)
             out_p = page_out_path(child_base, pidx)
-            if out_p.exists():
+            if pidx in existing_map:
                 print(f" -> Sayfa #{pidx} ATLA (mevcut): {out_p}")
                 continue
+            if manifest.has(str(out_p)):
+                print(f" -> Sayfa #{pidx} girdileri değişti, yeniden üretilecek")
+            mtime_before = out_p.stat().st_mtime_ns if out_p.exists() else None
 
             print(f" -> Sayfa #{pidx}  (çıktı: {out_p})")
 
@@ -2319,8 +2346,12 @@ def run_batch(book: dict, forge_url: str, headless=False, initial_delay=1.8):
                 manage_driver=False,
             )
 
-            # yeni dosya oluştuysa kayda geç
-            if out_p.exists():
+            # yeni dosya oluştuysa (eskisinin üzerine yazıldıysa mtime değişir) manifeste ve satıra geç
+            if out_p.exists() and out_p.stat().st_mtime_ns != mtime_before:
+                try:
+                    manifest.record(str(out_p), provenance=prov_of[pidx])
+                except Exception as e:
+                    print("⚠️ Manifest kaydı yazılamadı:", e)
                 existing_map[pidx] = str(out_p)
 
         # Satır yazımı: 1..N sıraya göre liste oluştur
@@ -2331,17 +2362,19 @@ def run_batch(book: dict, forge_url: str, headless=False, initial_delay=1.8):
         if used_excel and writer and ch.get("row_index"):
             try:
                 writer.set_pages_for_row(ch["row_index"], page_paths_for_row)
-                writer.save()
                 if any(page_paths_for_row):
-                    print(f"📝 Excel '@sayfa*' yazıldı (satır {ch['row_index']}).")
+                    print(f"📝 Excel '@sayfa*' güncellendi (satır {ch['row_index']}).")
+                if writer.save():
+                    print("💾 Excel diske yazıldı.")
             except Exception as e:
                 print("⚠️ Excel '@sayfa*' yazılamadı:", e)
 
     try:
         if writer:
-            writer.save()
+            writer.flush()
     except Exception:
         pass
+    manifest.close()
 
     try:
         drv.quit()
@@ -2458,6 +2491,8 @@ def main():
     # ... mevcut argümanların altına ekle ...
     ap.add_argument("--children-json", type=str, default="",
                     help="Excel sırası manifest JSON (app.py tarafından üretilir)")
+    ap.add_argument("--rescan", action="store_true",
+                    help="(Batch) Çıktı manifestini başlamadan önce diskten yeniden kur")
 
     args = ap.parse_args()
 
@@ -2465,7 +2500,8 @@ def main():
     settings = (book.get("settings") or {})
 
     if args.batch:
-        run_batch(book, forge_url=args.forge_url, headless=args.headless, initial_delay=args.initial_delay)
+        run_batch(book, forge_url=args.forge_url, headless=args.headless, initial_delay=args.initial_delay,
+                  rescan=args.rescan)
         return
 
     page = pick_page(book, args.page_index, args.page_id)
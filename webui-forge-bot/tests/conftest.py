@@ -0,0 +1,71 @@
+# conftest.py
+# Modüller webui-forge-bot kökünde düz durur; testler onları doğrudan import eder.
+# Testler canlı Forge yerine mock_forge.MockForge'a karşı koşar; ayarlar import anında env'den okunduğu için
+# önbellekler burada kapatılır.
+import os, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ.setdefault("RESULT_CACHE", "0")
+os.environ.setdefault("FORGE_BACKOFF", "0.01")
+
+
+import csv
+
+import pytest
+from PIL import Image
+
+from mock_forge import MockForge
+
+
+@pytest.fixture
+def app_mod(tmp_path, monkeypatch):
+    """app modülü; kitap manifestleri data/manifests yerine geçici klasöre."""
+    import app
+    mdir = str(tmp_path / "manifests")
+    for_book, open_readonly = app.OutputManifest.for_book.__func__, app.OutputManifest.open_readonly.__func__
+    monkeypatch.setattr(app.OutputManifest, "for_book", classmethod(lambda cls, book_id: for_book(cls, book_id, mdir)))
+    monkeypatch.setattr(app.OutputManifest, "open_readonly",
+                        classmethod(lambda cls, book_id: open_readonly(cls, book_id, mdir)))
+    return app
+
+
+@pytest.fixture
+def mocks():
+    ms = [MockForge(latency={"txt2img": "uniform:0.01,0.05", "reactor_image": "fixed:0"}, seed=i) for i in range(2)]
+    for m in ms:
+        m.start()
+    yield ms
+    for m in ms:
+        m.stop()
+
+
+def _make_book(root, children=5, pages=3, book_id="test-book"):
+    """root altında yüz JPEG'leri + CSV liste; çocuk c'nin yüzü her kökte aynı bayt."""
+    faces = root / "faces"
+    faces.mkdir(parents=True)
+    rows = []
+    for i in range(children):
+        Image.new("RGB", (96, 96), (i * 40 % 256, 90, 120)).save(faces / f"c{i}.jpg")
+        rows.append({"@photo": f"c{i}.jpg", "Ad": f"Çocuk{i}", "Soyad": "Test", "Sınıf": "1A"})
+    roster = root / "liste.csv"
+    with open(roster, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=list(rows[0]))
+        w.writeheader()
+        w.writerows(rows)
+    return {
+        "id": book_id, "name": "test",
+        "settings": {"data_source": "excel", "excel_path": str(roster), "faces_dir": str(faces),
+                     "output_root": str(root / "out"), "col_photo": "@photo", "col_first": "Ad",
+                     "col_last": "Soyad", "col_class": "Sınıf", "poses_dir": ""},
+        "pages": [{"id": f"p{i}", "index": i, "prompt": "a child named {Ad}, page " + str(i), "seed": 10 + i,
+                   "width": 64, "height": 64, "sampling_steps": 4, "use_controlnet": True}
+                  for i in range(1, pages + 1)],
+    }
+
+
+@pytest.fixture
+def make_book():
+    return _make_book
@@ -0,0 +1,27 @@
+# test_app_startup.py
+# Açılış işleri (kitap göçü + iş devralma) python app.py dışındaki başlatmalarda da ilk istekte bir kez koşar.
+import app
+
+
+def test_startup_runs_once_on_first_request(monkeypatch):
+    calls = []
+    monkeypatch.setattr(app, "_STARTUP_DONE", False)
+    monkeypatch.setattr(app.BOOK_STORE, "migrate", lambda: calls.append("migrate") or 0)
+    monkeypatch.setattr(app, "resume_unfinished_jobs", lambda: calls.append("resume") or [])
+    monkeypatch.setattr(app, "start_orphan_sweep", lambda: calls.append("sweep"))
+
+    client = app.app.test_client()
+    client.get("/__yok__")
+    client.get("/__yok__")
+    assert calls == ["migrate", "resume", "sweep"]
+
+
+def test_startup_failure_does_not_block_requests(monkeypatch):
+    def boom():
+        raise RuntimeError("db kilitli")
+    monkeypatch.setattr(app, "_STARTUP_DONE", False)
+    monkeypatch.setattr(app.BOOK_STORE, "migrate", boom)
+    monkeypatch.setattr(app, "resume_unfinished_jobs", lambda: [])
+    monkeypatch.setattr(app, "start_orphan_sweep", lambda: None)
+    assert app.app.test_client().get("/__yok__").status_code == 404
+    assert app._STARTUP_DONE
@@ -0,0 +1,42 @@
+# test_buffered_writer.py
+# BufferedSaveMixin: soyut yazım kancası ve satır/süre politikası.
+import pytest
+
+from buffered_writer import BufferedSaveMixin
+
+
+class LinesWriter(BufferedSaveMixin):
+    def __init__(self, path, **kw):
+        self.path = path
+        self.lines = []
+        self._init_buffer(**kw)
+
+    def add(self, line):
+        self.lines.append(line)
+        self._touch()
+
+    def _write_to(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.lines))
+
+
+def test_missing_write_to_fails_at_construction():
+    class Broken(BufferedSaveMixin):
+        def __init__(self):
+            self._init_buffer()
+
+    with pytest.raises(TypeError):
+        Broken()
+
+
+def test_save_waits_for_row_policy_and_flush_forces(tmp_path):
+    path = tmp_path / "out.csv"
+    w = LinesWriter(str(path), flush_sec=3600, flush_rows=3)
+    w.add("a"); w.add("b")
+    assert not w.save() and not path.exists()
+    w.add("c")
+    assert w.save() and path.read_text(encoding="utf-8") == "a\nb\nc"
+    w.add("d")
+    assert w.flush() and w.pending == 0
+    assert not w.flush()
+    assert [p.name for p in tmp_path.iterdir()] == ["out.csv"]
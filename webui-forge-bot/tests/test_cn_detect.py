@@ -0,0 +1,159 @@
+# test_cn_detect.py
+# ControlMapCache'in MockForge'un /controlnet/detect ucuna karşı davranışı.
+import base64, io, threading, time
+
+import pytest
+from PIL import Image
+
+import cn_detect
+from image_cache import ImageB64Cache
+from mock_forge import MockForge
+
+
+def src_b64(seed: int) -> str:
+    buf = io.BytesIO()
+    Image.new("RGB", (32, 32), (seed % 256, 40, 90)).save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+@pytest.fixture
+def mock():
+    with MockForge(latency={"cn_detect": "fixed:0"}) as mf:
+        yield mf
+
+
+@pytest.fixture
+def maps_for(tmp_path):
+    logs = []
+
+    def make(mock):
+        cm = cn_detect.ControlMapCache(mock.url, log=logs.append, cache=ImageB64Cache(str(tmp_path / "maps")))
+        cm.logs = logs
+        return cm
+    return make
+
+
+def test_transient_error_does_not_disable_detect(mock, maps_for):
+    cm = maps_for(mock)
+    mock.configure(errors={"cn_detect": "1.0:503"})
+    assert cm.control_map(src_b64(1), "instant_id_face_keypoints", 512) is None
+    assert cm.available is not False and cm.stats["errors"] == 1
+    assert "geçici hata" in cm.logs[-1]
+
+    mock.configure(errors={"cn_detect": "0"})
+    assert cm.control_map(src_b64(1), "instant_id_face_keypoints", 512)    # aynı kaynak yeniden denenir
+    assert cm.control_map(src_b64(2), "instant_id_face_keypoints", 512)
+    assert cm.available is True and cm.stats["detect"] == 2
+
+
+@pytest.mark.parametrize("status", ["404", "405"])
+def test_missing_endpoint_disables_for_job(mock, maps_for, status):
+    cm = maps_for(mock)
+    mock.configure(errors={"cn_detect": f"1.0:{status}"})
+    assert cm.control_map(src_b64(1), "instant_id_face_keypoints", 512) is None
+    assert cm.available is False
+    assert f"HTTP {status}" in cm.logs[-1]
+    mock.configure(errors={"cn_detect": "0"})
+    assert cm.control_map(src_b64(2), "instant_id_face_keypoints", 512) is None
+    assert mock.stats["requests"]["cn_detect"] == 1
+
+
+def test_detect_success_fills_cache_and_repeat_is_hit(mock, maps_for):
+    cm = maps_for(mock)
+    src = src_b64(3)
+    first = cm.control_map(src, "instant_id_face_keypoints", 256)
+    assert first and base64.b64decode(first).startswith(b"\x89PNG")
+    assert cm.control_map(src, "instant_id_face_keypoints", 256) == first
+    assert cm.stats == {"detect": 1, "hits": 1, "errors": 0}
+    assert mock.stats["requests"]["cn_detect"] == 1
+    # başka modül / çözünürlük ayrı harita
+    assert cm.control_map(src, "instant_id_face_keypoints", 512) != first
+    assert cm.control_map(src, "none", 512) is None
+    assert mock.stats["requests"]["cn_detect"] == 2
+
+
+class YieldingDict(dict):
+    """Okuma ile yazma arasında GIL'i bırakır: kilitsiz `+=` güncelleme kaybeder."""
+    def __getitem__(self, k):
+        v = dict.__getitem__(self, k)
+        time.sleep(0)
+        return v
+
+
+def test_hit_counts_add_up_across_threads(mock, maps_for):
+    cm = maps_for(mock)
+    srcs = [src_b64(i) for i in range(4)]
+    for s in srcs:
+        assert cm.control_map(s, "instant_id_face_keypoints", 512)
+    cm.stats = YieldingDict(cm.stats)
+    threads = [threading.Thread(target=lambda: [cm.control_map(s, "instant_id_face_keypoints", 512)
+                                                for _ in range(50) for s in srcs]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert cm.stats["detect"] == 4 and cm.stats["hits"] == 8 * 50 * 4
+
+
+# ---- run_book_via_api: birim 1'in Forge'a giden hali ----
+def unit1_payloads(app_mod, monkeypatch, book, backends):
+    sent = []
+    real = app_mod.call_txt2img
+
+    def spy(payload, base=None):
+        sent.append(payload)
+        return real(payload, base=base)
+    monkeypatch.setattr(app_mod, "call_txt2img", spy)
+    app_mod.run_book_via_api(book, log_path=book["settings"]["output_root"] + ".log", backends=backends)
+    return sorted(sent, key=lambda p: p["prompt"])
+
+
+@pytest.fixture
+def detect_on(tmp_path, monkeypatch):
+    monkeypatch.setattr(cn_detect, "default_cache", lambda: ImageB64Cache(str(tmp_path / "maps")))
+    monkeypatch.setattr(cn_detect, "ENABLED", True)
+
+
+def test_book_uses_detect_map_once_per_face(tmp_path, app_mod, mocks, make_book, monkeypatch, detect_on):
+    book = make_book(tmp_path / "a", children=3, pages=3)
+    sent = unit1_payloads(app_mod, monkeypatch, book, [mocks[0].url])
+    units = [p["alwayson_scripts"]["ControlNet"]["args"][1] for p in sent]
+    assert len(units) == 9 and all(u["module"] == "none" for u in units)
+    assert mocks[0].stats["requests"]["cn_detect"] == 3          # yüz başına bir detect, kalan sayfalar önbellekten
+
+
+@pytest.mark.parametrize("status", ["404", "500"])
+def test_detect_failure_leaves_payload_unchanged(tmp_path, app_mod, mocks, make_book, monkeypatch, status):
+    backends = [mocks[0].url]
+    monkeypatch.setattr(cn_detect, "ENABLED", False)
+    baseline = unit1_payloads(app_mod, monkeypatch, make_book(tmp_path / "off", book_id="off"), backends)
+
+    monkeypatch.setattr(cn_detect, "ENABLED", True)
+    monkeypatch.setattr(cn_detect, "default_cache", lambda: ImageB64Cache(str(tmp_path / "maps")))
+    mocks[0].configure(errors={"cn_detect": f"1.0:{status}"})
+    fallback = unit1_payloads(app_mod, monkeypatch, make_book(tmp_path / "on", book_id="on"), backends)
+
+    assert mocks[0].stats["errors"]["cn_detect"] >= 1
+    unit1 = fallback[0]["alwayson_scripts"]["ControlNet"]["args"][1]
+    assert unit1["module"] == "instant_id_face_keypoints"       # ön-işlemci Forge'da
+    assert fallback == baseline
+
+
+def test_detect_and_unit1_share_processor_res(tmp_path, app_mod, mocks, make_book, monkeypatch, detect_on):
+    book = make_book(tmp_path / "a", children=2, pages=2)
+    book["pages"][1]["cn1_processor"] = 768
+    detected = []
+    real = cn_detect.ControlMapCache._detect
+
+    def spy(self, src_b64, module, res):
+        detected.append(res)
+        return real(self, src_b64, module, res)
+    monkeypatch.setattr(cn_detect.ControlMapCache, "_detect", spy)
+    unit1_payloads(app_mod, monkeypatch, book, [mocks[0].url])
+    assert sorted(detected) == [512, 512, 768, 768]             # sayfa başına çözünürlük, yüz başına bir detect
+
+    monkeypatch.setattr(cn_detect, "ENABLED", False)
+    off = make_book(tmp_path / "b", children=1, pages=2, book_id="b")
+    off["pages"][1]["cn1_processor"] = 768
+    sent = unit1_payloads(app_mod, monkeypatch, off, [mocks[0].url])
+    assert [p["alwayson_scripts"]["ControlNet"]["args"][1]["processor_res"] for p in sent] == [512, 768]
@@ -0,0 +1,57 @@
+# test_forge_client.py
+# ForgeClient tekrar deneme kuralları: GET her bağlantı hatasında, POST yalnız istek gönderilmeden düştüyse.
+import socket
+
+import pytest
+import requests
+
+from forge_client import ForgeClient
+from mock_forge import MockForge
+
+PAYLOAD = {"prompt": "x", "seed": 1, "width": 64, "height": 64}
+
+
+@pytest.fixture
+def mock():
+    with MockForge(latency={"txt2img": "fixed:0"}) as mf:
+        yield mf
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_post_not_retried_after_send(mock):
+    mock.configure(errors={"txt2img": "1.0:drop"})
+    client = ForgeClient(mock.url, retries=3, backoff=0)
+    with pytest.raises(requests.ConnectionError):
+        client.post("/sdapi/v1/txt2img", PAYLOAD)
+    assert mock.stats["requests"]["txt2img"] == 1
+    assert client.stats["retries"] == 0
+
+
+def test_post_read_timeout_surfaces(mock):
+    mock.configure(latency={"txt2img": "fixed:0.5"})
+    client = ForgeClient(mock.url, retries=3, backoff=0)
+    with pytest.raises(requests.ReadTimeout):
+        client.post("/sdapi/v1/txt2img", PAYLOAD, timeout=0.1)
+    assert client.stats["retries"] == 0
+
+
+def test_post_retried_when_connection_refused():
+    client = ForgeClient(f"http://127.0.0.1:{free_port()}", retries=2, backoff=0)
+    with pytest.raises(requests.ConnectionError):
+        client.post("/sdapi/v1/txt2img", PAYLOAD, timeout=1)
+    assert client.stats["retries"] == 2
+
+
+def test_get_and_5xx_retried(mock):
+    mock.configure(errors={"sd_models": "1.0:drop", "txt2img": "1.0:503"})
+    client = ForgeClient(mock.url, retries=2, backoff=0)
+    with pytest.raises(requests.ConnectionError):
+        client.get("/sdapi/v1/sd-models")
+    assert mock.stats["requests"]["sd_models"] == 3
+    assert client.post("/sdapi/v1/txt2img", PAYLOAD).status_code == 503
+    assert mock.stats["requests"]["txt2img"] == 3
@@ -0,0 +1,158 @@
+# test_forge_pool.py
+# BackendPool / StagePipeline: birden çok MockForge backend'i üzerinde sıra, dağılım ve max_inflight.
+import threading
+
+import pytest
+
+from forge_client import get_client
+from forge_pool import BackendPool, Stage
+from mock_forge import MockForge
+
+
+@pytest.fixture
+def backends():
+    mocks = [MockForge(latency={"txt2img": "uniform:0.01,0.04"}, seed=i) for i in range(3)]
+    urls = [m.start() for m in mocks]
+    yield urls, mocks
+    for m in mocks:
+        m.stop()
+
+
+def book_items(children: int, pages: int):
+    """app.iter_tasks düzeni: çocuk başına sayfa görevleri + child_end işaretçisi."""
+    items = []
+    for c in range(children):
+        for p in range(1, pages + 1):
+            items.append({"kind": "page", "child": c, "page": p})
+        items.append({"kind": "child_end", "child": c})
+    return items
+
+
+def test_ordered_commit_spread_and_inflight(backends):
+    urls, mocks = backends
+    items = book_items(children=8, pages=3)
+    tasks = [it for it in items if it["kind"] == "page"]
+    pool = BackendPool(urls, max_inflight=4)
+
+    lock = threading.Lock()
+    state = {"yielded": 0, "returned": 0, "max_open": 0}
+
+    def feed():
+        # üretici her devam ettiğinde boru hattında en çok max_inflight görev olabilir
+        for it in items:
+            if it["kind"] == "page":
+                with lock:
+                    state["max_open"] = max(state["max_open"], state["yielded"] - state["returned"])
+                    state["yielded"] += 1
+            yield it
+
+    def generate(task, backend):
+        r = get_client(backend).post_json("/sdapi/v1/txt2img", {"prompt": f"{task['child']}/{task['page']}",
+                                                                 "seed": task["page"], "width": 64, "height": 64})
+        assert r["images"]
+        task["backend"] = backend
+        return task
+
+    def save(task, _slot):
+        with lock:
+            state["returned"] += 1
+        return (task["child"], task["page"])
+
+    committed, saves, sayfa_cells = [], [], {}
+
+    def commit(item, result, error):
+        assert error is None
+        committed.append(item)
+        if item["kind"] == "page":
+            saves.append(result)                                   # progress_cb "save" olayı
+            sayfa_cells.setdefault(item["child"], []).append(f"@sayfa{result[1]}")
+        else:
+            # child_end: çocuğun tüm sayfaları bu işaretçiden önce commit edilmiş olmalı
+            assert len(sayfa_cells.get(item["child"], [])) == 3
+
+    pool.run_ordered(feed(), generate, commit, needs_work=lambda t: t["kind"] == "page",
+                     later=[Stage("save", save, workers=2)])
+
+    assert committed == items
+    assert saves == [(t["child"], t["page"]) for t in tasks]
+    assert all(cells == ["@sayfa1", "@sayfa2", "@sayfa3"] for cells in sayfa_cells.values())
+    assert sum(pool.stats.values()) == len(tasks)
+    assert all(pool.stats[u] > 0 for u in urls)
+    assert all(m.stats["images"] > 0 for m in mocks)
+    assert sum(m.stats["images"] for m in mocks) == len(tasks)
+    assert state["max_open"] <= pool.max_inflight + 2 + 2            # pipeline(): + queue_size + save worker'ları
+    assert all(m.stats["max_active"] == 1 for m in mocks)            # backend başına tek eşzamanlı üretim
+
+
+def test_max_inflight_bounds_pipeline(backends):
+    urls, _mocks = backends
+    pool = BackendPool(urls[:2], max_inflight=2)
+    lock = threading.Lock()
+    state = {"yielded": 0, "done": 0, "max_open": 0}
+
+    def feed():
+        for i in range(20):
+            with lock:
+                state["max_open"] = max(state["max_open"], state["yielded"] - state["done"])
+                state["yielded"] += 1
+            yield i
+
+    def generate(i, backend):
+        get_client(backend).post_json("/sdapi/v1/txt2img", {"prompt": str(i), "seed": i, "width": 64, "height": 64})
+        with lock:
+            state["done"] += 1
+        return i
+
+    out = []
+    pool.run_ordered(feed(), generate, lambda it, res, err: out.append((it, res, err)))
+    assert out == [(i, i, None) for i in range(20)]
+    assert state["max_open"] <= pool.max_inflight
+
+
+def test_errors_are_committed_in_place(backends):
+    urls, mocks = backends
+    mocks[0].configure(errors={"txt2img": "1.0:500"})
+    pool = BackendPool(urls[:2])
+
+    def generate(i, backend):
+        get_client(backend).post_json("/sdapi/v1/txt2img", {"prompt": str(i), "seed": i, "width": 64, "height": 64},
+                                      retries=0)
+        return i
+
+    out = []
+    pool.run_ordered(range(10), generate, lambda it, res, err: out.append((it, res, err is not None)))
+    assert [it for it, _res, _err in out] == list(range(10))
+    assert all(res == it for it, res, failed in out if not failed)
+    assert any(failed for *_x, failed in out)
+
+
+def test_order_by_checkpoint_window_streams():
+    from forge_pool import order_by_checkpoint
+
+    pulled = {"n": 0}
+
+    def feed():
+        for c in range(10):
+            for p, ck in enumerate(("a", "b", "a"), start=1):
+                pulled["n"] += 1
+                yield {"kind": "page", "child": c, "page": p, "ckpt": ck}
+            yield {"kind": "child_end", "child": c}
+
+    ordered, info = order_by_checkpoint(feed(), ckpt_of=lambda t: t["ckpt"], is_task=lambda t: t["kind"] == "page",
+                                        window=6)
+    it = iter(ordered)
+    first = next(it)
+    assert first["kind"] == "page"
+    assert pulled["n"] <= 6                          # ilk görev için tüm kitap okunmadı
+    out = [first] + list(it)
+
+    assert len(out) == 40 and info["windows"] == 5
+    # her çocuğun child_end'i kendi sayfalarından sonra gelir ve çocuk sırası korunur
+    ends = [i for i, t in enumerate(out) if t["kind"] == "child_end"]
+    assert [out[i]["child"] for i in ends] == list(range(10))
+    for i in ends:
+        c = out[i]["child"]
+        assert all(t["child"] != c for t in out[i + 1:] if t["kind"] == "page")
+    # pencere içinde gruplu; sonraki pencere son modelle başlar: a b | b a | a b ...
+    assert info["swaps_before"] == 21 and info["swaps_after"] == 6 and info["avoided"] == 15
+    assert info["groups"] == [("a", 20), ("b", 10)]
@@ -0,0 +1,33 @@
+# test_image_cache.py
+# ImageB64Cache sayaçları birden çok pipeline worker'ından eşzamanlı artar: toplam, yapılan get sayısına eşit.
+import threading, time
+
+from PIL import Image
+
+from image_cache import ImageB64Cache
+
+
+class YieldingDict(dict):
+    """Okuma ile yazma arasında GIL'i bırakır: kilitsiz `+=` güncelleme kaybeder."""
+    def __getitem__(self, k):
+        v = dict.__getitem__(self, k)
+        time.sleep(0)
+        return v
+
+
+def test_stats_add_up_across_threads(tmp_path):
+    paths = []
+    for i in range(4):
+        p = tmp_path / f"f{i}.png"
+        Image.new("RGB", (8, 8), (i, 0, 0)).save(p)
+        paths.append(str(p))
+    cache = ImageB64Cache(str(tmp_path / "cache"))
+    cache.stats = YieldingDict(cache.stats)
+
+    threads = [threading.Thread(target=lambda: [cache.get(p) for _ in range(100) for p in paths]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    st = cache.stats
+    assert st["mem_hits"] + st["disk_hits"] + st["misses"] == 8 * 100 * len(paths)
@@ -0,0 +1,120 @@
+# test_iter_children.py
+# iter_children listeyi tek geçişte okur (kodlama bir kez, tek okuyucu); Windows'taki os.replace kilidi yazıcı
+# tarafında çözülür: liste okunurken ExcelOutWriter kaydı bekletir, okuma bitince yazar.
+import csv
+
+import pytest
+
+import app
+import buffered_writer
+
+
+def write_roster(path, n, encoding="utf-8"):
+    with open(path, "w", newline="", encoding=encoding) as f:
+        w = csv.writer(f)
+        w.writerow(["@photo", "Ad", "Soyad", "Sınıf"])
+        for i in range(n):
+            w.writerow([f"c{i}.jpg", f"Çocuk{i}", "Test", "1A"])
+
+
+def settings_for(path):
+    return {"data_source": "excel", "excel_path": str(path), "faces_dir": "/yok", "col_photo": "@photo",
+            "col_first": "Ad", "col_last": "Soyad", "col_class": "Sınıf"}
+
+
+def quiet(*_a, **_k):
+    pass
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".xlsx"])
+def test_single_pass_read(tmp_path, monkeypatch, suffix):
+    path = tmp_path / f"liste{suffix}"
+    if suffix == ".csv":
+        write_roster(path, 1200, encoding="cp1254")
+    else:
+        from openpyxl import Workbook
+        wb = Workbook()
+        wb.active.append(["@photo", "Ad", "Soyad", "Sınıf"])
+        for i in range(1200):
+            wb.active.append([f"c{i}.jpg", f"Çocuk{i}", "Test", "1A"])
+        wb.save(path)
+
+    calls = {"detect": 0, "open": 0, "workbook": 0}
+    detect = app.detect_text_encoding
+    monkeypatch.setattr(app, "detect_text_encoding",
+                        lambda p: calls.__setitem__("detect", calls["detect"] + 1) or detect(p))
+    monkeypatch.setattr(app, "open", lambda *a, **k: calls.__setitem__("open", calls["open"] + 1) or open(*a, **k),
+                        raising=False)
+    import openpyxl
+    load = openpyxl.load_workbook
+    monkeypatch.setattr(openpyxl, "load_workbook",
+                        lambda *a, **k: calls.__setitem__("workbook", calls["workbook"] + 1) or load(*a, **k))
+
+    children = list(app.iter_children(settings_for(path), log=quiet, check_faces=False))
+    assert [c["name"] for c in children] == [f"Çocuk{i} Test" for i in range(1200)]
+    assert [c["row_index"] for c in children] == list(range(2, 1202))
+    if suffix == ".csv":
+        assert calls == {"detect": 1, "open": 2, "workbook": 0}     # kodlama örneği + tek okuyucu
+    else:
+        assert calls == {"detect": 0, "open": 0, "workbook": 1}
+    assert not buffered_writer.is_reading(str(path))
+
+
+def test_writer_defers_replace_while_roster_streams(tmp_path, monkeypatch):
+    monkeypatch.setattr(buffered_writer, "DEFER_WHILE_READING", True)
+    path = tmp_path / "liste.csv"
+    write_roster(path, 5)
+    original = path.read_bytes()
+    writer = app.ExcelOutWriter(str(path))
+
+    names = []
+    for child in app.iter_children(settings_for(path), log=quiet, check_faces=False):
+        names.append(child["name"])
+        writer.set_pages_for_row(child["row_index"], [f"/out/{child['name']}/sayfa1.png"])
+        assert buffered_writer.is_reading(str(path))
+        assert not writer.flush()                      # liste açıkken yerine konmaz, tampon bekler
+        assert path.read_bytes() == original
+    assert names == [f"Çocuk{i} Test" for i in range(5)]
+    assert writer.pending and writer.flush()
+
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.reader(f))
+    cols = [i for i, h in enumerate(rows[0]) if "@sayfa1" in h]
+    assert [r[cols[0]] for r in rows[1:]] == [f"/out/Çocuk{i} Test/sayfa1.png" for i in range(5)]
+
+
+def test_mid_job_rewrite_keeps_row_order_without_deferral(tmp_path, monkeypatch):
+    # POSIX: açık okuyucu eski dosyayı okumayı sürdürür; ara kayıt hemen yazılır
+    monkeypatch.setattr(buffered_writer, "DEFER_WHILE_READING", False)
+    path = tmp_path / "liste.csv"
+    write_roster(path, 5)
+    writer = app.ExcelOutWriter(str(path))
+
+    names = []
+    for child in app.iter_children(settings_for(path), log=quiet, check_faces=False):
+        names.append(child["name"])
+        writer.set_pages_for_row(child["row_index"], [f"/out/{child['name']}/sayfa1.png"])
+        assert writer.flush()
+    assert names == [f"Çocuk{i} Test" for i in range(5)]
+
+
+def test_interrupted_job_releases_roster_and_flushes(tmp_path, app_mod, mocks, make_book, monkeypatch):
+    monkeypatch.setattr(buffered_writer, "DEFER_WHILE_READING", True)
+    book = make_book(tmp_path, children=30, pages=2)              # liste kesildiğinde henüz sonuna varılmamış
+    roster = book["settings"]["excel_path"]
+    seen = []
+
+    def crash(ev):
+        if ev.get("event") == "save":
+            seen.append(ev["child"])
+            if len(seen) == 3:
+                raise RuntimeError("iş yarıda kesildi")
+
+    with pytest.raises(RuntimeError):
+        app_mod.run_book_via_api(book, log_path=str(tmp_path / "a.log"), backends=[m.url for m in mocks],
+                                 progress_cb=crash)
+    assert not buffered_writer.is_reading(roster)
+    with open(roster, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.reader(f))
+    cols = [i for i, h in enumerate(rows[0]) if h.lstrip("'").startswith("@sayfa")]
+    assert cols and rows[1][cols[0]].endswith("sayfa1.png")   # iş sonu kaydı bekletilmedi
@@ -0,0 +1,71 @@
+# test_job_store.py
+# Sahipsiz iş devralma: 60 sn dolmadan yeniden başlatma, ölü sahip süreç ve periyodik tarama.
+import os, socket, subprocess, sys, time
+
+from job_store import JobStore
+
+
+def dead_owner():
+    """Bu makinede çıkmış bir sürecin owner dizgesi."""
+    p = subprocess.Popen([sys.executable, "-c", "pass"])
+    p.wait()
+    return f"{socket.gethostname()}:{p.pid}:eski00"
+
+
+def test_restart_within_stale_window_claims_dead_owners_job(tmp_path):
+    db = str(tmp_path / "jobs.sqlite3")
+    old = JobStore(db)
+    old.create_job("j1", "kitap", "api", str(tmp_path / "j1.log"), "2026-01-01T00:00:00")
+    old.update("j1", owner=dead_owner(), heartbeat_at=time.time())      # birkaç sn önce atmış heartbeat
+
+    new = JobStore(db)
+    claimed = new.claim_orphans()
+    assert [j["id"] for j in claimed] == ["j1"]
+    assert new.get("j1")["owner"] == new.owner
+    assert new.claim_orphans() == []
+
+
+def test_live_or_remote_owner_waits_for_stale_heartbeat(tmp_path):
+    db = str(tmp_path / "jobs.sqlite3")
+    store = JobStore(db, heartbeat_sec=15)
+    assert store.stale_sec == 45
+    store.create_job("canli", "kitap", "api", "", "2026-01-01T00:00:00")
+    store.create_job("uzak", "kitap", "api", "", "2026-01-01T00:00:00")
+    store.update("canli", owner=f"{socket.gethostname()}:{os.getppid()}:canli0", heartbeat_at=time.time() - 30)
+    store.update("uzak", owner="baska-makine:1234:uzak00", heartbeat_at=time.time() - 30)
+
+    other = JobStore(db, heartbeat_sec=15)
+    assert other.claim_orphans() == []
+    store.update("uzak", heartbeat_at=time.time() - 50)
+    assert [j["id"] for j in other.claim_orphans()] == ["uzak"]
+
+
+def test_own_jobs_are_never_claimed(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    store.create_job("j1", "kitap", "api", "", "2026-01-01T00:00:00")
+    store.update("j1", heartbeat_at=time.time() - 3600)
+    assert store.claim_orphans() == []
+
+
+def test_periodic_sweep_picks_up_job_that_goes_stale_later(tmp_path, monkeypatch):
+    import app
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), heartbeat_sec=0.05)
+    monkeypatch.setattr(app, "JOB_STORE", store)
+    log = tmp_path / "ui.log"
+    store.create_job("ui1", "kitap", "ui", str(log), "2026-01-01T00:00:00")
+    store.update("ui1", owner="baska-makine:1234:uzak00", heartbeat_at=time.time())
+
+    assert app.resume_unfinished_jobs() == []                          # açılışta henüz taze
+    assert store.get("ui1")["status"] == "running"
+    stop = app.threading.Event()
+    monkeypatch.setattr(app, "_SWEEP_STOP", stop)
+    t = app.start_orphan_sweep()
+    try:
+        deadline = time.time() + 5
+        while store.get("ui1")["status"] == "running" and time.time() < deadline:
+            time.sleep(0.02)
+    finally:
+        stop.set()
+        t.join(1)
+    assert store.get("ui1")["status"] == "interrupted"
+    assert "interrupted" in log.read_text(encoding="utf-8")
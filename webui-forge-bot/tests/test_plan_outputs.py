@@ -0,0 +1,78 @@
+# test_plan_outputs.py
+# plan_book_outputs / ön kontrol sayfası dry-run'dır: manifest oluşturmaz, ilk kurulum yapmaz, işaret yazmaz;
+# yüz hash'leri ön kontrol sonuçlarından (havuzda) gelir.
+import os
+
+import face_preflight
+
+
+def children_of(app_mod, book):
+    return list(app_mod.iter_children(book["settings"], log=lambda *_a, **_k: None, check_faces=False))
+
+
+def manifest_file(tmp_path, book):
+    return tmp_path / "manifests" / f"{book['id']}.sqlite3"
+
+
+def test_plan_without_manifest_writes_nothing(tmp_path, app_mod, make_book, monkeypatch):
+    book = make_book(tmp_path / "k", children=3, pages=2)
+    # diskte önceden üretilmiş bir çıktı: dry-run taramaz, 'taranmamış' sayar
+    d = os.path.join(book["settings"]["output_root"], "1A", "Çocuk0 Test")
+    os.makedirs(d)
+    open(os.path.join(d, "sayfa1.png"), "wb").close()
+    monkeypatch.setattr(app_mod.OutputManifest, "rescan", lambda *a, **k: (_ for _ in ()).throw(AssertionError))
+
+    plan = app_mod.plan_book_outputs(book, children_of(app_mod, book))
+    assert plan["bootstrapped"] is False
+    assert plan["counts"]["unscanned"] == 6 and plan["counts"]["regenerate"] == 0 and plan["rows"] == []
+    assert not manifest_file(tmp_path, book).exists()
+
+
+def test_plan_reads_existing_manifest_readonly(tmp_path, app_mod, mocks, make_book):
+    book = make_book(tmp_path / "k", children=3, pages=2)
+    app_mod.run_book_via_api(book, log_path=str(tmp_path / "a.log"), backends=[m.url for m in mocks])
+    path = manifest_file(tmp_path, book)
+    before = path.stat().st_mtime_ns
+
+    children = children_of(app_mod, book)
+    plan = app_mod.plan_book_outputs(book, children)
+    assert plan["bootstrapped"] is True
+    assert plan["counts"]["current"] == 6 and plan["counts"]["regenerate"] == 0
+
+    book["pages"][1]["prompt"] = "a child named {Ad}, page 2, watercolor"
+    plan = app_mod.plan_book_outputs(book, children)
+    assert plan["counts"]["changed"] == 3 and plan["counts"]["current"] == 3
+    assert [r["page"] for r in plan["rows"]] == [2, 2, 2]
+    assert path.stat().st_mtime_ns == before
+
+
+def test_unbootstrapped_manifest_is_not_marked(tmp_path, app_mod, make_book):
+    book = make_book(tmp_path / "k", children=2, pages=1)
+    app_mod.OutputManifest.for_book(book["id"]).close()          # yarıda kalmış ilk kurulum: işaret yok
+    plan = app_mod.plan_book_outputs(book, children_of(app_mod, book))
+    assert plan["bootstrapped"] is False and plan["counts"]["unscanned"] == 2
+    assert not app_mod.OutputManifest.for_book(book["id"]).bootstrapped
+
+
+def test_face_hashes_come_from_preflight(tmp_path, app_mod, make_book, monkeypatch):
+    book = make_book(tmp_path / "k", children=4, pages=1)
+    children = children_of(app_mod, book)
+    index = face_preflight.FacePreflightIndex(str(tmp_path / "faces.sqlite3"))
+    sm = index.run(ch["face"] for ch in children)
+    shas = {p: r["sha1"] for p, r in sm["results"].items()}
+    assert all(shas.values())
+    assert index.run(ch["face"] for ch in children)["results"][children[0]["face"]]["sha1"] == shas[children[0]["face"]]
+
+    def no_hash(paths, *a, **k):
+        raise AssertionError(f"yeniden hash: {list(paths)}")
+    monkeypatch.setattr(face_preflight, "hash_files", no_hash)
+    plan = app_mod.plan_book_outputs(book, children, face_shas=shas)
+    assert plan["counts"]["no_face"] == 0 and plan["counts"]["unscanned"] == 4
+
+
+def test_missing_face_counts_as_no_face(tmp_path, app_mod, make_book):
+    book = make_book(tmp_path / "k", children=3, pages=2)
+    children = children_of(app_mod, book)
+    os.remove(children[1]["face"])
+    plan = app_mod.plan_book_outputs(book, children)
+    assert plan["counts"]["no_face"] == 1 and plan["counts"]["unscanned"] == 4
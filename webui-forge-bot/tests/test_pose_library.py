@@ -0,0 +1,35 @@
+# test_pose_library.py
+# PoseLibrary paylaşılır (default_library): resolve sayaçları birden çok worker'dan eşzamanlı artar.
+import threading, time
+
+from PIL import Image
+
+from pose_library import PoseLibrary
+
+
+class YieldingDict(dict):
+    """Okuma ile yazma arasında GIL'i bırakır: kilitsiz `+=` güncelleme kaybeder."""
+    def __getitem__(self, k):
+        v = dict.__getitem__(self, k)
+        time.sleep(0)
+        return v
+
+
+def test_resolve_counts_add_up_across_threads(tmp_path):
+    sources = []
+    for i in range(4):
+        d = tmp_path / f"poz{i}"
+        d.mkdir()
+        Image.new("RGB", (8, 8), (i, 0, 0)).save(d / "a.png")
+        sources.append(str(d))
+    lib = PoseLibrary(check_sec=60)
+    assert all(lib.resolve(s) for s in sources)
+    lib.stats = YieldingDict(lib.stats)
+
+    threads = [threading.Thread(target=lambda: [lib.resolve(s) for _ in range(100) for s in sources])
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert lib.stats["scans"] == 4 and lib.stats["hits"] == 8 * 100 * 4
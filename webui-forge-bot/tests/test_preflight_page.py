@@ -0,0 +1,78 @@
+# test_preflight_page.py
+# Ön kontrol sayfası isteği bekletmez: kontrol arka planda koşar, sayfa durumu yoklar; sonuç kitap değişmedikçe
+# PREFLIGHT_TTL_SEC boyunca yeniden kullanılır.
+import threading, time
+
+import pytest
+
+
+@pytest.fixture
+def preflight(tmp_path, app_mod, make_book, monkeypatch):
+    book = make_book(tmp_path / "k", children=3, pages=2)
+    monkeypatch.setattr(app_mod, "read_book", lambda book_id: book if book_id == book["id"] else None)
+    monkeypatch.setattr(app_mod, "_PREFLIGHTS", {})
+    monkeypatch.setattr(app_mod, "_STARTUP_DONE", True)             # açılış işleri (göç, iş devralma) koşmasın
+    gate = threading.Event()
+    runs = []
+    run = app_mod.face_preflight_index().run
+
+    def slow_run(paths, *a, **k):
+        runs.append(1)
+        assert gate.wait(5)
+        return run(paths, *a, **k)
+    monkeypatch.setattr(app_mod.face_preflight_index(), "run", slow_run)
+    return app_mod, book, gate, runs
+
+
+def wait_done(client, book_id):
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        st = client.get(f"/books/{book_id}/preflight/status").get_json()
+        if st["status"] != "running":
+            return st
+        time.sleep(0.02)
+    raise AssertionError("ön kontrol bitmedi")
+
+
+def test_page_returns_while_check_runs_then_shows_summary(preflight):
+    app_mod, book, gate, runs = preflight
+    client = app_mod.app.test_client()
+
+    r = client.get(f"/books/{book['id']}/preflight")                 # kontrol kapıda bekliyor, sayfa döner
+    assert r.status_code == 200 and "arka planda sürüyor" in r.get_data(as_text=True)
+    assert client.get(f"/books/{book['id']}/preflight/status").get_json()["status"] == "running"
+    client.get(f"/books/{book['id']}/preflight")                     # ikinci açılış yeni kontrol başlatmaz
+    gate.set()
+    assert wait_done(client, book["id"])["status"] == "done"
+
+    html = client.get(f"/books/{book['id']}/preflight").get_data(as_text=True)
+    assert "Yüz dosyası: <b>3</b>" in html and "taranmamış 6" in html
+    assert len(runs) == 1                                             # TTL içinde önbellekten
+
+
+def test_refresh_and_book_change_rerun(preflight):
+    app_mod, book, gate, runs = preflight
+    gate.set()
+    client = app_mod.app.test_client()
+    client.get(f"/books/{book['id']}/preflight")
+    wait_done(client, book["id"])
+
+    assert client.get(f"/books/{book['id']}/preflight?refresh=1").status_code == 302
+    wait_done(client, book["id"])
+    assert len(runs) == 2
+
+    book["pages"][0]["prompt"] = "değişti {Ad}"
+    client.get(f"/books/{book['id']}/preflight")
+    wait_done(client, book["id"])
+    assert len(runs) == 3
+
+
+def test_failure_is_reported(preflight, monkeypatch):
+    app_mod, book, gate, _runs = preflight
+    gate.set()
+    monkeypatch.setattr(app_mod, "plan_book_outputs", lambda *a, **k: (_ for _ in ()).throw(RuntimeError("plan bozuk")))
+    client = app_mod.app.test_client()
+    client.get(f"/books/{book['id']}/preflight")
+    assert wait_done(client, book["id"])["status"] == "failed"
+    assert "plan bozuk" in client.get(f"/books/{book['id']}/preflight").get_data(as_text=True)
+    assert client.get("/books/yok/preflight").status_code == 404
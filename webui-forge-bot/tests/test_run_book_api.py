@@ -0,0 +1,94 @@
+# test_run_book_api.py
+# run_book_via_api uçtan uca: iki MockForge backend'i, CSV liste, geçici çıktı ve manifest klasörü.
+import csv, os
+
+import pytest
+from PIL import Image
+
+
+def read_roster(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return list(csv.reader(f))
+
+
+def test_saves_and_sayfa_columns_in_input_order(tmp_path, app_mod, mocks, make_book):
+    book = make_book(tmp_path)
+    saves = []
+    app_mod.run_book_via_api(book, log_path=str(tmp_path / "job.log"), backends=[m.url for m in mocks],
+                             progress_cb=lambda ev: saves.append(ev) if ev.get("event") == "save" else None)
+
+    expected = [(f"Çocuk{c} Test", p) for c in range(5) for p in range(1, 4)]
+    assert [(ev["child"], ev["page_index"]) for ev in saves] == expected
+    assert all(os.path.isfile(ev["image_path"]) for ev in saves)
+    assert all(m.stats["images"] > 0 for m in mocks)
+    assert sum(m.stats["images"] for m in mocks) == len(expected)
+
+    rows = read_roster(book["settings"]["excel_path"])
+    cols = [i for i, h in enumerate(rows[0]) if h.lstrip("'").startswith("@sayfa")]
+    assert [rows[0][i].lstrip("'") for i in cols] == ["@sayfa1", "@sayfa2", "@sayfa3"]
+    for c, row in enumerate(rows[1:]):
+        assert [os.path.basename(row[i]) for i in cols] == ["sayfa1.png", "sayfa2.png", "sayfa3.png"]
+        assert all(f"Çocuk{c} Test" in row[i] for i in cols)
+
+
+def test_second_run_renders_nothing(tmp_path, app_mod, mocks, make_book):
+    book = make_book(tmp_path, children=3, pages=2)
+    backends = [m.url for m in mocks]
+    app_mod.run_book_via_api(book, log_path=str(tmp_path / "a.log"), backends=backends)
+    first = sum(m.stats["images"] for m in mocks)
+    saves = []
+    app_mod.run_book_via_api(book, log_path=str(tmp_path / "b.log"), backends=backends,
+                             progress_cb=lambda ev: saves.append(ev) if ev.get("event") == "save" else None)
+    assert first == 6
+    assert sum(m.stats["images"] for m in mocks) == first
+    assert saves == []
+
+
+def test_interrupted_bootstrap_keeps_unscanned_outputs(tmp_path, app_mod, mocks, make_book):
+    # 0-9: üretilecek; 10-11: manifestten önce üretilmiş çıktılar (ilk çalıştırma onlara varmadan çöker)
+    book = make_book(tmp_path, children=12, pages=2)
+    out_root = book["settings"]["output_root"]
+    old = {}
+    for c in (10, 11):
+        d = os.path.join(out_root, "1A", f"Çocuk{c} Test")
+        os.makedirs(d)
+        for p in (1, 2):
+            path = os.path.join(d, f"sayfa{p}.png")
+            Image.new("RGB", (8, 8), (c, p, 0)).save(path)
+            with open(path, "rb") as f:
+                old[path] = f.read()
+    backends = [m.url for m in mocks]
+
+    def crash(ev):
+        if ev.get("event") == "save":
+            raise RuntimeError("iş yarıda kesildi")
+
+    with pytest.raises(RuntimeError):
+        app_mod.run_book_via_api(book, log_path=str(tmp_path / "a.log"), backends=backends, progress_cb=crash)
+    assert not app_mod.OutputManifest.for_book(book["id"]).bootstrapped
+
+    app_mod.run_book_via_api(book, log_path=str(tmp_path / "b.log"), backends=backends)
+    for path, data in old.items():
+        with open(path, "rb") as f:
+            assert f.read() == data
+    assert app_mod.OutputManifest.for_book(book["id"]).bootstrapped
+    assert sum(m.stats["images"] for m in mocks) == 20          # 10-11 hiç üretilmedi
+
+
+def test_result_cache_counts_across_backends(tmp_path, app_mod, mocks, make_book, monkeypatch):
+    from result_cache import ResultCache
+    cache = ResultCache(str(tmp_path / "results"))
+    monkeypatch.setattr(app_mod, "result_cache", lambda: cache)
+    backends = [m.url for m in mocks]
+    app_mod.run_book_via_api(make_book(tmp_path / "a", children=4, pages=3, book_id="a"),
+                             log_path=str(tmp_path / "a.log"), backends=backends)
+    rendered = sum(m.stats["images"] for m in mocks)
+    # aynı girdiler, başka çıktı klasörü: tüm sayfalar önbellekten, iki backend'in worker'larından sayılır
+    app_mod.run_book_via_api(make_book(tmp_path / "b", children=4, pages=3, book_id="b"),
+                             log_path=str(tmp_path / "b.log"), backends=backends)
+    assert rendered == 12 and sum(m.stats["images"] for m in mocks) == 12
+    assert cache.stats["stores"] == 12 and cache.stats["hits"] == 12
+    with open(tmp_path / "a.log", encoding="utf-8") as f:
+        assert "önbellekten 0 | yeni kayıt 12" in f.read()
+    with open(tmp_path / "b.log", encoding="utf-8") as f:
+        assert "önbellekten 12 | yeni kayıt 0" in f.read()